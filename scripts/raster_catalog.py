@@ -0,0 +1,169 @@
+# raster_catalog.py
+#
+# Persistent, header-only catalog of the yearly rasters DATA_PATH/<Country>/<Country>_<Year>.tif.
+#
+# For every file the catalog records what the pipeline needs to plan work without decoding a
+# single pixel: shape, band count, dtypes, nodata, transform, CRS, block layout, compression,
+# size, mtime and a quick checksum. It is stored as JSON (default DATA_PATH/raster_catalog.json)
+# and refreshed incrementally: a file is only re-opened when its size or mtime changed, new
+# files are added and deleted files dropped. Opening a GeoTIFF with rasterio reads the header /
+# IFD only, so a full refresh of a few hundred files takes well under a second and an
+# unchanged refresh is just a directory scan plus os.stat calls.
+#
+# The quick checksum is SHA-1 over the file size and its first and last 64 KiB (header, IFDs and
+# tail of the last block); --full_checksum hashes the whole file instead.
+#
+# Used by week6_build_tiles_all_years.py for year discovery, the reference grid (choose_tile_size
+# / make_tiles) and shape checks across years.
+#
+# Run (optional; the tiling script refreshes the catalog itself):
+#   python scripts/raster_catalog.py --data_path data/week_5_robustness_tif_images
+
+import os, re, json, hashlib, argparse, time
+
+CATALOG_NAME = "raster_catalog.json"
+CATALOG_VERSION = 1
+_YEAR_FILE = re.compile(r"^(?P<country>.+)_(?P<year>\d{4})\.tif$")
+_EDGE_BYTES = 64 * 1024
+
+
+def default_catalog_path(data_path: str) -> str:
+    return os.path.join(data_path, CATALOG_NAME)
+
+
+def quick_checksum(fp: str, size: int, full: bool = False) -> str:
+    h = hashlib.sha1(str(size).encode())
+    with open(fp, "rb") as fh:
+        if full or size <= 2 * _EDGE_BYTES:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                h.update(chunk)
+        else:
+            h.update(fh.read(_EDGE_BYTES))
+            fh.seek(-_EDGE_BYTES, os.SEEK_END)
+            h.update(fh.read(_EDGE_BYTES))
+    return ("full:" if full else "quick:") + h.hexdigest()
+
+
+def read_header(fp: str) -> dict:
+    """Everything the pipeline needs from a raster, read from its header only."""
+    import rasterio
+
+    with rasterio.open(fp) as src:
+        return {
+            "height": src.height,
+            "width": src.width,
+            "count": src.count,
+            "dtypes": list(src.dtypes),
+            "nodata": src.nodata,
+            "transform": list(src.transform)[:6],
+            "crs": src.crs.to_string() if src.crs else None,
+            "block_shapes": [list(b) for b in src.block_shapes],
+            "compression": src.compression.value if src.compression else None,
+        }
+
+
+def load_catalog(path: str) -> dict:
+    if os.path.exists(path):
+        with open(path) as fh:
+            cat = json.load(fh)
+        if cat.get("version") == CATALOG_VERSION:
+            return cat
+    return {"version": CATALOG_VERSION, "files": {}}
+
+
+def save_catalog(cat: dict, path: str):
+    # write-then-rename so an interrupted run never leaves a truncated catalog
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(cat, fh, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def scan(data_path: str, countries=None):
+    """Yield (relative path, country, year, os.stat_result) for every <Country>/<Country>_<Year>.tif."""
+    for entry in sorted(os.scandir(data_path), key=lambda e: e.name):
+        if not entry.is_dir() or (countries and entry.name not in countries):
+            continue
+        for f in os.scandir(entry.path):
+            m = _YEAR_FILE.match(f.name)
+            if m and m.group("country") == entry.name and f.is_file():
+                yield f"{entry.name}/{f.name}", entry.name, int(m.group("year")), f.stat()
+
+
+def refresh(data_path: str, path: str = None, countries=None, full_checksum: bool = False):
+    """
+    Bring the catalog in line with the files on disk; only new or changed files are opened.
+    Returns (catalog, {"added": n, "updated": n, "removed": n, "unchanged": n}).
+    """
+    path = path or default_catalog_path(data_path)
+    cat = load_catalog(path)
+    files = cat["files"]
+    stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+    seen = set()
+
+    for rel, country, year, st in scan(data_path, countries):
+        seen.add(rel)
+        old = files.get(rel)
+        if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+            stats["unchanged"] += 1
+            continue
+        fp = os.path.join(data_path, rel)
+        entry = {"country": country, "year": year, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                 "checksum": quick_checksum(fp, st.st_size, full=full_checksum)}
+        entry.update(read_header(fp))
+        files[rel] = entry
+        stats["updated" if old else "added"] += 1
+
+    # drop files that disappeared (only inside the countries that were scanned)
+    for rel in [r for r in files if r not in seen and (not countries or files[r]["country"] in countries)]:
+        del files[rel]
+        stats["removed"] += 1
+
+    if stats["added"] or stats["updated"] or stats["removed"] or not os.path.exists(path):
+        save_catalog(cat, path)
+    return cat, stats
+
+
+def entries(cat: dict, country: str) -> dict:
+    """{year: entry} for one country."""
+    return {e["year"]: e for e in cat["files"].values() if e["country"] == country}
+
+
+def catalog_years(cat: dict, country: str):
+    return sorted(entries(cat, country))
+
+
+def shape_mismatches(cat: dict, country: str, years, ref_year: int):
+    """[(year, (h, w))] for years whose shape differs from the reference year."""
+    ent = entries(cat, country)
+    ref = (ent[ref_year]["height"], ent[ref_year]["width"])
+    return [(y, (ent[y]["height"], ent[y]["width"])) for y in years
+            if y in ent and (ent[y]["height"], ent[y]["width"]) != ref]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data_path", required=True, help="Root folder containing <Country>/<Country>_<Year>.tif")
+    ap.add_argument("--catalog", default=None, help=f"Catalog file (default: <data_path>/{CATALOG_NAME})")
+    ap.add_argument("--countries", default="", help="Comma-separated subset (default: all folders)")
+    ap.add_argument("--full_checksum", action="store_true", help="Hash whole files instead of head + tail")
+    args = ap.parse_args()
+
+    countries = [c.strip() for c in args.countries.split(",") if c.strip()] or None
+    t0 = time.perf_counter()
+    cat, stats = refresh(args.data_path, args.catalog, countries, args.full_checksum)
+    ms = (time.perf_counter() - t0) * 1000
+
+    print(f"Catalog refreshed in {ms:.1f} ms: {stats}")
+    by_country = {}
+    for e in cat["files"].values():
+        by_country.setdefault(e["country"], []).append(e)
+    for country, ents in sorted(by_country.items()):
+        years = sorted(e["year"] for e in ents)
+        shapes = sorted({(e["height"], e["width"]) for e in ents})
+        print(f"  {country}: {len(years)} files {years[0]}-{years[-1]}, shapes={shapes}, "
+              f"bands={sorted({e['count'] for e in ents})}, blocks={ents[0]['block_shapes'][0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# scatter_density.py
+#
+# Density-raster replacement for the tile scatterplots (week7_final_scatterplots.py,
+# week6_visualize_baseline_regression.py).
+#
+# Instead of drawing one marker per tile, points are binned per region_type into a fixed
+# (bins x bins) 2-D histogram with a single np.bincount, blended into one RGBA image
+# (colour = count-weighted mix of the regime colours, opacity = log density) and drawn with
+# one imshow call. The global trend line is the closed-form OLS fit, so there is no
+# seaborn bootstrap. Drawing cost depends only on the raster size, not on the number of tiles.
+
+import numpy as np
+from matplotlib.colors import to_rgb
+from matplotlib.patches import Patch
+
+
+def ols_fit(x, y):
+    # Closed-form simple regression: returns (intercept, slope)
+    ok = np.isfinite(x) & np.isfinite(y)
+    x, y = np.asarray(x, dtype=float)[ok], np.asarray(y, dtype=float)[ok]
+    if x.size < 2:
+        return np.nan, np.nan
+    xm, ym = x.mean(), y.mean()
+    sxx = np.dot(x - xm, x - xm)
+    if sxx == 0:
+        return ym, 0.0
+    slope = np.dot(x - xm, y - ym) / sxx
+    return ym - slope * xm, slope
+
+
+def density_layers(x, y, groups, categories, bins=200, extent=None):
+    """
+    Per-category 2-D histograms in one pass.
+    Returns (H, extent) with H of shape (len(categories), bins, bins), rows = y bins.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    g = np.asarray(groups)
+    code = np.full(g.shape, -1, dtype=np.int64)
+    for k, cat in enumerate(categories):
+        code[g == cat] = k
+
+    ok = np.isfinite(x) & np.isfinite(y) & (code >= 0)
+    x, y, code = x[ok], y[ok], code[ok]
+
+    if extent is None:
+        if x.size == 0:
+            extent = (0.0, 1.0, 0.0, 1.0)
+        else:
+            pad_x = 0.02 * (np.ptp(x) or 1.0)
+            pad_y = 0.02 * (np.ptp(y) or 1.0)
+            extent = (x.min() - pad_x, x.max() + pad_x, y.min() - pad_y, y.max() + pad_y)
+    x0, x1, y0, y1 = extent
+
+    ix = np.clip(((x - x0) / (x1 - x0) * bins).astype(np.int64), 0, bins - 1)
+    iy = np.clip(((y - y0) / (y1 - y0) * bins).astype(np.int64), 0, bins - 1)
+    K = len(categories)
+    H = np.bincount((code * bins + iy) * bins + ix, minlength=K * bins * bins)
+    return H.reshape(K, bins, bins), extent
+
+
+def density_rgba(H, colors, gamma=0.5):
+    # Blend category colours by count, opacity grows with log(1 + total count)
+    rgb = np.array([to_rgb(c) for c in colors])             # (K, 3)
+    total = H.sum(axis=0).astype(float)                      # (by, bx)
+    img = np.zeros(total.shape + (4,))
+    nz = total > 0
+    if nz.any():
+        mix = np.tensordot(H, rgb, axes=([0], [0]))          # (by, bx, 3)
+        img[nz, :3] = mix[nz] / total[nz, None]
+        dens = np.log1p(total) / np.log1p(total.max())
+        img[..., 3] = np.where(nz, 0.25 + 0.75 * dens ** gamma, 0.0)
+    return img
+
+
+def draw_density_scatter(ax, x, y, groups, categories, palette, labels=None, bins=200):
+    """Draw the density raster on ax; returns legend handles (one Patch per category present)."""
+    H, extent = density_layers(x, y, groups, categories, bins=bins)
+    colors = [palette[c] for c in categories]
+    ax.imshow(density_rgba(H, colors), origin="lower", extent=extent, aspect="auto",
+              interpolation="nearest")
+    labels = labels or {}
+    present = H.reshape(len(categories), -1).sum(axis=1) > 0
+    return [Patch(facecolor=palette[c], label=labels.get(c, c))
+            for c, p in zip(categories, present) if p]
+
+
+def draw_ols_line(ax, x, y, **line_kws):
+    b0, b1 = ols_fit(x, y)
+    if not np.isfinite(b1):
+        return None
+    xs = np.array(ax.get_xlim())
+    (line,) = ax.plot(xs, b0 + b1 * xs, **line_kws)
+    ax.set_xlim(*xs)
+    return line
@@ -0,0 +1,194 @@
+# spatial_weights.py
+#
+# Sparse spatial weights on the tile grid + global Moran's I and local LISA statistics.
+#
+# Tiles come from make_tiles() (week6_build_tiles_all_years.py), so every tile sits on a
+# regular lattice: grid row = r0 // tile, grid col = c0 // tile, with one tile size per
+# country (the panel's tile_size column; for older panels the largest tile edge, since edge
+# tiles are clipped). Neighbours are found by shifting a
+# dense (grid rows x grid cols) index image by a fixed set of offsets, so building W is a
+# handful of array lookups instead of pairwise distances:
+#
+#   rook    4 edge neighbours
+#   queen   8 edge + corner neighbours
+#   band    all tiles whose centre is within `band` tile widths (distance-band weights)
+#
+# Weights are built once per country over every tile that appears in any year and cached
+# as scipy.sparse .npz files; a country-year uses the sub-matrix of its tiles, row-standardised.
+#
+# Inference is by permutation and fully vectorized:
+#   morans_i   all permutations as one (n x P) matrix, one sparse-dense product per chunk
+#   lisa       conditional randomization (same scheme as PySAL's crand: one random draw of
+#              neighbour slots per permutation, shared by all tiles), chunked over tiles
+
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# LISA quadrant codes (PySAL convention)
+QUADRANTS = {1: "HH", 2: "LH", 3: "LL", 4: "HL"}
+
+
+def grid_coords(tiles: pd.DataFrame, tile_size: int = None):
+    """
+    (grid row, grid col, tile size) for tiles with r0/r1/c0/c1 columns from one country.
+    tile_size: explicit size (e.g. choose_tile_size(h, w, country) of the reference raster), else
+    the panel's tile_size column, else the largest tile edge over both axes -- only exact when
+    some surviving tile is full-sized on at least one axis.
+    """
+    if not tile_size and "tile_size" in tiles:
+        tile_size = int(tiles["tile_size"].max())
+    tile_size = tile_size or int(max((tiles["r1"] - tiles["r0"]).max(), (tiles["c1"] - tiles["c0"]).max()))
+    gr = tiles["r0"].to_numpy(dtype=np.int64) // tile_size
+    gc = tiles["c0"].to_numpy(dtype=np.int64) // tile_size
+    return gr, gc, tile_size
+
+
+def grid_offsets(kind: str = "queen", band: float = 1.5):
+    if kind == "rook":
+        return [(-1, 0), (1, 0), (0, -1), (0, 1)]
+    if kind == "queen":
+        return [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if (dr, dc) != (0, 0)]
+    if kind == "band":
+        k = int(np.floor(band))
+        return [(dr, dc) for dr in range(-k, k + 1) for dc in range(-k, k + 1)
+                if (dr, dc) != (0, 0) and dr * dr + dc * dc <= band * band]
+    raise ValueError("kind must be 'rook', 'queen' or 'band'")
+
+
+def grid_weights(gr, gc, kind: str = "queen", band: float = 1.5) -> sparse.csr_matrix:
+    """Binary (n x n) CSR contiguity / distance-band weights for tiles at (gr, gc)."""
+    n = len(gr)
+    H, W = int(gr.max()) + 1, int(gc.max()) + 1
+    index = np.full((H, W), -1, dtype=np.int64)
+    index[gr, gc] = np.arange(n)
+
+    rows, cols = [], []
+    for dr, dc in grid_offsets(kind, band):
+        r, c = gr + dr, gc + dc
+        inside = (r >= 0) & (r < H) & (c >= 0) & (c < W)
+        j = np.full(n, -1, dtype=np.int64)
+        j[inside] = index[r[inside], c[inside]]
+        hit = j >= 0
+        rows.append(np.flatnonzero(hit))
+        cols.append(j[hit])
+
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+
+
+def row_standardize(Wb: sparse.spmatrix) -> sparse.csr_matrix:
+    # Islands (no neighbours) keep an all-zero row
+    Wb = sparse.csr_matrix(Wb, dtype=float)
+    deg = np.asarray(Wb.sum(axis=1)).ravel()
+    inv = np.divide(1.0, deg, out=np.zeros_like(deg), where=deg > 0)
+    return sparse.diags(inv) @ Wb
+
+
+def country_weights(tiles: pd.DataFrame, kind: str = "queen", band: float = 1.5, cache_dir: str = None,
+                    country: str = None):
+    """
+    Binary weights over every distinct tile_id of one country (all years).
+    Returns (W, tile_ids); cached as <cache_dir>/W_<country>_<kind>.npz + _ids.npy.
+    """
+    uniq = tiles.drop_duplicates("tile_id").sort_values("tile_id")
+    tile_ids = uniq["tile_id"].to_numpy(dtype=np.int64)
+
+    name = f"W_{country}_{kind}" + (f"{band:g}" if kind == "band" else "")
+    if cache_dir and country:
+        w_fp = os.path.join(cache_dir, name + ".npz")
+        ids_fp = os.path.join(cache_dir, name + "_ids.npy")
+        if os.path.exists(w_fp) and os.path.exists(ids_fp):
+            cached_ids = np.load(ids_fp)
+            if np.array_equal(cached_ids, tile_ids):
+                return sparse.load_npz(w_fp).tocsr(), tile_ids
+
+    gr, gc, _ = grid_coords(uniq)
+    Wb = grid_weights(gr, gc, kind=kind, band=band)
+
+    if cache_dir and country:
+        os.makedirs(cache_dir, exist_ok=True)
+        sparse.save_npz(w_fp, Wb)
+        np.save(ids_fp, tile_ids)
+    return Wb, tile_ids
+
+
+def subset_weights(Wb: sparse.csr_matrix, all_ids, tile_ids) -> sparse.csr_matrix:
+    """Row-standardised weights for the tiles present in one country-year (in tile_ids order)."""
+    pos = np.searchsorted(all_ids, tile_ids)
+    return row_standardize(Wb[pos][:, pos])
+
+
+def _p_sim(observed, sims):
+    # Folded pseudo p-value as in PySAL: (extreme-side count + 1) / (P + 1)
+    P = sims.shape[-1]
+    larger = (sims >= observed[..., None]).sum(axis=-1)
+    larger = np.where(P - larger < larger, P - larger, larger)
+    return (larger + 1.0) / (P + 1.0)
+
+
+def morans_i(y, W: sparse.csr_matrix, permutations: int = 999, seed: int = 0, chunk_bytes: float = 64e6) -> dict:
+    """Global Moran's I of y under row-standardised W, with permutation inference."""
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    z = y - y.mean()
+    zz = z @ z
+    s0 = W.sum()
+    out = {"n": n, "I": np.nan, "EI": -1.0 / (n - 1) if n > 1 else np.nan,
+           "I_sim_mean": np.nan, "z_sim": np.nan, "p_sim": np.nan}
+    if s0 == 0 or zz == 0:
+        return out                      # no neighbour pairs (all islands) or constant y: undefined
+    scale = n / s0
+    I = scale * (z @ (W @ z)) / zz
+    out["I"] = I
+
+    if permutations:
+        rng = np.random.default_rng(seed)
+        sims = np.empty(permutations)
+        step = max(1, int(chunk_bytes // (8 * n)))
+        for a in range(0, permutations, step):
+            b = min(permutations, a + step)
+            Z = rng.permuted(np.broadcast_to(z, (b - a, n)), axis=1).T       # (n, p)
+            sims[a:b] = scale * np.einsum("ij,ij->j", Z, W @ Z) / zz
+        out.update(I_sim_mean=sims.mean(), z_sim=(I - sims.mean()) / sims.std(),
+                   p_sim=float(_p_sim(np.asarray(I), sims)))
+    return out
+
+
+def lisa(y, W: sparse.csr_matrix, permutations: int = 999, seed: int = 0, chunk_bytes: float = 64e6) -> pd.DataFrame:
+    """
+    Local Moran's I_i for every observation with conditional-randomization p-values.
+    Returns a frame with Is, p_sim and quadrant (1=HH, 2=LH, 3=LL, 4=HL).
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    z = y - y.mean()
+    m2 = (z @ z) / n
+    lag = W @ z
+    Is = z * lag / m2
+
+    quadrant = np.where(z > 0, np.where(lag > 0, 1, 4), np.where(lag > 0, 2, 3))
+    p = np.full(n, np.nan)
+
+    W = sparse.csr_matrix(W)
+    k = np.diff(W.indptr)
+    kmax = int(k.max()) if n else 0
+    if permutations and kmax > 0 and n > kmax:
+        rng = np.random.default_rng(seed)
+        # One random set of neighbour slots per permutation, drawn from the n-1 other tiles
+        rids = rng.permuted(np.broadcast_to(np.arange(n - 1), (permutations, n - 1)), axis=1)[:, :kmax]
+
+        # Each row's weights packed into (n, kmax), zero-padded
+        wpad = np.zeros((n, kmax))
+        slot = np.arange(len(W.indices)) - np.repeat(W.indptr[:-1], k)
+        wpad[np.repeat(np.arange(n), k), slot] = W.data
+
+        step = max(1, int(chunk_bytes // (8 * permutations * kmax)))
+        for a in range(0, n, step):
+            i = np.arange(a, min(n, a + step))
+            idx = rids[None, :, :] + (rids[None, :, :] >= i[:, None, None])   # skip tile i itself
+            lag_sim = np.einsum("ipk,ik->ip", z[idx], wpad[i])
+            p[i] = _p_sim(Is[i], z[i, None] * lag_sim / m2)
+
+    return pd.DataFrame({"Is": Is, "p_sim": p, "quadrant": quadrant})
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# week4_anomaly_detector.py
+#
+# Outage / anomaly detection on the monthly VIIRS panel: flags sudden radiance drops per series,
+# instead of only labelling whole countries by future_volatility.
+#
+# Robust seasonal baseline per series and month-of-year, over the --baseline window:
+#
+#   median[s, moy]   median of log1p(mean radiance)
+#   mad[s, moy]      1.4826 * median absolute deviation (floored at --mad_floor)
+#
+# and every month is scored as z = (log1p(mean) - median) / mad. A month is an OUTAGE when
+# z <= -z_thresh AND radiance fell by at least --min_drop against the baseline. Months with
+# cloudFree < --min_cloudfree are neither used for baselines nor scored (status low_coverage):
+# with few cloud-free nights the monthly composite is too noisy to call a drop.
+#
+# All series are processed at once on the dense (series x month) arrays of
+# week4_timeseries_features.load_dense(); the only loop is over the 12 months of the year.
+#
+# --incremental: baselines are cached in --cache_dir together with the last scored month;
+# the next run scores only months after it against the cached baselines (series not in the
+# cache get baselines computed from the current file) and appends to the events CSV.
+#
+# Outputs (written to --out_dir):
+#   anomaly_events.csv     <series cols>, year, month, logmean, baseline_median, baseline_mad, z,
+#                          cloudFree, status (outage / low_coverage)
+#   anomaly_summary.csv    <series cols>, n_outage_months, n_outage_events, longest_outage,
+#                          worst_z, worst_year, worst_month, n_low_coverage
+#   cache/anomaly_baselines.npy / .json   (median, mad) per series and month-of-year, cache key
+#
+# Run:
+#   python scripts/week4_anomaly_detector.py \
+#       --input data/processed/viirs_monthly_country_2012_2024.csv \
+#       --out_dir figures/week4_outputs/anomalies [--incremental] [--series_cols country,shapeName]
+
+import os, argparse, json, time, warnings
+import numpy as np
+import pandas as pd
+
+from week4_timeseries_features import load_dense, parse_month
+
+MAD_SCALE = 1.4826                  # MAD -> standard deviation under normality
+STATUS = ["ok", "outage", "low_coverage", "missing"]
+
+
+def seasonal_baseline(y, months, usable, mad_floor: float = 0.02):
+    """(median, mad), each (S, 12), of y over the usable months per month-of-year; NaN if none."""
+    S = y.shape[0]
+    med = np.full((S, 12), np.nan)
+    mad = np.full((S, 12), np.nan)
+    moy = months % 12
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)      # series without data for a month -> NaN
+        for m in range(12):
+            v = np.where(usable[:, moy == m], y[:, moy == m], np.nan)
+            if v.shape[1] == 0:
+                continue
+            med[:, m] = np.nanmedian(v, axis=1)
+            mad[:, m] = MAD_SCALE * np.nanmedian(np.abs(v - med[:, m, None]), axis=1)
+    return med, np.maximum(mad, mad_floor)
+
+
+def score_months(y, months, med, mad, valid, covered, z_thresh: float = 3.5, min_drop: float = 0.3):
+    """(z, status) per (series, month); status indexes STATUS."""
+    moy = months % 12
+    base, scale = med[:, moy], mad[:, moy]
+    z = (y - base) / scale
+    outage = (z <= -z_thresh) & (y - base <= np.log1p(-min_drop))
+    status = np.full(y.shape, STATUS.index("missing"), dtype=np.int8)
+    status[valid] = STATUS.index("ok")
+    status[valid & outage] = STATUS.index("outage")
+    status[valid & ~covered] = STATUS.index("low_coverage")
+    z[~(valid & covered)] = np.nan
+    return z, status
+
+
+def load_baselines(cache_dir: str, key: dict):
+    """(series keys, median, mad, scored_through) from the cache when its key matches, else None."""
+    fp = os.path.join(cache_dir, "anomaly_baselines.npy")
+    meta_fp = os.path.join(cache_dir, "anomaly_baselines.json")
+    if not (os.path.exists(fp) and os.path.exists(meta_fp)):
+        return None
+    with open(meta_fp) as fh:
+        meta = json.load(fh)
+    if meta["key"] != key:
+        print("[WARN] Baseline cache was built with different settings; recomputing")
+        return None
+    arr = np.load(fp)
+    return [tuple(s) for s in meta["series"]], arr[0], arr[1], meta["scored_through"]
+
+
+def save_baselines(cache_dir: str, key: dict, series, med, mad, scored_through: int):
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(os.path.join(cache_dir, "anomaly_baselines.npy"), np.stack([med, mad]))
+    with open(os.path.join(cache_dir, "anomaly_baselines.json"), "w") as fh:
+        json.dump({"key": key, "scored_through": int(scored_through),
+                   "series": [list(s) for s in series]}, fh)
+
+
+def summarize_events(events: pd.DataFrame, series_cols) -> pd.DataFrame:
+    """Per-series outage counts, events (runs of consecutive outage months) and the worst month."""
+    out = events[events["status"] == "outage"].copy()
+    out["t"] = out["year"] * 12 + out["month"] - 1
+    out = out.sort_values(series_cols + ["t"])
+    new_run = (out.groupby(series_cols)["t"].diff() != 1).astype(int)
+    out["run"] = new_run.groupby([out[c] for c in series_cols]).cumsum()
+    run_len = out.groupby(series_cols + ["run"]).size().groupby(level=list(range(len(series_cols)))).max()
+
+    worst = out.loc[out.groupby(series_cols)["z"].idxmin()].set_index(series_cols)
+    summary = pd.DataFrame({
+        "n_outage_months": out.groupby(series_cols).size(),
+        "n_outage_events": out.groupby(series_cols)["run"].max(),
+        "longest_outage": run_len,
+        "worst_z": worst["z"],
+        "worst_year": worst["year"],
+        "worst_month": worst["month"],
+    })
+    low = events[events["status"] == "low_coverage"].groupby(series_cols).size().rename("n_low_coverage")
+    counts = ["n_outage_months", "n_outage_events", "longest_outage", "n_low_coverage"]
+    summary = summary.join(low, how="outer")
+    summary[counts] = summary[counts].fillna(0).astype(int)
+    summary[["worst_year", "worst_month"]] = summary[["worst_year", "worst_month"]].astype("Int64")
+    return summary.reset_index()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input", default=os.path.join("data", "processed", "viirs_monthly_country_2012_2024.csv"))
+    ap.add_argument("--out_dir", default=os.path.join("figures", "week4_outputs", "anomalies"))
+    ap.add_argument("--cache_dir", default=None, help="Baseline cache (default <out_dir>/cache)")
+    ap.add_argument("--series_cols", default="country", help="Comma-separated series key columns")
+    ap.add_argument("--baseline", default="2012-01:2018-12", help="Baseline window YYYY-MM:YYYY-MM")
+    ap.add_argument("--score_from", default=None, help="First month to score, YYYY-MM (default: all months)")
+    ap.add_argument("--z_thresh", type=float, default=3.5, help="Robust z below -z_thresh is a drop")
+    ap.add_argument("--min_drop", type=float, default=0.3, help="Minimum radiance drop vs baseline, as a fraction")
+    ap.add_argument("--min_cloudfree", type=float, default=2.0, help="Months with fewer cloud-free nights are skipped")
+    ap.add_argument("--mad_floor", type=float, default=0.02, help="Lower bound on the baseline MAD (log units)")
+    ap.add_argument("--incremental", action="store_true", help="Score only months after the cached last scored month")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    os.makedirs(args.out_dir, exist_ok=True)
+    cache_dir = args.cache_dir or os.path.join(args.out_dir, "cache")
+    events_fp = os.path.join(args.out_dir, "anomaly_events.csv")
+    series_cols = [c.strip() for c in args.series_cols.split(",") if c.strip()]
+
+    series, months, arrays = load_dense(args.input, series_cols)
+    keys = list(series.itertuples(index=False, name=None))
+    y = np.log1p(arrays["mean"])
+    valid = arrays["row"] & np.isfinite(y)
+    covered = ~(arrays["cloud"] < args.min_cloudfree)             # NaN coverage -> usable
+    b0, b1 = (parse_month(s) for s in args.baseline.split(":"))
+    in_base = (months >= b0) & (months <= b1)
+    key = {"series_cols": series_cols, "baseline": args.baseline, "min_cloudfree": args.min_cloudfree,
+           "mad_floor": args.mad_floor}
+
+    def baselines_for(rows):
+        return seasonal_baseline(y[rows][:, in_base], months[in_base], (valid & covered)[rows][:, in_base],
+                                 args.mad_floor)
+
+    cached = load_baselines(cache_dir, key) if args.incremental else None
+    if cached is not None:
+        c_series, c_med, c_mad, scored_through = cached
+        pos = {s: i for i, s in enumerate(c_series)}
+        idx = np.array([pos.get(s, -1) for s in keys], dtype=np.int64)
+        med, mad = c_med[np.maximum(idx, 0)], c_mad[np.maximum(idx, 0)]
+        new = np.flatnonzero(idx < 0)
+        if len(new):
+            med[new], mad[new] = baselines_for(new)
+        start = scored_through + 1
+        print(f"Cached baselines: {len(keys) - len(new):,} series, {len(new):,} new; scoring months after "
+              f"{scored_through // 12}-{scored_through % 12 + 1:02d}")
+        all_series = c_series + [keys[i] for i in new]
+        all_med, all_mad = np.vstack([c_med, med[new]]), np.vstack([c_mad, mad[new]])
+    else:
+        med, mad = baselines_for(np.arange(len(keys)))
+        start = parse_month(args.score_from) if args.score_from else int(months.min())
+        all_series, all_med, all_mad = keys, med, mad
+
+    sel = months >= start
+    z, status = score_months(y[:, sel], months[sel], med, mad, valid[:, sel], covered[:, sel],
+                             args.z_thresh, args.min_drop)
+    s_idx, t_idx = np.nonzero((status == STATUS.index("outage")) | (status == STATUS.index("low_coverage")))
+    m_sel = months[sel][t_idx]
+    events = series.iloc[s_idx].reset_index(drop=True)
+    events = events.assign(
+        year=m_sel // 12, month=m_sel % 12 + 1,
+        logmean=y[:, sel][s_idx, t_idx],
+        baseline_median=med[s_idx, m_sel % 12], baseline_mad=mad[s_idx, m_sel % 12],
+        z=z[s_idx, t_idx], cloudFree=arrays["cloud"][:, sel][s_idx, t_idx],
+        status=np.array(STATUS)[status[s_idx, t_idx]],
+    ).sort_values(series_cols + ["year", "month"], kind="stable")
+
+    append = cached is not None and os.path.exists(events_fp)
+    events.to_csv(events_fp, mode="a" if append else "w", header=not append, index=False)
+    if sel.any():
+        save_baselines(cache_dir, key, all_series, all_med, all_mad, int(months[sel].max()))
+
+    all_events = pd.read_csv(events_fp)
+    summary = summarize_events(all_events, series_cols)
+    summary.to_csv(os.path.join(args.out_dir, "anomaly_summary.csv"), index=False)
+
+    n_out = int((events["status"] == "outage").sum())
+    print(f"{len(keys):,} series, {int(sel.sum())} months scored: {n_out} outage months, "
+          f"{len(events) - n_out} low-coverage months ({time.perf_counter() - t0:.2f}s)")
+    if n_out:
+        print(summary[summary["n_outage_months"] > 0].sort_values("worst_z").head(10).to_string(index=False))
+    print("Saved:", events_fp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# week4_experiment_grid.py
+#
+# Parallel, cached experiment grid for the Week 4 energy-insecurity classifier.
+#
+# The notebook loops over feature sets A-D x {LR, RF} with train_eval and keeps fitted models
+# and confusion matrices in memory. This script runs the full grid
+#
+#   feature set x model x seed x hyperparameters
+#
+# in a process pool:
+#   * preprocessing (train/test split, median imputer, StandardScaler) is fitted ONCE per
+#     (feature set, seed) and cached as .npz under <out_dir>/cache/; every model/hyperparameter
+#     cell for that split reuses the cached arrays
+#   * each finished cell is appended to <out_dir>/grid_results.csv immediately (metrics and
+#     confusion-matrix counts only, no pickled models), keyed by a stable cell_id, so a rerun
+#     (or a run with a larger grid) only fits the cells that are not in the file yet
+#
+# Input: the country-year table from week4_stream_features.py (unstable_next label); WDI
+# columns are used for feature set D when present, as in the notebook.
+#
+# Run:
+#   python scripts/week4_experiment_grid.py \
+#       --features data/processed/ml_country_year_features_label.csv \
+#       --out_dir data/processed/week4_grid --seeds 0-24
+
+import os, argparse, hashlib, itertools, json, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+LABEL = "unstable_next"
+
+# Feature sets for controlled experiments (same definitions as the Week 4 notebook)
+FEATURE_SET_A = ["yearly_mean_mean_rad", "yearly_std_mean_rad"]
+FEATURE_SET_B = FEATURE_SET_A + ["yearly_range_mean_rad", "yearly_min_mean_rad", "yearly_max_mean_rad"]
+FEATURE_SET_C = FEATURE_SET_B + ["yearly_mean_spatial_sd", "yearly_std_spatial_sd"]
+INFRA_COLS = ["elec_access_pct", "td_losses_pct", "elec_kwh_pc", "renewable_share_pct"]
+
+# Hyperparameter grid per model; every combination is one cell
+PARAM_GRID = {
+    "LR": {"C": [0.01, 0.1, 1.0, 10.0], "class_weight": [None, "balanced"]},
+    "RF": {"n_estimators": [300], "max_depth": [None, 3, 6], "min_samples_leaf": [1, 5]},
+}
+
+RESULT_COLS = [
+    "cell_id", "feature_set", "model", "seed", "params", "test_size", "data",
+    "accuracy", "f1_stable", "f1_unstable", "precision_unstable", "recall_unstable",
+    "tn", "fp", "fn", "tp", "fit_seconds",
+]
+# Hex ids/digests can look numeric ("1234567890", "123e4567") -- always read them as text
+ID_DTYPES = {"cell_id": str, "data": str}
+
+
+def feature_sets(df: pd.DataFrame) -> dict:
+    sets = {"A_temporal": FEATURE_SET_A, "B_temporal_plus_extremes": FEATURE_SET_B}
+    if all(c in df.columns for c in FEATURE_SET_C):
+        sets["C_plus_spatial"] = FEATURE_SET_C
+    if all(c in df.columns for c in INFRA_COLS):
+        base = sets.get("C_plus_spatial", FEATURE_SET_B)
+        sets["D_plus_infrastructure"] = base + INFRA_COLS
+    return sets
+
+
+def data_digest(df: pd.DataFrame, cols) -> str:
+    # Fingerprint of the modelling columns; a changed input file invalidates cache + results
+    arr = np.ascontiguousarray(df[list(cols) + [LABEL]].to_numpy(dtype=float))
+    return hashlib.sha1(arr.tobytes()).hexdigest()[:10]
+
+
+def expand_grid(sets, models, seeds, df, test_size=0.3):
+    digests = {fs: data_digest(df, cols) for fs, cols in sets.items()}
+    cells = []
+    for fs, model, seed in itertools.product(sets, models, seeds):
+        grid = PARAM_GRID[model]
+        keys = sorted(grid)
+        for values in itertools.product(*(grid[k] for k in keys)):
+            params = dict(zip(keys, values))
+            cells.append({"feature_set": fs, "model": model, "seed": int(seed), "params": params,
+                          "test_size": float(test_size), "data": digests[fs]})
+    for cell in cells:
+        cell["cell_id"] = cell_id(cell)
+    return cells
+
+
+def cell_id(cell) -> str:
+    key = json.dumps([cell["feature_set"], cell["model"], cell["seed"], cell["params"], cell["test_size"],
+                      cell["data"]], sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+# ============================================================================
+# Preprocessing cache (one split + imputer + scaler per feature set and seed)
+# ============================================================================
+
+def cache_path(cache_dir, fs, seed, digest, test_size):
+    return os.path.join(cache_dir, f"prep_{fs}_seed{seed}_test{test_size:g}_{digest}.npz")
+
+
+def prepare_split(df, cols, seed, test_size=0.3):
+    from sklearn.model_selection import train_test_split
+    from sklearn.impute import SimpleImputer
+    from sklearn.preprocessing import StandardScaler
+
+    X = df[cols].to_numpy(dtype=float)
+    y = df[LABEL].to_numpy(dtype=int)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=test_size, random_state=seed, stratify=y
+    )
+    imp = SimpleImputer(strategy="median").fit(X_train)
+    X_train_imp, X_test_imp = imp.transform(X_train), imp.transform(X_test)
+    sc = StandardScaler().fit(X_train_imp)
+    return {
+        "X_train_imp": X_train_imp, "X_test_imp": X_test_imp,
+        "X_train_scaled": sc.transform(X_train_imp), "X_test_scaled": sc.transform(X_test_imp),
+        "y_train": y_train, "y_test": y_test,
+    }
+
+
+def ensure_cache(df, sets, seeds, cache_dir, test_size=0.3):
+    os.makedirs(cache_dir, exist_ok=True)
+    built = 0
+    for fs, cols in sets.items():
+        digest = data_digest(df, cols)
+        for seed in seeds:
+            path = cache_path(cache_dir, fs, seed, digest, test_size)
+            if os.path.exists(path):
+                continue
+            np.savez(path, **prepare_split(df, cols, seed, test_size=test_size))
+            built += 1
+    return built
+
+
+# ============================================================================
+# Worker
+# ============================================================================
+
+def make_model(name, params, seed):
+    if name == "LR":
+        from sklearn.linear_model import LogisticRegression
+        return LogisticRegression(max_iter=2000, random_state=seed, **params)
+    if name == "RF":
+        from sklearn.ensemble import RandomForestClassifier
+        # one core per cell; parallelism comes from the process pool
+        return RandomForestClassifier(random_state=seed, n_jobs=1, **params)
+    raise ValueError("model must be 'LR' or 'RF'")
+
+
+def run_cell(cell, cache_dir):
+    from sklearn.metrics import accuracy_score, confusion_matrix, precision_recall_fscore_support
+
+    t0 = time.perf_counter()
+    with np.load(cache_path(cache_dir, cell["feature_set"], cell["seed"], cell["data"], cell["test_size"])) as z:
+        # LR uses the scaled features, RF the imputed ones (same pipelines as train_eval)
+        suffix = "scaled" if cell["model"] == "LR" else "imp"
+        X_train, X_test = z[f"X_train_{suffix}"], z[f"X_test_{suffix}"]
+        y_train, y_test = z["y_train"], z["y_test"]
+
+    clf = make_model(cell["model"], cell["params"], cell["seed"])
+    clf.fit(X_train, y_train)
+    y_pred = clf.predict(X_test)
+
+    prec, rec, f1, _ = precision_recall_fscore_support(y_test, y_pred, labels=[0, 1], zero_division=0)
+    tn, fp, fn, tp = confusion_matrix(y_test, y_pred, labels=[0, 1]).ravel()
+    return {
+        "cell_id": cell["cell_id"],
+        "feature_set": cell["feature_set"],
+        "model": cell["model"],
+        "seed": cell["seed"],
+        "params": json.dumps(cell["params"], sort_keys=True),
+        "test_size": cell["test_size"],
+        "data": cell["data"],
+        "accuracy": accuracy_score(y_test, y_pred),
+        "f1_stable": f1[0],
+        "f1_unstable": f1[1],
+        "precision_unstable": prec[1],
+        "recall_unstable": rec[1],
+        "tn": int(tn), "fp": int(fp), "fn": int(fn), "tp": int(tp),
+        "fit_seconds": time.perf_counter() - t0,
+    }
+
+
+# ============================================================================
+# Driver
+# ============================================================================
+
+def completed_cells(results_path):
+    if not os.path.exists(results_path):
+        return set()
+    header = list(pd.read_csv(results_path, nrows=0).columns)
+    if header != RESULT_COLS:
+        # Written by an older version of this script: appending would misalign the columns
+        legacy = results_path[:-4] + ".legacy.csv"
+        os.replace(results_path, legacy)
+        print(f"[WARN] {results_path} has an outdated header; moved to {legacy}, refitting the grid")
+        return set()
+    return set(pd.read_csv(results_path, usecols=["cell_id"], dtype=ID_DTYPES)["cell_id"])
+
+
+def run_grid(cells, cache_dir, results_path, workers=None):
+    done = completed_cells(results_path)
+    todo = [c for c in cells if c["cell_id"] not in done]
+    print(f"Grid cells: {len(cells)} total, {len(cells) - len(todo)} cached, {len(todo)} to fit")
+    if not todo:
+        return 0
+
+    write_header = not os.path.exists(results_path)
+    n_ok = 0
+    with open(results_path, "a", newline="") as fh, \
+            ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(run_cell, c, cache_dir): c for c in todo}
+        for fut in as_completed(futures):
+            cell = futures[fut]
+            try:
+                row = fut.result()
+            except Exception as e:
+                print(f"  [FAIL] {cell['feature_set']} {cell['model']} seed={cell['seed']} {cell['params']}: {e}")
+                continue
+            # Persist each cell as soon as it finishes so an interrupted run loses nothing
+            pd.DataFrame([row], columns=RESULT_COLS).to_csv(fh, header=write_header, index=False)
+            fh.flush()
+            write_header = False
+            n_ok += 1
+            if n_ok % 50 == 0:
+                print(f"  {n_ok}/{len(todo)} cells done")
+    return n_ok
+
+
+def summarize(results_path, cells):
+    # Only rows for the current data version and split: older inputs / --test_size stay in the
+    # results file but must not be averaged in
+    res = pd.read_csv(results_path, dtype=ID_DTYPES)
+    current = {(c["feature_set"], c["data"], c["test_size"]) for c in cells}
+    keep = [k in current for k in zip(res["feature_set"], res["data"], res["test_size"])]
+    res = res[keep]
+    return (
+        res.groupby(["feature_set", "model", "params"])
+           .agg(n_seeds=("seed", "nunique"),
+                accuracy=("accuracy", "mean"),
+                f1_unstable=("f1_unstable", "mean"),
+                f1_unstable_sd=("f1_unstable", "std"))
+           .sort_values("f1_unstable", ascending=False)
+           .reset_index()
+    )
+
+
+def parse_seeds(text):
+    seeds = []
+    for part in text.split(","):
+        part = part.strip()
+        if "-" in part:
+            a, b = part.split("-")
+            seeds.extend(range(int(a), int(b) + 1))
+        elif part:
+            seeds.append(int(part))
+    return sorted(set(seeds))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--features", default=os.path.join("data", "processed", "ml_country_year_features_label.csv"))
+    ap.add_argument("--out_dir", default=os.path.join("data", "processed", "week4_grid"))
+    ap.add_argument("--models", default="LR,RF")
+    ap.add_argument("--seeds", default="42", help="e.g. '42' or '0-24' or '1,2,3'")
+    ap.add_argument("--test_size", type=float, default=0.3)
+    ap.add_argument("--workers", type=int, default=None, help="Process pool size (default: all cores)")
+    args = ap.parse_args()
+
+    df = pd.read_csv(args.features)
+    df = df.dropna(subset=[LABEL])
+    sets = feature_sets(df)
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    seeds = parse_seeds(args.seeds)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    cache_dir = os.path.join(args.out_dir, "cache")
+    results_path = os.path.join(args.out_dir, "grid_results.csv")
+
+    built = ensure_cache(df, sets, seeds, cache_dir, test_size=args.test_size)
+    print(f"Feature sets: {list(sets)} | preprocessing cache: {built} new split(s)")
+
+    cells = expand_grid(sets, models, seeds, df, test_size=args.test_size)
+    t0 = time.perf_counter()
+    n = run_grid(cells, cache_dir, results_path, workers=args.workers)
+    print(f"Fitted {n} cells in {time.perf_counter() - t0:.1f}s -> {results_path}")
+
+    summary = summarize(results_path, cells)
+    summary.to_csv(os.path.join(args.out_dir, "grid_summary.csv"), index=False)
+    print("\nTop configurations by mean F1 (unstable):")
+    print(summary.head(10).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
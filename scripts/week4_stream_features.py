@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# week4_stream_features.py
+#
+# Streaming version of the Week 4 feature/label pipeline
+# (notebooks/week4_submission_pipeline_updated.ipynb):
+#
+#   monthly VIIRS rows  ->  country-year features  ->  next-year instability label
+#
+# The notebook loads the whole monthly CSV, maps columns with pick_col, keeps country-years
+# with >= 10 distinct months (groupby + merge), aggregates to country-year and shifts
+# yearly_std_mean_rad by one year. Here the monthly file is read in typed chunks and each
+# chunk is folded into running per-(iso3, country, year) aggregates:
+#
+#   n, sum, sum of squares, min, max          -> yearly mean / std / min / max / range
+#   the same for the spatial std column       -> yearly_mean_spatial_sd / yearly_std_spatial_sd
+#   12 month-presence flags                   -> n_months (distinct months, as in the notebook)
+#
+# so memory depends on the number of country-years, not on the number of monthly rows,
+# and admin-1 / admin-2 monthly series (100x more rows) stream through the same way: when the
+# input has a shapeName column it joins the key, giving one row per (unit, year). Input with
+# more than one row per key and month is refused instead of being merged silently.
+#
+# Output:
+#   <out>                      country-year features + next_year_std_mean_rad + unstable_next
+#
+# Run:
+#   python scripts/week4_stream_features.py \
+#       --input data/processed/viirs_monthly_country_2012_2024.csv \
+#       --out data/processed/ml_country_year_features_label.csv
+
+import os, argparse
+import numpy as np
+import pandas as pd
+
+# Same candidate lists as pick_col in the Week 4 notebook
+COLUMN_CANDIDATES = {
+    "country": ["country", "ADM0_NAME", "country_na", "name"],
+    "iso3": ["iso3", "shapeGroup", "ADM0_CODE", "country_co", "ISO3", "iso"],
+    "year": ["year", "Year"],
+    "month": ["month", "Month"],
+    "mean_rad_m": ["mean", "mean_rad", "avg_rad_mean", "mean_rad_m", "avg_rad"],
+    "spatial_sd_m": ["std", "stdDev", "sd_rad", "sd_rad_m", "avg_rad_std", "stdev"],
+}
+KEYS = ["iso3", "country", "year"]
+SERIES_KEY = "shapeName"            # admin-1 / admin-2 unit; joins the key when present
+MONTH_COLS = [f"m{m:02d}" for m in range(1, 13)]
+
+
+def pick_col(columns, candidates):
+    for c in candidates:
+        if c in columns:
+            return c
+    return None
+
+
+def group_keys(columns) -> list:
+    """KEYS, plus the subnational unit before year when the data has one."""
+    return ["iso3", "country", SERIES_KEY, "year"] if SERIES_KEY in columns else KEYS
+
+
+def map_columns(path: str) -> dict:
+    # Read the header only and map source columns -> standard names
+    header = pd.read_csv(path, nrows=0).columns
+    mapping = {}
+    for std_name, candidates in COLUMN_CANDIDATES.items():
+        src = pick_col(header, candidates)
+        if src is not None:
+            mapping[src] = std_name
+    if SERIES_KEY in header:
+        mapping[SERIES_KEY] = SERIES_KEY
+    missing = [k for k in ["iso3", "year", "month", "mean_rad_m"] if k not in mapping.values()]
+    if missing:
+        raise ValueError(f"{path}: could not map required columns {missing}")
+    return mapping
+
+
+def iter_monthly_chunks(path: str, mapping: dict, chunksize: int = 200_000):
+    dtypes = {}
+    for src, std_name in mapping.items():
+        dtypes[src] = "string" if std_name in ("country", "iso3", SERIES_KEY) else "float64"
+
+    reader = pd.read_csv(path, usecols=list(mapping), dtype=dtypes, chunksize=chunksize)
+    for chunk in reader:
+        chunk = chunk.rename(columns=mapping)
+        if "country" not in chunk.columns:
+            chunk["country"] = chunk["iso3"]
+
+        # Keep valid months + drop missing mean radiance (same filter as the notebook)
+        chunk = chunk[(chunk["month"] >= 1) & (chunk["month"] <= 12)]
+        chunk = chunk.dropna(subset=[k for k in group_keys(chunk.columns) if k != "country"] + ["month", "mean_rad_m"])
+        if not chunk.empty:
+            yield chunk
+
+
+def chunk_aggregates(chunk: pd.DataFrame) -> pd.DataFrame:
+    x = chunk["mean_rad_m"]
+    parts = {
+        "n": x.notna().astype("int64"),
+        "s": x,
+        "ss": x * x,
+        "mn": x,
+        "mx": x,
+    }
+    if "spatial_sd_m" in chunk.columns:
+        sd = chunk["spatial_sd_m"]
+        parts.update({"sd_n": sd.notna().astype("int64"), "sd_s": sd, "sd_ss": sd * sd})
+
+    month = chunk["month"].astype("int64").to_numpy()
+    flags = np.zeros((len(chunk), 12), dtype=np.uint8)
+    flags[np.arange(len(chunk)), month - 1] = 1
+
+    df = pd.DataFrame(parts, index=chunk.index)
+    df[MONTH_COLS] = flags
+    keys = group_keys(chunk.columns)
+    for k in keys:
+        df[k] = chunk[k]
+    df["year"] = df["year"].astype("int64")
+    return _combine(df.groupby(keys, sort=False))
+
+
+def _combine(grouped) -> pd.DataFrame:
+    spec = {c: "sum" for c in ["n", "s", "ss", "sd_n", "sd_s", "sd_ss"]}
+    spec.update({"mn": "min", "mx": "max"})
+    spec.update({m: "max" for m in MONTH_COLS})
+    cols = grouped.obj.columns
+    return grouped.agg({k: v for k, v in spec.items() if k in cols})
+
+
+def merge_state(state, agg):
+    if state is None:
+        return agg
+    return _combine(pd.concat([state, agg]).groupby(level=list(agg.index.names), sort=False))
+
+
+def finalize_features(state: pd.DataFrame, min_months: int = 10) -> pd.DataFrame:
+    st = state.copy()
+    st["n_months"] = st[MONTH_COLS].sum(axis=1)
+    dup = st["n"] > st["n_months"]          # each valid row adds 1 to n, each distinct month 1 to n_months
+    if dup.any():
+        raise ValueError(
+            f"{int(dup.sum())} {'/'.join(st.index.names)} groups have more than one row per month "
+            f"(e.g. {'/'.join(map(str, st.index[dup][0]))}); subnational input needs a {SERIES_KEY} column")
+    st = st[st["n_months"] >= min_months]
+
+    n = st["n"]
+    out = pd.DataFrame(index=st.index)
+    out["yearly_mean_mean_rad"] = st["s"] / n
+    var = ((st["ss"] - st["s"] ** 2 / n) / (n - 1)).where(n > 1)
+    out["yearly_std_mean_rad"] = np.sqrt(var.clip(lower=0))
+    out["yearly_min_mean_rad"] = st["mn"]
+    out["yearly_max_mean_rad"] = st["mx"]
+    out["yearly_range_mean_rad"] = st["mx"] - st["mn"]
+
+    if "sd_n" in st.columns:
+        m = st["sd_n"]
+        out["yearly_mean_spatial_sd"] = (st["sd_s"] / m).where(m > 0)
+        sd_var = ((st["sd_ss"] - st["sd_s"] ** 2 / m) / (m - 1)).where(m > 1)
+        out["yearly_std_spatial_sd"] = np.sqrt(sd_var.clip(lower=0))
+
+    out["n_months"] = st["n_months"].astype(int)
+    order = [k for k in st.index.names if k != "country"]
+    return out.reset_index().sort_values(order).reset_index(drop=True)
+
+
+def add_next_year_label(features: pd.DataFrame, label_q: float = 0.5) -> pd.DataFrame:
+    # Create next-year target by shifting within each country / unit (notebook logic)
+    series = [k for k in ("iso3", SERIES_KEY) if k in features.columns]
+    features = features.sort_values(series + ["year"]).reset_index(drop=True)
+    features["next_year_std_mean_rad"] = features.groupby(series)["yearly_std_mean_rad"].shift(-1)
+
+    # Drop last year per country (no next-year label)
+    model_df = features.dropna(subset=["next_year_std_mean_rad"]).copy()
+    thr = model_df["next_year_std_mean_rad"].quantile(label_q)
+    model_df["unstable_next"] = (model_df["next_year_std_mean_rad"] > thr).astype(int)
+    return model_df, thr
+
+
+def build_features(path: str, chunksize: int = 200_000, min_months: int = 10):
+    mapping = map_columns(path)
+    state = None
+    n_rows = 0
+    for chunk in iter_monthly_chunks(path, mapping, chunksize=chunksize):
+        n_rows += len(chunk)
+        state = merge_state(state, chunk_aggregates(chunk))
+    if state is None:
+        raise RuntimeError(f"No valid monthly rows in {path}")
+    return finalize_features(state, min_months=min_months), n_rows
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input", default=os.path.join("data", "processed", "viirs_monthly_country_2012_2024.csv"))
+    ap.add_argument("--out", default=os.path.join("data", "processed", "ml_country_year_features_label.csv"))
+    ap.add_argument("--chunksize", type=int, default=200_000, help="Monthly rows per chunk")
+    ap.add_argument("--min_months", type=int, default=10, help="Minimum distinct months per country-year")
+    ap.add_argument("--label_q", type=float, default=0.5,
+                    help="Quantile of next-year volatility used as threshold (0.5 = median, as in the notebook)")
+    args = ap.parse_args()
+
+    features, n_rows = build_features(args.input, chunksize=args.chunksize, min_months=args.min_months)
+    model_df, thr = add_next_year_label(features, label_q=args.label_q)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    model_df.to_csv(args.out, index=False)
+
+    print(f"Streamed {n_rows:,} monthly rows -> {len(features):,} country-years")
+    print(f"Threshold (q={args.label_q} next-year volatility): {thr:.6f}")
+    print(model_df["unstable_next"].value_counts().to_string())
+    print("Saved:", args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# week4_timeseries_features.py
+#
+# Vectorized time-series features for the monthly VIIRS panel
+# (scripted version of "scripts/week 4 making_features_label", which loops over countries).
+#
+# The monthly CSV is scattered ONCE into dense (series x month) arrays plus masks:
+#
+#   row[s, t]    a row exists for series s in month t
+#   value[s, t]  log1p(mean radiance), NaN where missing;  cloud[s, t], spatial_std[s, t]
+#
+# and every feature is a masked reduction along the month axis for all series at once:
+#
+#   level_mean / level_median       nanmean / nanmedian of log1p(mean)
+#   trend_slope_logmean             OLS slope over the observed values (>= 6)
+#   persistence_acf1                lag-1 autocorrelation of the observed values (>= 6)
+#   volatility_std_dlogmean         std of month-to-month log differences
+#   cloudfree_weighted_logmean      log1p(mean) weighted by cloudFree
+#   acf12_logmean                   lag-12 (seasonal) autocorrelation on the calendar axis
+#   rolling_slope_last / _std       --rolling_window-month OLS slopes (cumulative sums, O(S x T))
+#
+# The first group follows the notebook exactly: observed values are left-compacted per series
+# (the notebook drops NaNs before polyfit / corrcoef, and diffs consecutive rows), so the
+# output reproduces data/monthly_viirs/Feature_Label_monthly_per_country for country series.
+# --series_cols picks the series key, e.g. "country,shapeName" for admin-1 / admin-2 panels:
+# no step loops over series, so tens of thousands of them cost a few array passes.
+#
+# Output:
+#   <out>    one row per series: notebook features (past window), future_volatility (future
+#            window), label_energy_insecure (future volatility >= --label_q quantile), extras
+#
+# Run:
+#   python scripts/week4_timeseries_features.py \
+#       --input data/processed/viirs_monthly_country_2012_2024.csv \
+#       --out data/monthly_viirs/Feature_Label_monthly_per_country.csv
+
+import os, argparse, time, warnings
+import numpy as np
+import pandas as pd
+
+from week4_stream_features import COLUMN_CANDIDATES, pick_col
+
+CLOUD_CANDIDATES = ["cloudFree", "cf_cvg", "cloud_free"]
+MIN_OBS = 6                                  # slope / acf1 need >= 6 values, as in the notebook
+
+
+def month_index(year, month) -> np.ndarray:
+    return np.asarray(year, dtype=np.int64) * 12 + np.asarray(month, dtype=np.int64) - 1
+
+
+def parse_month(s: str) -> int:
+    y, m = s.split("-")[:2]
+    return int(month_index(int(y), int(m)))
+
+
+def load_dense(path: str, series_cols):
+    """
+    Read the monthly CSV into dense arrays. Returns (series frame, months (T,), arrays) where
+    arrays = {"row", "mean", "cloud", "std"}, each (S, T); values NaN where missing.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    cols = {std: pick_col(header, COLUMN_CANDIDATES[std]) for std in ["year", "month", "mean_rad_m", "spatial_sd_m"]}
+    cols["cloud"] = pick_col(header, CLOUD_CANDIDATES)
+    missing = [c for c in series_cols if c not in header] + [k for k in ["year", "month", "mean_rad_m"] if cols[k] is None]
+    if missing:
+        raise ValueError(f"{path}: missing columns {missing}")
+
+    usecols = list(series_cols) + [c for c in cols.values() if c is not None]
+    df = pd.read_csv(path, usecols=usecols)
+    t = month_index(df[cols["year"]], df[cols["month"]])
+    sid, series = pd.MultiIndex.from_frame(df[list(series_cols)]).factorize()
+    series = pd.DataFrame(list(series), columns=list(series_cols))
+    t0, T = int(t.min()), int(t.max() - t.min()) + 1
+    S = len(series)
+
+    arrays = {"row": np.zeros((S, T), dtype=bool)}
+    arrays["row"][sid, t - t0] = True
+    for name, col in [("mean", cols["mean_rad_m"]), ("cloud", cols["cloud"]), ("std", cols["spatial_sd_m"])]:
+        a = np.full((S, T), np.nan)
+        if col is not None:
+            a[sid, t - t0] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+        arrays[name] = a
+    return series, np.arange(t0, t0 + T), arrays
+
+
+def compact(y, mask):
+    """Left-justify the masked entries of every row (order kept); returns (values, counts), NaN-padded."""
+    order = np.argsort(~mask, axis=1, kind="stable")
+    n = mask.sum(axis=1)
+    out = np.take_along_axis(np.where(mask, y, np.nan), order, axis=1)
+    out[np.arange(y.shape[1])[None, :] >= n[:, None]] = np.nan
+    return out, n
+
+
+def ols_slope(y, x=None):
+    """Per-row OLS slope of the non-NaN entries of y on x (default: column index)."""
+    m = np.isfinite(y)
+    x = np.broadcast_to(np.arange(y.shape[1], dtype=float) if x is None else x, y.shape)
+    n = m.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        xm = np.where(m, x, 0).sum(axis=1) / n
+        ym = np.where(m, y, 0).sum(axis=1) / n
+        dx = np.where(m, x - xm[:, None], 0)
+        return (dx * np.where(m, y - ym[:, None], 0)).sum(axis=1) / (dx * dx).sum(axis=1)
+
+
+def lag_corr(y, lag: int = 1):
+    """Per-row Pearson correlation of (y_t, y_t+lag) over pairs where both are present; 0 if constant."""
+    a, b = y[:, :-lag], y[:, lag:]
+    m = np.isfinite(a) & np.isfinite(b)
+    n = m.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        am = np.where(m, a, 0).sum(axis=1) / n
+        bm = np.where(m, b, 0).sum(axis=1) / n
+        da, db = np.where(m, a - am[:, None], 0), np.where(m, b - bm[:, None], 0)
+        saa, sbb = (da * da).sum(axis=1), (db * db).sum(axis=1)
+        r = (da * db).sum(axis=1) / np.sqrt(saa * sbb)
+    # np.std(y0) == 0 or np.std(y1) == 0 -> 0.0 in the notebook
+    return np.where((saa <= 1e-300) | (sbb <= 1e-300), 0.0, r)
+
+
+def rolling_slope(y, window: int, min_obs: int = None):
+    """(S, T) OLS slope over the trailing `window` months on the calendar axis; NaN until min_obs values."""
+    min_obs = min_obs or max(window // 2, 2)
+    m = np.isfinite(y).astype(float)
+    t = np.arange(y.shape[1], dtype=float)[None, :]
+    yz = np.where(m > 0, y, 0.0)
+
+    def trailing(a):
+        c = np.cumsum(a, axis=1)
+        c[:, window:] = c[:, window:] - c[:, :-window]
+        return c
+
+    n, st, sy = trailing(m), trailing(m * t), trailing(yz)
+    stt, sty = trailing(m * t * t), trailing(yz * t)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (n * sty - st * sy) / (n * stt - st * st)
+    return np.where(n >= min_obs, slope, np.nan)
+
+
+def window_features(arrays, months, start: int, end: int, rolling_window: int = 12) -> pd.DataFrame:
+    """Features of every series over months [start, end] (inclusive month indexes)."""
+    sel = (months >= start) & (months <= end)
+    row = arrays["row"][:, sel]
+    raw = arrays["mean"][:, sel]
+    y = np.where(row, np.log1p(raw), np.nan)
+    cloud = np.where(row, arrays["cloud"][:, sel], np.nan)
+    obs = row & np.isfinite(y)
+
+    n_rows = row.sum(axis=1)
+    y_rows, _ = compact(y, row)                 # consecutive ROWS (notebook: np.diff over rows)
+    y_obs, n_obs = compact(y, obs)              # observed values only (notebook: dropna)
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)          # all-NaN series -> NaN
+        dy = np.diff(y_rows, axis=1)
+        cw = np.where(obs & np.isfinite(cloud), cloud, 0.0)
+        roll = rolling_slope(y, rolling_window)
+        last_idx = roll.shape[1] - 1 - np.argmax(np.isfinite(roll[:, ::-1]), axis=1)
+        last = np.take_along_axis(roll, last_idx[:, None], axis=1)[:, 0]
+        feats = {
+            "n_months": n_rows,
+            "missing_rate_mean": np.where(n_rows > 0, (row & ~np.isfinite(raw)).sum(axis=1) / np.maximum(n_rows, 1), np.nan),
+            "avg_cloudFree": np.nanmean(cloud, axis=1),
+            "level_mean_logmean": np.nanmean(y, axis=1),
+            "level_median_logmean": np.nanmedian(y, axis=1),
+            "trend_slope_logmean": np.where(n_obs >= MIN_OBS, ols_slope(y_obs), np.nan),
+            "persistence_acf1": np.where(n_obs >= MIN_OBS, lag_corr(y_obs, 1), np.nan),
+            "volatility_std_dlogmean": np.nanstd(dy, axis=1) if dy.shape[1] else np.full(len(y), np.nan),
+            "avg_spatial_std": np.nanmean(np.where(row, arrays["std"][:, sel], np.nan), axis=1),
+            "cloudfree_weighted_logmean": (cw * np.nan_to_num(y)).sum(axis=1) / cw.sum(axis=1),
+            "acf12_logmean": lag_corr(y, 12) if y.shape[1] > 12 else np.full(len(y), np.nan),
+            "rolling_slope_last": np.where(np.isfinite(roll).any(axis=1), last, np.nan),
+            "rolling_slope_std": np.nanstd(roll, axis=1),
+        }
+    return pd.DataFrame(feats)
+
+
+def build_feature_label(series, months, arrays, past, future, label_q: float = 0.7, rolling_window: int = 12):
+    X = window_features(arrays, months, *past, rolling_window=rolling_window)
+    F = window_features(arrays, months, *future, rolling_window=rolling_window)
+    out = pd.concat([series.reset_index(drop=True), X], axis=1)
+    out.insert(out.columns.get_loc("avg_spatial_std") + 1, "future_volatility", F["volatility_std_dlogmean"])
+
+    # Same as the notebook: inner join on series present in both windows
+    out = out[(X["n_months"] > 0).to_numpy() & (F["n_months"] > 0).to_numpy()].reset_index(drop=True)
+    thr = out["future_volatility"].quantile(label_q)
+    out.insert(out.columns.get_loc("future_volatility") + 1, "label_energy_insecure",
+               (out["future_volatility"] >= thr).astype(int))
+    return out.sort_values(list(series.columns), kind="stable").reset_index(drop=True), thr
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input", default=os.path.join("data", "processed", "viirs_monthly_country_2012_2024.csv"))
+    ap.add_argument("--out", default=os.path.join("data", "processed", "ml_series_features_label.csv"))
+    ap.add_argument("--series_cols", default="country", help="Comma-separated series key columns")
+    ap.add_argument("--past", default="2012-01:2018-12", help="Feature window YYYY-MM:YYYY-MM")
+    ap.add_argument("--future", default="2019-01:2024-05", help="Label window YYYY-MM:YYYY-MM")
+    ap.add_argument("--label_q", type=float, default=0.70, help="Future volatility quantile for the label (top 30%%)")
+    ap.add_argument("--rolling_window", type=int, default=12, help="Months per rolling trend")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    series_cols = [c.strip() for c in args.series_cols.split(",") if c.strip()]
+    series, months, arrays = load_dense(args.input, series_cols)
+    t1 = time.perf_counter()
+    past = tuple(parse_month(s) for s in args.past.split(":"))
+    future = tuple(parse_month(s) for s in args.future.split(":"))
+    out, thr = build_feature_label(series, months, arrays, past, future, args.label_q, args.rolling_window)
+    t2 = time.perf_counter()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    out.to_csv(args.out, index=False)
+    print(f"{len(series):,} series x {len(months)} months loaded in {t1 - t0:.2f}s, features in {t2 - t1:.3f}s")
+    print(f"Label threshold (future volatility q={args.label_q}): {thr:.6f}")
+    print(out["label_energy_insecure"].value_counts().to_string())
+    print("Saved:", args.out)
+
+
+if __name__ == "__main__":
+    main()
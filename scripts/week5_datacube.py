@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# week5_datacube.py
+#
+# One-time ingestion of the yearly GeoTIFFs into ONE chunked, compressed datacube per country:
+#
+#   DATA_PATH/<Country>/<Country>_<Year>.tif   (band 1 light, band 2 pop, band 3 pop_norm)
+#     -> CUBE_DIR/<Country>_cube.tif
+#
+# The cube is a tiled, DEFLATE-compressed, band-interleaved GeoTIFF with dimensions
+# (year, band, row, col) flattened year-major into GeoTIFF bands:
+#
+#   cube band index = year_index * n_bands + band_index + 1      (descriptions like "2014/light")
+#
+# Internal blocks are tile_size x tile_size with tile_size from choose_tile_size(), i.e. the
+# same grid the tiling pass uses (week6_build_tiles_all_years.py). Reading one tile's
+# ten-year history therefore decodes exactly one block per (year, band), and one year's strip
+# decodes only the blocks of that row of tiles. Nodata is stored as NaN (same convention as
+# read_bands), and years whose shape differs slightly from the reference year are clipped /
+# NaN-padded to the reference grid.
+#
+# DataCube serves both consumers:
+#   cube.stack("light")            -> (T, H, W) like stack_country() in the Week 5 notebooks
+#   cube.read_bands(year)          -> (nl, pop) like read_bands() for build_tile_table
+#   cube.tile_history(r0, r1, c0, c1), cube.strip(year, r0, r1)
+#
+# Run:
+#   python scripts/week5_datacube.py --data_path data/week_5_robustness_tif_images --out_dir data/cubes
+
+import os, argparse, json
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from week6_build_tiles_all_years import choose_tile_size, find_years
+
+BAND_NAMES = ["light", "pop", "pop_norm"]
+
+
+def cube_path(cube_dir: str, country: str) -> str:
+    return os.path.join(cube_dir, f"{country}_cube.tif")
+
+
+def ingest_country(data_path: str, country: str, years, out_fp: str, strip_rows: int = None):
+    """Write the (year, band, row, col) cube for one country; returns its tile size."""
+    fps = [os.path.join(data_path, country, f"{country}_{y}.tif") for y in years]
+
+    # Reference year defines the grid (same rule as the tiling pass)
+    with rasterio.open(fps[0]) as ref:
+        h, w = ref.height, ref.width
+        n_bands = min(ref.count, len(BAND_NAMES))
+        profile = ref.profile.copy()
+
+    tile = choose_tile_size(h, w, country)
+    strip_rows = strip_rows or tile
+
+    profile.update(
+        driver="GTiff",
+        count=len(years) * n_bands,
+        dtype="float32",
+        nodata=np.nan,
+        tiled=True,
+        blockxsize=tile,
+        blockysize=tile,
+        compress="deflate",
+        predictor=3,          # floating-point predictor
+        interleave="band",
+        BIGTIFF="IF_SAFER",
+    )
+
+    shapes = {}
+    with rasterio.open(out_fp, "w", **profile) as dst:
+        for yi, (year, fp) in enumerate(zip(years, fps)):
+            with rasterio.open(fp) as src:
+                shapes[year] = [src.height, src.width]
+                hh, ww = min(h, src.height), min(w, src.width)
+                nodata = src.nodata
+                for bi in range(n_bands):
+                    band_out = yi * n_bands + bi + 1
+                    dst.set_band_description(band_out, f"{year}/{BAND_NAMES[bi]}")
+                    if bi >= src.count:
+                        continue
+                    # Copy one strip of tile rows at a time (bounded memory)
+                    for r0 in range(0, h, strip_rows):
+                        r1 = min(h, r0 + strip_rows)
+                        out = np.full((r1 - r0, w), np.nan, dtype=np.float32)
+                        if r0 < hh:
+                            rr1 = min(r1, hh)
+                            arr = src.read(bi + 1, window=Window(0, r0, ww, rr1 - r0)).astype("float32")
+                            if nodata is not None:
+                                arr[arr == nodata] = np.nan
+                            out[: rr1 - r0, :ww] = arr
+                        dst.write(out, band_out, window=Window(0, r0, w, r1 - r0))
+
+        dst.update_tags(
+            country=country,
+            years=json.dumps([int(y) for y in years]),
+            bands=json.dumps(BAND_NAMES[:n_bands]),
+            tile_size=str(tile),
+            source_shapes=json.dumps({str(k): v for k, v in shapes.items()}),
+        )
+    return tile
+
+
+class DataCube:
+    """Read access to a <Country>_cube.tif written by ingest_country()."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ds = rasterio.open(path)
+        tags = self.ds.tags()
+        self.country = tags["country"]
+        self.years = json.loads(tags["years"])
+        self.bands = json.loads(tags["bands"])
+        self.tile_size = int(tags["tile_size"])
+        self.shape = (self.ds.height, self.ds.width)
+        self.transform = self.ds.transform
+
+    def close(self):
+        self.ds.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def band_index(self, year: int, band: str) -> int:
+        return self.years.index(year) * len(self.bands) + self.bands.index(band) + 1
+
+    def read(self, year: int, band: str, window: Window = None) -> np.ndarray:
+        return self.ds.read(self.band_index(year, band), window=window)
+
+    def read_bands(self, year: int):
+        # Drop-in for week6_build_tiles_all_years.read_bands()
+        nl = self.read(year, "light")
+        pop = self.read(year, "pop") if "pop" in self.bands else None
+        return nl, pop
+
+    def tile_history(self, r0, r1, c0, c1, bands=None, years=None) -> np.ndarray:
+        """(T, B, r1-r0, c1-c0) for one tile; decodes one block per (year, band)."""
+        bands = bands or self.bands
+        years = years or self.years
+        idx = [self.band_index(y, b) for y in years for b in bands]
+        arr = self.ds.read(idx, window=Window(c0, r0, c1 - c0, r1 - r0))
+        return arr.reshape(len(years), len(bands), r1 - r0, c1 - c0)
+
+    def strip(self, year: int, r0: int, r1: int, bands=None) -> np.ndarray:
+        """(B, r1-r0, W) for one year; decodes only the block rows that overlap [r0, r1)."""
+        bands = bands or self.bands
+        idx = [self.band_index(year, b) for b in bands]
+        return self.ds.read(idx, window=Window(0, r0, self.shape[1], r1 - r0))
+
+    def stack(self, band: str, years=None) -> np.ndarray:
+        """(T, H, W) stack of one band, as built by stack_country() in the Week 5 notebooks."""
+        years = years or self.years
+        return self.ds.read([self.band_index(y, band) for y in years])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data_path", required=True, help="Root folder containing <Country>/<Country>_<Year>.tif")
+    ap.add_argument("--out_dir", default=None, help="Cube folder (default: <data_path>/cubes)")
+    ap.add_argument("--countries", default="Morocco,Brazil,China", help="Comma-separated list")
+    ap.add_argument("--start_year", type=int, default=2014)
+    ap.add_argument("--end_year", type=int, default=2023)
+    args = ap.parse_args()
+
+    out_dir = args.out_dir or os.path.join(args.data_path, "cubes")
+    os.makedirs(out_dir, exist_ok=True)
+
+    for country in [c.strip() for c in args.countries.split(",") if c.strip()]:
+        years = [y for y in find_years(args.data_path, country) if args.start_year <= y <= args.end_year]
+        if not years:
+            print(f"[WARN] No years found for {country} in range {args.start_year}-{args.end_year}")
+            continue
+        out_fp = cube_path(out_dir, country)
+        tile = ingest_country(args.data_path, country, years, out_fp)
+        size_mb = os.path.getsize(out_fp) / 1e6
+        print(f"{country}: years={years[0]}-{years[-1]} (n={len(years)}), block={tile}px -> {out_fp} ({size_mb:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -122,16 +122,20 @@ def compute_infrastructure_features(df_country_year):
     return df
 
 
-def create_infrastructure_maps(country, year, tiles_df, tif_path, output_path):
+def create_infrastructure_maps(country, year, tiles_df, tif_path, output_path, nl=None, dpi=200):
     """
     Create 4-panel visualization: lights + 3 infrastructure measures
+
+    If `nl` (the decoded nightlights band) is given, tif_path is not opened; the
+    render farm (week7_render_figures.py) passes a memory-mapped band here.
     """
     print(f"  Creating visualization for {country} {year}...")
     
     # Load nightlights
-    with rasterio.open(tif_path) as src:
-        h, w = src.height, src.width
-        nl = src.read(1)
+    if nl is None:
+        with rasterio.open(tif_path) as src:
+            nl = src.read(1)
+    h, w = nl.shape
     
     # Initialize maps
     distance_map = np.full((h, w), np.nan, dtype=float)
@@ -191,7 +195,7 @@ def create_infrastructure_maps(country, year, tiles_df, tif_path, output_path):
     plt.tight_layout()
     
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    plt.savefig(output_path, dpi=200, bbox_inches='tight')
+    plt.savefig(output_path, dpi=dpi, bbox_inches='tight')
     plt.close(fig)
     
     print(f"  ✓ Saved: {output_path.name}")
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# week6_batch_tiles.py
+#
+# Checkpointed, resumable batch run of the tiling + infrastructure steps for many countries
+# (e.g. every country of data/processed/viirs_country_panel_v22.csv that has rasters), instead
+# of one long week6_build_tiles_all_years.py run that restarts from zero on any failure.
+#
+# One JOB = one (country, year): build_tile_table() streamed from the yearly TIFF, then
+# compute_infrastructure_features() on the result, written atomically as one PARTITION CSV.
+#
+#   * ledger: a SQLite file (--ledger) with one row per job: status (pending / running / done /
+#     failed), attempts, memory estimate, tiles, seconds, partition path, last error and a key
+#     over the settings + raster checksum. A job is skipped when it is done with the same key and
+#     its partition exists, so an interrupted run resumes where it stopped; jobs left "running"
+#     by a crash are put back to pending; a changed raster or setting re-runs only what it affects
+#   * memory budget: each job's working set is estimated from the raster catalog shape
+#     (one tile-high strip x width x STRIP_BYTES_PER_PIXEL, plus WORKER_BASE_MB per process);
+#     jobs are admitted, largest first, only while the running estimates fit in --mem_budget_mb
+#   * retries: a failed job is re-queued until it has failed --max_retries times; if a worker
+#     process dies the pool is rebuilt and its in-flight jobs count one failed attempt
+#   * the panels are assembled from the completed partitions only, in (country, year) order
+#
+# The tile grid per country is chosen as in the tiling script (reference = first year in range),
+# so tile_id stays stable across years and matches week6_build_tiles_all_years.py output.
+#
+# Outputs (written to --out_dir):
+#   partitions/<Country>/tiles_<Country>_<Year>.csv                   one per completed job
+#   tiles_panel_all_countries_<start>-<end>.csv                       tiling columns
+#   tiles_panel_all_countries_<start>-<end>_WITH_GEO_INFRASTRUCTURE.csv   + infrastructure columns
+#   batch_ledger.sqlite                                               (default --ledger)
+#
+# Run:
+#   python scripts/week6_batch_tiles.py --data_path data/week_5_robustness_tif_images \
+#       --out_dir figures/week6_outputs/batch --workers 4 --mem_budget_mb 8000
+#   (re-run the same command to resume; --status prints the ledger and exits)
+
+import os, argparse, json, sqlite3, time, traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+
+import raster_catalog
+from week6_build_tiles_all_years import LIT_THRESHOLD, TILE_STATS, build_tile_table, choose_tile_size, make_tiles
+
+STRIP_BYTES_PER_PIXEL = 64          # measured peak of build_tile_table per strip pixel is ~50 B (all stats)
+WORKER_BASE_MB = 200                # interpreter + numpy / pandas / rasterio per worker process
+INFRA_COLS = ["center_r", "center_c", "distance_to_urban_core", "log_distance_to_urban",
+              "local_urban_density", "log_local_urban_density", "distance_to_center", "centrality_score"]
+
+LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    country   TEXT NOT NULL,
+    year      INTEGER NOT NULL,
+    status    TEXT NOT NULL,
+    attempts  INTEGER NOT NULL DEFAULT 0,
+    est_mb    REAL,
+    n_tiles   INTEGER,
+    seconds   REAL,
+    partition TEXT,
+    job_key   TEXT,
+    error     TEXT,
+    updated   REAL,
+    PRIMARY KEY (country, year)
+)
+"""
+
+
+class Ledger:
+    """Job table in SQLite; only the scheduling process touches it."""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(LEDGER_SCHEMA)
+        self.conn.commit()
+
+    def get(self, country, year):
+        cur = self.conn.execute("SELECT status, attempts, job_key, partition FROM jobs WHERE country=? AND year=?",
+                                (country, year))
+        return cur.fetchone()
+
+    def upsert(self, country, year, **fields):
+        fields["updated"] = time.time()
+        if self.get(country, year) is None:
+            self.conn.execute("INSERT INTO jobs (country, year, status) VALUES (?, ?, 'pending')", (country, year))
+        sets = ", ".join(f"{k}=?" for k in fields)
+        self.conn.execute(f"UPDATE jobs SET {sets} WHERE country=? AND year=?", (*fields.values(), country, year))
+        self.conn.commit()
+
+    def reset_running(self) -> int:
+        """Jobs left 'running' by a crashed run go back to pending."""
+        n = self.conn.execute("UPDATE jobs SET status='pending' WHERE status='running'").rowcount
+        self.conn.commit()
+        return n
+
+    def summary(self) -> pd.DataFrame:
+        return pd.read_sql_query("SELECT country, year, status, attempts, est_mb, n_tiles, seconds, error "
+                                 "FROM jobs ORDER BY country, year", self.conn)
+
+    def close(self):
+        self.conn.close()
+
+
+def estimate_mb(height: int, width: int, tile_size: int) -> float:
+    """Working set of one streamed build_tile_table() job, from the raster shape."""
+    return WORKER_BASE_MB + min(tile_size, height) * width * STRIP_BYTES_PER_PIXEL / 2 ** 20
+
+
+def plan_jobs(catalog, data_path: str, out_dir: str, countries, start_year: int, end_year: int, settings: dict):
+    """One job dict per available (country, year); the grid comes from the first year in range."""
+    jobs = []
+    for country in countries:
+        ent = raster_catalog.entries(catalog, country)
+        years = [y for y in sorted(ent) if start_year <= y <= end_year]
+        if not years:
+            continue
+        ref = ent[years[0]]
+        h_ref, w_ref = ref["height"], ref["width"]
+        tile_size = choose_tile_size(h_ref, w_ref, country)
+        for y, shape in raster_catalog.shape_mismatches(catalog, country, years, years[0]):
+            print(f"[WARN] {country} {y}: shape {shape[0]}x{shape[1]} differs from {years[0]}; tiles are clipped")
+        for y in years:
+            key = json.dumps({**settings, "grid": [h_ref, w_ref, tile_size], "checksum": ent[y]["checksum"]},
+                             sort_keys=True)
+            jobs.append({
+                "country": country, "year": y,
+                "fp": os.path.join(data_path, country, f"{country}_{y}.tif"),
+                "grid": (h_ref, w_ref, tile_size),
+                "est_mb": estimate_mb(ent[y]["height"], ent[y]["width"], tile_size),
+                "partition": os.path.join(out_dir, "partitions", country, f"tiles_{country}_{y}.csv"),
+                "key": key, **settings,
+            })
+    return jobs
+
+
+def run_job(job: dict):
+    """Worker: tile table + infrastructure features for one country-year -> partition CSV."""
+    from week6_add_geographic_infrastructure import compute_infrastructure_features
+
+    t0 = time.perf_counter()
+    h, w, tile_size = job["grid"]
+    df = build_tile_table(job["country"], job["year"], job["fp"], make_tiles(h, w, tile_size),
+                          min_valid=job["min_valid"], stats=job["tile_stats"], lit_threshold=job["lit_threshold"])
+    df = compute_infrastructure_features(df)
+
+    os.makedirs(os.path.dirname(job["partition"]), exist_ok=True)
+    tmp = job["partition"] + ".tmp"
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, job["partition"])                 # a partition on disk is always complete
+    return len(df), time.perf_counter() - t0
+
+
+def schedule(jobs, ledger: Ledger, workers: int, mem_budget_mb: float, max_retries: int):
+    """Run jobs on a process pool within the memory budget; returns (#done, #failed)."""
+    queue = sorted(jobs, key=lambda j: -j["est_mb"])
+    attempts = {(j["country"], j["year"]): (ledger.get(j["country"], j["year"]) or (None, 0))[1] for j in jobs}
+    running = {}                                       # future -> job
+    n_done = n_failed = 0
+    pool = ProcessPoolExecutor(max_workers=workers)
+
+    def fail(job, err):
+        nonlocal n_failed
+        key = (job["country"], job["year"])
+        attempts[key] += 1
+        if attempts[key] < max_retries:
+            ledger.upsert(*key, status="pending", attempts=attempts[key], error=err)
+            queue.append(job)
+            print(f"[WARN] {key[0]} {key[1]} failed (attempt {attempts[key]}/{max_retries}), re-queued: {err.splitlines()[-1]}")
+        else:
+            ledger.upsert(*key, status="failed", attempts=attempts[key], error=err)
+            n_failed += 1
+            print(f"[WARN] {key[0]} {key[1]} failed {attempts[key]} times, giving up: {err.splitlines()[-1]}")
+
+    try:
+        while queue or running:
+            # Admit the largest jobs that fit next to the running ones (always at least one)
+            broken = False
+            in_use = sum(j["est_mb"] for j in running.values())
+            for job in list(queue):
+                if len(running) >= workers:
+                    break
+                if running and in_use + job["est_mb"] > mem_budget_mb:
+                    continue
+                try:
+                    fut = pool.submit(run_job, job)
+                except BrokenProcessPool:             # a worker died since the last wait(); job stays queued
+                    broken = True
+                    break
+                queue.remove(job)
+                ledger.upsert(job["country"], job["year"], status="running", est_mb=job["est_mb"],
+                              partition=job["partition"], job_key=job["key"])
+                running[fut] = job
+                in_use += job["est_mb"]
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED) if running else (set(), set())
+            for fut in finished:
+                job = running.pop(fut)
+                try:
+                    n_tiles, secs = fut.result()
+                except BrokenProcessPool:
+                    broken = True
+                    fail(job, "worker process died (BrokenProcessPool)")
+                except Exception:
+                    fail(job, traceback.format_exc())
+                else:
+                    attempts[(job["country"], job["year"])] += 1
+                    ledger.upsert(job["country"], job["year"], status="done", n_tiles=n_tiles, seconds=secs,
+                                  attempts=attempts[(job["country"], job["year"])], error=None)
+                    n_done += 1
+                    print(f"  {job['country']} {job['year']}: n_tiles={n_tiles} ({secs:.1f}s, est {job['est_mb']:.0f} MB)")
+
+            if broken:
+                # Every in-flight job of a broken pool is lost: charge an attempt and start a fresh pool
+                for job in running.values():
+                    fail(job, "worker process died (BrokenProcessPool)")
+                running.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(max_workers=workers)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return n_done, n_failed
+
+
+def assemble(ledger: Ledger, jobs, out_dir: str, start_year: int, end_year: int):
+    """Panels from the completed partitions of `jobs`, in (country, year) order."""
+    parts = []
+    for job in sorted(jobs, key=lambda j: (j["country"], j["year"])):
+        row = ledger.get(job["country"], job["year"])
+        if row and row[0] == "done" and os.path.exists(job["partition"]):
+            parts.append(pd.read_csv(job["partition"]))
+    if not parts:
+        return None
+    geo = pd.concat(parts, ignore_index=True)
+    base_fp = os.path.join(out_dir, f"tiles_panel_all_countries_{start_year}-{end_year}.csv")
+    geo_fp = base_fp[:-4] + "_WITH_GEO_INFRASTRUCTURE.csv"
+    geo.drop(columns=INFRA_COLS).to_csv(base_fp, index=False)
+    geo.to_csv(geo_fp, index=False)
+    return base_fp, geo_fp, len(parts)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data_path", required=True, help="Root folder containing <Country>/<Country>_<Year>.tif")
+    ap.add_argument("--out_dir", default=os.path.join("figures", "week6_outputs", "batch"))
+    ap.add_argument("--countries", default="panel",
+                    help="'panel' (countries of --country_panel), 'all' (every country folder) or a comma-separated list")
+    ap.add_argument("--country_panel", default=os.path.join("data", "processed", "viirs_country_panel_v22.csv"))
+    ap.add_argument("--start_year", type=int, default=2014)
+    ap.add_argument("--end_year", type=int, default=2023)
+    ap.add_argument("--min_valid", type=int, default=500, help="Minimum valid pixels per tile (default 500)")
+    ap.add_argument("--tile_stats", default="",
+                    help=f"Extra per-tile statistics (comma-separated) from: {','.join(TILE_STATS)}")
+    ap.add_argument("--lit_threshold", type=float, default=LIT_THRESHOLD)
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="Worker processes")
+    ap.add_argument("--mem_budget_mb", type=float, default=4000, help="Memory budget for the running jobs")
+    ap.add_argument("--max_retries", type=int, default=3, help="Attempts per job before it is marked failed")
+    ap.add_argument("--ledger", default=None, help="SQLite job ledger (default <out_dir>/batch_ledger.sqlite)")
+    ap.add_argument("--retry_failed", action="store_true", help="Give jobs marked failed a fresh set of retries")
+    ap.add_argument("--status", action="store_true", help="Print the ledger and exit")
+    args = ap.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    ledger = Ledger(args.ledger or os.path.join(args.out_dir, "batch_ledger.sqlite"))
+    if args.status:
+        s = ledger.summary()
+        print(s.groupby("status").size().to_string() if len(s) else "Ledger is empty")
+        s["error"] = s["error"].str.strip().str.split("\n").str[-1]          # last traceback line
+        print(s[s["status"] != "done"].to_string(index=False))
+        return
+
+    t0 = time.perf_counter()
+    catalog, cat_stats = raster_catalog.refresh(args.data_path)
+    print(f"Raster catalog: {cat_stats}")
+    on_disk = sorted({e["country"] for e in catalog["files"].values()})
+    if args.countries == "all":
+        countries = on_disk
+    elif args.countries == "panel":
+        wanted = sorted(pd.read_csv(args.country_panel, usecols=["country"])["country"].dropna().unique())
+        countries = [c for c in wanted if c in on_disk]
+        print(f"{len(wanted)} countries in {os.path.basename(args.country_panel)}, "
+              f"{len(countries)} with rasters under {args.data_path}")
+    else:
+        countries = [c.strip() for c in args.countries.split(",") if c.strip()]
+        for c in countries:
+            if c not in on_disk:
+                print(f"[WARN] No rasters for {c} under {args.data_path}")
+
+    settings = {"min_valid": args.min_valid, "lit_threshold": args.lit_threshold,
+                "tile_stats": [s.strip() for s in args.tile_stats.split(",") if s.strip()]}
+    jobs = plan_jobs(catalog, args.data_path, args.out_dir, countries, args.start_year, args.end_year, settings)
+
+    n_reset = ledger.reset_running()
+    if n_reset:
+        print(f"Resuming: {n_reset} job(s) interrupted by a previous run put back to pending")
+    todo = []
+    for job in jobs:
+        row = ledger.get(job["country"], job["year"])
+        if row and row[0] == "done" and row[2] == job["key"] and os.path.exists(job["partition"]):
+            continue
+        if row and row[0] == "failed" and row[2] == job["key"] and not args.retry_failed:
+            continue                                   # gave up on this exact input; see --status
+        if row is None or row[2] != job["key"] or row[0] == "failed":
+            ledger.upsert(job["country"], job["year"], status="pending", attempts=0, error=None,
+                          job_key=job["key"], est_mb=job["est_mb"], partition=job["partition"])
+        todo.append(job)
+    print(f"{len(jobs)} jobs for {len({j['country'] for j in jobs})} countries: {len(jobs) - len(todo)} already done, "
+          f"{len(todo)} to run on {args.workers} workers within {args.mem_budget_mb:.0f} MB")
+
+    n_done, n_failed = schedule(todo, ledger, args.workers, args.mem_budget_mb, args.max_retries) if todo else (0, 0)
+    out = assemble(ledger, jobs, args.out_dir, args.start_year, args.end_year)
+    ledger.close()
+
+    print(f"\nRan {n_done} job(s), {n_failed} failed ({time.perf_counter() - t0:.1f}s)")
+    if out is None:
+        print("No completed partitions to assemble.")
+        return
+    base_fp, geo_fp, n_parts = out
+    if n_parts < len(jobs):
+        print(f"[WARN] Panel built from {n_parts}/{len(jobs)} partitions; re-run to resume, add --retry_failed for failed jobs")
+    print("Saved panel:", base_fp)
+    print("Saved panel:", geo_fp)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,10 @@
 #   Band 1: nightlights (VIIRS radiance)
 #   Band 2: population (WorldPop)
 #
+# Per-tile statistics:
+#   mean_light and mean_pop always; --tile_stats adds any of sum_light, sum_pop, std_light,
+#   p50_light, p90_light, lit_fraction, gini_light, popw_light, all from one pass per strip.
+#
 # Outputs (written to OUT_DIR):
 #   tiles_<Country>_<Year>.csv
 #   tiles_panel_all_countries_<start>-<end>.csv
@@ -21,11 +25,24 @@
 #   We choose ONE tile size per country (based on the first available year) and reuse it for all years,
 #   so tiles are stable over time.
 #   IMPORTANT: tile_id is STABLE across years because it is the enumerate index of the full grid.
-
-import os, glob, re, argparse
+#   Every row carries tile_size, so grid row/col = r0 // tile_size, c0 // tile_size.
+#
+# Throughput:
+#   Yearly TIFFs are streamed in row strips; --prefetch N reads the next N strips (running on into
+#   the next year) in background threads while the current strip is reduced, so memory stays at
+#   N + 1 strips. With --cube_dir, --prefetch N decodes the next N cube years instead.
+#   CSVs are written by a background writer, so per-country wall time approaches
+#   max(I/O, compute) instead of their sum.
+
+import os, glob, re, argparse, itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 import rasterio
+from rasterio.windows import Window
+
+import raster_catalog
 
 REGION_TYPES = ["urban_core", "dense_dim", "bright_sparse", "mixed", "empty_or_rural"]
 
@@ -84,6 +101,27 @@ def classify(mean_nl: float, mean_pop: float, nl_q, pop_q) -> str:
     return "mixed"
 
 
+def classify_codes(mean_nl, mean_pop, nl_lo, nl_hi, pop_lo, pop_hi) -> np.ndarray:
+    """
+    Vectorized classify(): integer codes into REGION_TYPES for whole arrays.
+    Thresholds may be scalars or per-row arrays (e.g. quantiles broadcast from each row's group).
+    """
+    mean_nl = np.asarray(mean_nl, dtype=float)
+    mean_pop = np.asarray(mean_pop, dtype=float)
+    with np.errstate(invalid="ignore"):
+        rural = ~np.isfinite(mean_pop) | (mean_pop <= pop_lo)
+        hi_pop = mean_pop >= pop_hi
+        hi_nl = mean_nl >= nl_hi
+        lo_nl = mean_nl <= nl_lo
+
+    codes = np.full(mean_nl.shape, REGION_TYPES.index("mixed"), dtype=np.int8)
+    codes[~hi_pop & hi_nl] = REGION_TYPES.index("bright_sparse")
+    codes[hi_pop & lo_nl] = REGION_TYPES.index("dense_dim")
+    codes[hi_pop & hi_nl] = REGION_TYPES.index("urban_core")
+    codes[rural] = REGION_TYPES.index("empty_or_rural")
+    return codes
+
+
 def find_years(data_path: str, country: str):
     # Look inside DATA_PATH/<Country>/<Country>_YYYY.tif
     country_folder = os.path.join(data_path, country)
@@ -98,44 +136,241 @@ def find_years(data_path: str, country: str):
     return sorted(set(years))
 
 
-def build_tile_table(country: str, year: int, fp: str, tiles, min_valid: int = 500):
-    nl, pop = read_bands(fp)
-    if pop is None:
-        raise ValueError(f"{fp} is missing population band (band 2).")
+# ----------------------------------------------------------------------------
+# Per-tile statistics, computed in ONE pass over each strip of tile rows
+# ----------------------------------------------------------------------------
+# Every pixel of a strip gets its tile label, and each statistic is an np.bincount over those
+# labels. Quantiles and the within-tile Gini come from fixed-bin per-tile light histograms
+# (count + light sum per bin), so no per-tile sorting or masked copies are needed and memory is
+# bounded by one strip plus (#tiles in the strip x #bins).
 
-    h, w = nl.shape
-    valid = np.isfinite(nl) & np.isfinite(pop) & (nl >= 0) & (pop >= 0)
+# Light histogram edges (nW/cm2/sr): a zero bin, then log-spaced up to the VIIRS saturation range
+LIGHT_BIN_EDGES = np.concatenate([[0.0], np.geomspace(0.05, 5000.0, 64)])
+LIT_THRESHOLD = 0.5
+
+DEFAULT_TILE_STATS = ["mean_light", "mean_pop"]
+TILE_STATS = [
+    "mean_light", "mean_pop", "sum_light", "sum_pop", "std_light",
+    "p50_light", "p90_light", "lit_fraction", "gini_light", "popw_light",
+]
+_HIST_STATS = {"p50_light", "p90_light", "gini_light"}
 
-    rows = []
 
-    # IMPORTANT: stable tile_id comes from enumerate(tiles)
+def tile_row_bands(tiles):
+    """Group tiles by row band: {(r0, r1): [(tile_id, c0, c1), ...]} (tile_id = enumerate index)."""
+    bands = {}
     for idx, (r0, r1, c0, c1) in enumerate(tiles, start=1):
-        # Clip in case dimensions differ slightly year-to-year
-        rr0 = min(r0, h)
-        rr1 = min(r1, h)
-        cc0 = min(c0, w)
-        cc1 = min(c1, w)
+        bands.setdefault((r0, r1), []).append((idx, c0, c1))
+    return bands
+
+
+def strip_windows(row_bands, h: int):
+    """[(band_key, r0, r1)] of the row bands clipped to height h, in reading order."""
+    out = []
+    for (r0, r1) in sorted(row_bands):
+        rr0, rr1 = min(r0, h), min(r1, h)
+        if rr0 < rr1:
+            out.append(((r0, r1), rr0, rr1))
+    return out
+
+
+def read_strip(src, r0: int, r1: int):
+    """(nl, pop) float32 rows r0:r1 of an open dataset, nodata -> NaN."""
+    win = Window(0, r0, src.width, r1 - r0)
+    nl = src.read(1, window=win).astype("float32")
+    pop = src.read(2, window=win).astype("float32")
+    if src.nodata is not None:
+        nl[nl == src.nodata] = np.nan
+        pop[pop == src.nodata] = np.nan
+    return nl, pop
 
-        if rr0 >= rr1 or cc0 >= cc1:
-            continue
 
-        m = valid[rr0:rr1, cc0:cc1]
-        n = int(m.sum())
-        if n < min_valid:
-            continue
+def iter_strips(row_bands, h: int, bands=None, fp: str = None, strips=None):
+    """
+    Yield (band_key, r0, r1, nl_strip, pop_strip) per row band, clipped to height h.
+    From pre-decoded bands (views, no copy), from strips (an iterator of (nl, pop) per
+    strip_windows() entry, e.g. read ahead by prefetch_iter) or by windowed reads of fp
+    (only one strip in memory).
+    """
+    if strips is not None:
+        for key, rr0, rr1 in strip_windows(row_bands, h):
+            nl, pop = next(strips)
+            yield key, rr0, rr1, nl, pop
+        return
+    src = None
+    if bands is None:
+        src = rasterio.open(fp)
+    try:
+        for key, rr0, rr1 in strip_windows(row_bands, h):
+            if src is None:
+                nl, pop = bands
+                yield key, rr0, rr1, nl[rr0:rr1], pop[rr0:rr1]
+            else:
+                yield (key, rr0, rr1) + read_strip(src, rr0, rr1)
+    finally:
+        if src is not None:
+            src.close()
+
+
+def binned_quantile(counts: np.ndarray, q: float, edges=LIGHT_BIN_EDGES) -> np.ndarray:
+    # counts: (n, nbins); linear interpolation inside the bin holding the q-th pixel
+    n = counts.sum(axis=1)
+    cum = np.cumsum(counts, axis=1)
+    target = q * n
+    k = np.argmax(cum >= target[:, None], axis=1)
+    before = np.where(k > 0, cum[np.arange(len(k)), k - 1], 0)
+    inbin = counts[np.arange(len(k)), k]
+    frac = np.where(inbin > 0, (target - before) / np.maximum(inbin, 1), 0.0)
+    lo, hi = edges[k], edges[np.minimum(k + 1, len(edges) - 1)]
+    out = lo + np.clip(frac, 0, 1) * (hi - lo)
+    return np.where(n > 0, out, np.nan)
+
+
+def binned_gini(counts: np.ndarray, sums: np.ndarray) -> np.ndarray:
+    # Gini from grouped data (pixels equal within a bin): 1 - sum (P_k - P_{k-1}) (L_k + L_{k-1})
+    n = counts.sum(axis=-1, keepdims=True).astype(float)
+    tot = sums.sum(axis=-1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        P = np.cumsum(counts, axis=-1) / n
+        L = np.cumsum(sums, axis=-1) / tot
+    dP = np.diff(P, axis=-1, prepend=0.0)
+    L_prev = np.concatenate([np.zeros_like(L[..., :1]), L[..., :-1]], axis=-1)
+    g = 1.0 - (dP * (L + L_prev)).sum(axis=-1)
+    g = np.where(tot[..., 0] > 0, g, 0.0)
+    return np.where(n[..., 0] > 0, g, np.nan)
+
+
+def strip_sums(nl, pop, labels, n_labels: int, stats, lit_threshold: float = LIT_THRESHOLD):
+    """
+    Mergeable per-label sums for one strip. labels: per-column (w,) or per-pixel (rows, w)
+    label array (0 = unlabelled). Sums of several strips can be added (merge_sums) before
+    finalize_stats, so any label raster (tiles, admin zones) goes through the same reduction.
+    """
+    valid = np.isfinite(nl) & np.isfinite(pop) & (nl >= 0) & (pop >= 0)
+    lab = np.broadcast_to(labels, nl.shape)[valid]
+    x = nl[valid].astype(np.float64)
+    p = pop[valid].astype(np.float64)
+
+    out = {
+        "n": np.bincount(lab, minlength=n_labels),
+        "sum_light": np.bincount(lab, weights=x, minlength=n_labels),
+        "sum_pop": np.bincount(lab, weights=p, minlength=n_labels),
+    }
+    if "std_light" in stats:
+        out["ss_light"] = np.bincount(lab, weights=x * x, minlength=n_labels)
+    if "lit_fraction" in stats:
+        out["n_lit"] = np.bincount(lab, weights=(x > lit_threshold), minlength=n_labels)
+    if "popw_light" in stats:
+        out["sum_light_pop"] = np.bincount(lab, weights=x * p, minlength=n_labels)
+
+    if _HIST_STATS & set(stats):
+        nb = len(LIGHT_BIN_EDGES) - 1
+        b = np.clip(np.searchsorted(LIGHT_BIN_EDGES, x, side="right") - 1, 0, nb - 1)
+        key = lab * nb + b
+        out["hist_n"] = np.bincount(key, minlength=n_labels * nb).reshape(n_labels, nb)
+        if "gini_light" in stats:
+            out["hist_light"] = np.bincount(key, weights=x, minlength=n_labels * nb).reshape(n_labels, nb)
+    return out
+
+
+def merge_sums(acc, part):
+    """Add strip_sums() outputs (acc may be None)."""
+    if acc is None:
+        return {k: v.copy() for k, v in part.items()}
+    for k, v in part.items():
+        acc[k] += v
+    return acc
+
+
+def finalize_stats(sums, stats):
+    """Per-label statistics (n plus TILE_STATS entries) from merged strip_sums()."""
+    n = sums["n"].astype(float)
+    out = {"n": sums["n"]}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out["mean_light"] = sums["sum_light"] / n
+        out["mean_pop"] = sums["sum_pop"] / n
+        if "sum_light" in stats:
+            out["sum_light"] = sums["sum_light"]
+        if "sum_pop" in stats:
+            out["sum_pop"] = sums["sum_pop"]
+        if "std_light" in stats:
+            out["std_light"] = np.sqrt(np.maximum(sums["ss_light"] / n - out["mean_light"] ** 2, 0))
+        if "lit_fraction" in stats:
+            out["lit_fraction"] = sums["n_lit"] / n
+        if "popw_light" in stats:
+            out["popw_light"] = sums["sum_light_pop"] / sums["sum_pop"]
+    if "p50_light" in stats:
+        out["p50_light"] = binned_quantile(sums["hist_n"], 0.5)
+    if "p90_light" in stats:
+        out["p90_light"] = binned_quantile(sums["hist_n"], 0.9)
+    if "gini_light" in stats:
+        out["gini_light"] = binned_gini(sums["hist_n"], sums["hist_light"])
+    return out
+
+
+def reduce_strip(nl, pop, col_label, n_labels: int, stats, lit_threshold: float = LIT_THRESHOLD):
+    """Per-label statistics for one strip. col_label: (w,) tile label per column (0 = no tile)."""
+    return finalize_stats(strip_sums(nl, pop, col_label, n_labels, stats, lit_threshold), stats)
+
+
+def build_tile_table(country: str, year: int, fp: str, tiles, min_valid: int = 500, bands=None,
+                     stats=None, lit_threshold: float = LIT_THRESHOLD, strips=None):
+    # bands: optional pre-decoded (nl, pop), e.g. from a week5_datacube.DataCube;
+    # without it the file is streamed strip by strip (never fully decoded).
+    # strips: optional iterator of (nl, pop) per strip_windows() entry of fp, read ahead elsewhere.
+    # stats: per-tile statistics to keep (see TILE_STATS); mean_light/mean_pop are always kept.
+    stats = list(dict.fromkeys(DEFAULT_TILE_STATS + list(stats or [])))
+    unknown = [s for s in stats if s not in TILE_STATS]
+    if unknown:
+        raise ValueError(f"Unknown tile stats {unknown}. Choose from {TILE_STATS}")
+
+    if bands is not None:
+        nl, pop = bands
+        if pop is None:
+            raise ValueError(f"{fp} is missing population band (band 2).")
+        h, w = nl.shape
+    else:
+        with rasterio.open(fp) as src:
+            h, w = src.height, src.width
+            if src.count < 2:
+                raise ValueError(f"{fp} is missing population band (band 2).")
 
-        nl_block = nl[rr0:rr1, cc0:cc1][m]
-        pop_block = pop[rr0:rr1, cc0:cc1][m]
+    row_bands = tile_row_bands(tiles)
+    rows = []
+    # Grid tile size (the first tile is clipped on at most one axis unless it is the only tile),
+    # stored per row so grid coordinates never depend on which edge tiles survive min_valid
+    tile_size = max(tiles[0][1] - tiles[0][0], tiles[0][3] - tiles[0][2])
+
+    for key, rr0, rr1, nl_s, pop_s in iter_strips(row_bands, h, bands=bands, fp=fp, strips=strips):
+        band_tiles = row_bands[key]
+
+        # Clip in case dimensions differ slightly year-to-year; label 0 = outside any tile
+        col_label = np.zeros(w, dtype=np.int64)
+        kept = []
+        for j, (idx, c0, c1) in enumerate(band_tiles, start=1):
+            cc0, cc1 = min(c0, w), min(c1, w)
+            if cc0 >= cc1:
+                continue
+            col_label[cc0:cc1] = j
+            kept.append((j, idx, cc0, cc1))
 
-        rows.append({
-            "country": country,
-            "year": year,
-            "tile_id": idx,  # <-- stable across years
-            "r0": rr0, "r1": rr1, "c0": cc0, "c1": cc1,
-            "n_valid_pixels": n,
-            "mean_light": float(np.nanmean(nl_block)),
-            "mean_pop": float(np.nanmean(pop_block)),
-        })
+        red = reduce_strip(nl_s, pop_s, col_label, len(band_tiles) + 1, stats, lit_threshold)
+
+        # IMPORTANT: stable tile_id comes from enumerate(tiles)
+        for j, idx, cc0, cc1 in kept:
+            n = int(red["n"][j])
+            if n < min_valid:
+                continue
+            row = {
+                "country": country,
+                "year": year,
+                "tile_id": idx,  # <-- stable across years
+                "r0": rr0, "r1": rr1, "c0": cc0, "c1": cc1, "tile_size": tile_size,
+                "n_valid_pixels": n,
+            }
+            for s in stats:
+                row[s] = float(red[s][j])
+            rows.append(row)
 
     df = pd.DataFrame(rows)
     if df.empty:
@@ -143,19 +378,42 @@ def build_tile_table(country: str, year: int, fp: str, tiles, min_valid: int = 5
             f"No tiles produced for {country} {year}. "
             f"Try lowering --min_valid (currently {min_valid})."
         )
+    df = df.sort_values("tile_id", kind="stable").reset_index(drop=True)
 
     # Compute quantiles on produced tiles for this country-year
     nl_q = np.nanquantile(df["mean_light"].values, [0.25, 0.5, 0.75])
     pop_q = np.nanquantile(df["mean_pop"].values, [0.25, 0.5, 0.75])
 
-    df["region_type"] = [classify(a, b, nl_q, pop_q) for a, b in zip(df["mean_light"], df["mean_pop"])]
+    codes = classify_codes(df["mean_light"], df["mean_pop"], nl_q[0], nl_q[2], pop_q[0], pop_q[2])
+    df["region_type"] = pd.Categorical.from_codes(codes, categories=REGION_TYPES, ordered=True)
     df["log_light"] = np.log1p(df["mean_light"].clip(lower=0))
     df["log_pop"] = np.log1p(df["mean_pop"].clip(lower=0))
-    df["region_type"] = pd.Categorical(df["region_type"], categories=REGION_TYPES, ordered=True)
 
     return df
 
 
+def prefetch_iter(load, items, depth: int, pool):
+    """
+    Yield (item, load(item)) in order. While the caller works on item N, the I/O pool is
+    already decoding items N+1 .. N+depth (rasterio/GDAL release the GIL while decoding).
+    depth=0 or pool=None -> plain serial loop.
+    """
+    if depth <= 0 or pool is None:
+        for item in items:
+            yield item, load(item)
+        return
+
+    it = iter(items)
+    pending = deque((x, pool.submit(load, x)) for x in itertools.islice(it, depth))
+    while pending:
+        item, fut = pending.popleft()
+        result = fut.result()
+        nxt = next(it, None)
+        if nxt is not None:
+            pending.append((nxt, pool.submit(load, nxt)))
+        yield item, result
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--data_path", required=True, help="Root folder containing subfolders: Morocco/, Brazil/, China/")
@@ -164,6 +422,16 @@ def main():
     ap.add_argument("--start_year", type=int, default=2014)
     ap.add_argument("--end_year", type=int, default=2023)
     ap.add_argument("--min_valid", type=int, default=500, help="Minimum valid pixels per tile (default 500)")
+    ap.add_argument("--cube_dir", default=None,
+                    help="Folder with <Country>_cube.tif from week5_datacube.py; used instead of the yearly TIFFs when present")
+    ap.add_argument("--tile_stats", default="",
+                    help=f"Extra per-tile statistics (comma-separated) from: {','.join(TILE_STATS)}")
+    ap.add_argument("--lit_threshold", type=float, default=LIT_THRESHOLD,
+                    help="Radiance above which a pixel counts as lit (lit_fraction)")
+    ap.add_argument("--prefetch", type=int, default=1,
+                    help="Strips (cube: years) read ahead in background threads while the current one is reduced (0 = serial)")
+    ap.add_argument("--catalog", default=None,
+                    help="Header-only raster catalog (default: <data_path>/raster_catalog.json, refreshed on start)")
     args = ap.parse_args()
 
     data_path = args.data_path
@@ -171,10 +439,28 @@ def main():
     os.makedirs(out_dir, exist_ok=True)
 
     countries = [c.strip() for c in args.countries.split(",") if c.strip()]
+    tile_stats = [s.strip() for s in args.tile_stats.split(",") if s.strip()]
     panel_parts = []
 
+    # Year discovery, reference grid and shape checks come from raster headers (no pixel decoding)
+    catalog, cat_stats = raster_catalog.refresh(data_path, args.catalog, countries)
+    print(f"Raster catalog: {cat_stats}")
+
+    # Bounded read-ahead pool for decoding + one background thread for CSV writes
+    io_pool = ThreadPoolExecutor(max_workers=args.prefetch) if args.prefetch > 0 else None
+    writer = ThreadPoolExecutor(max_workers=1)
+    writes = []
+
     for country in countries:
-        available = find_years(data_path, country)
+        cube_shape = None
+        cube_fp = os.path.join(args.cube_dir, f"{country}_cube.tif") if args.cube_dir else None
+        if cube_fp and os.path.exists(cube_fp):
+            from week5_datacube import DataCube
+            with DataCube(cube_fp) as cube:
+                available, cube_shape = cube.years, cube.shape
+        else:
+            cube_fp = None
+            available = raster_catalog.catalog_years(catalog, country)
         use_years = [y for y in available if args.start_year <= y <= args.end_year]
         if not use_years:
             print(f"[WARN] No years found for {country} in range {args.start_year}-{args.end_year}")
@@ -182,35 +468,66 @@ def main():
 
         # Reference year defines the stable tile grid for this country
         ref_year = use_years[0]
-        ref_fp = os.path.join(data_path, country, f"{country}_{ref_year}.tif")
-        if not os.path.exists(ref_fp):
-            print(f"[WARN] Missing reference file: {ref_fp}")
-            continue
-
-        nl_ref, _ = read_bands(ref_fp)
-        h_ref, w_ref = nl_ref.shape
+        if cube_shape is not None:
+            h_ref, w_ref = cube_shape
+        else:
+            ref = raster_catalog.entries(catalog, country)[ref_year]
+            h_ref, w_ref = ref["height"], ref["width"]
+            for y, shape in raster_catalog.shape_mismatches(catalog, country, use_years, ref_year):
+                print(f"[WARN] {country} {y}: shape {shape[0]}x{shape[1]} differs from {ref_year}; tiles are clipped")
         tile_size = choose_tile_size(h_ref, w_ref, country)
         tiles = make_tiles(h_ref, w_ref, tile_size)
 
         print(f"{country}: ref_year={ref_year}, shape={h_ref}x{w_ref}, tile_size={tile_size}, tiles_total={len(tiles)}")
 
-        for year in use_years:
+        if cube_fp is not None:
+            def load(year, cube_fp=cube_fp):
+                # Runs in the I/O pool; rasterio handles are not shared between threads
+                with DataCube(cube_fp) as c:
+                    return c.read_bands(year)
+            year_bands = prefetch_iter(load, use_years, args.prefetch, io_pool)
+        else:
+            # Yearly TIFFs: one flat queue of (year, strip) reads, so read-ahead crosses year boundaries
+            year_bands = ((year, None) for year in use_years)
+            row_bands = tile_row_bands(tiles)
+            ent = raster_catalog.entries(catalog, country)
+            windows = [(year, rr0, rr1) for year in use_years
+                       if os.path.exists(os.path.join(data_path, country, f"{country}_{year}.tif"))
+                       for _, rr0, rr1 in strip_windows(row_bands, ent[year]["height"])]
+
+            def load_strip(item, country=country):
+                year, rr0, rr1 = item
+                with rasterio.open(os.path.join(data_path, country, f"{country}_{year}.tif")) as src:
+                    return read_strip(src, rr0, rr1)
+            strip_stream = (b for _, b in prefetch_iter(load_strip, windows, args.prefetch, io_pool))
+
+        for year, bands in year_bands:
             fp = os.path.join(data_path, country, f"{country}_{year}.tif")
-            if not os.path.exists(fp):
+            if bands is None and not os.path.exists(fp):
                 print(f"[WARN] missing {fp}")
                 continue
-
-            df = build_tile_table(country, year, fp, tiles, min_valid=args.min_valid)
+            df = build_tile_table(country, year, fp, tiles, min_valid=args.min_valid, bands=bands,
+                                  stats=tile_stats, lit_threshold=args.lit_threshold,
+                                  strips=strip_stream if bands is None else None)
+            del bands
             out_csv = os.path.join(out_dir, f"tiles_{country}_{year}.csv")
-            df.to_csv(out_csv, index=False)
+            writes.append(writer.submit(df.to_csv, out_csv, index=False))
             panel_parts.append(df)
 
             print(f"  {year}: n_tiles={len(df)} -> {os.path.basename(out_csv)}")
 
+    if io_pool is not None:
+        io_pool.shutdown()
+
     if panel_parts:
         panel = pd.concat(panel_parts, ignore_index=True)
         panel_path = os.path.join(out_dir, f"tiles_panel_all_countries_{args.start_year}-{args.end_year}.csv")
-        panel.to_csv(panel_path, index=False)
+        writes.append(writer.submit(panel.to_csv, panel_path, index=False))
+    writer.shutdown(wait=True)
+    for w in writes:
+        w.result()  # surface write errors
+
+    if panel_parts:
         print("\nSaved panel:", panel_path)
     else:
         print("No tiles produced. Check that file names match <Country>_<Year>.tif inside each country folder.")
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# week6_change_detection.py
+#
+# Pixel-level change detection between consecutive years, aggregated to tiles.
+#
+# Every pixel of every year pair (N, N+1) is classified from its nightlight values:
+#
+#   newly_lit    light_N <= --lit_threshold  <  light_N+1
+#   went_dark    light_N  > --lit_threshold >= light_N+1
+#   brightened   lit both years, light_N+1 >= light_N * (1 + --rel_change) and +--abs_change or more
+#   dimmed       lit both years, light_N+1 <= light_N / (1 + --rel_change) and ---abs_change or more
+#   stable       anything else (0);  nodata in either year -> 255
+#
+# A country's whole decade is done in ONE pass over the rows: for each strip of tile rows the
+# strip is read from year 1, 2, ... in turn (all yearly files stay open), and only the previous
+# and current year's strip are in memory. Per-tile class counts are one bincount per strip and
+# pair; with --write_raster the class codes also go, window by window, into a uint8 deflate
+# GeoTIFF with one band per year pair.
+#
+# Outputs (written to --out_dir):
+#   tiles_change_counts.csv          country, year_from, year_to, tile_id, n_compared, n_newly_lit,
+#                                    n_went_dark, n_brightened, n_dimmed
+#   change_<Country>.tif             (with --write_raster) band k = pair k, descriptions
+#                                    "<year_from>-<year_to>"; codes 0-4 as above, 255 = nodata
+#
+# Run:
+#   python scripts/week6_change_detection.py --data_path data/week_5_robustness_tif_images \
+#       --out_dir figures/week6_outputs/change [--write_raster] [--cube_dir data/cubes]
+
+import os, argparse, time
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.windows import Window
+
+import raster_catalog
+from week6_build_tiles_all_years import LIT_THRESHOLD, choose_tile_size, make_tiles, tile_row_bands
+
+CHANGE_CLASSES = ["stable", "newly_lit", "went_dark", "brightened", "dimmed"]
+NODATA_CODE = 255
+
+
+def classify_change(prev, cur, lit_threshold: float = LIT_THRESHOLD, rel_change: float = 0.5,
+                    abs_change: float = 0.5) -> np.ndarray:
+    """uint8 change code per pixel (index into CHANGE_CLASSES, NODATA_CODE if either year is missing)."""
+    lit0, lit1 = prev > lit_threshold, cur > lit_threshold
+    both = lit0 & lit1
+    diff = cur - prev
+    code = np.zeros(prev.shape, dtype=np.uint8)
+    code[~lit0 & lit1] = 1
+    code[lit0 & ~lit1] = 2
+    code[both & (cur >= prev * (1 + rel_change)) & (diff >= abs_change)] = 3
+    code[both & (cur * (1 + rel_change) <= prev) & (diff <= -abs_change)] = 4
+    code[~(np.isfinite(prev) & np.isfinite(cur))] = NODATA_CODE
+    return code
+
+
+class YearStrips:
+    """Light-band strips (r0:r1, full reference width) of one country-year from its TIFF or the cube."""
+
+    def __init__(self, width: int, fp: str = None, cube=None, year: int = None):
+        self.width, self.cube, self.year = width, cube, year
+        self.src = rasterio.open(fp) if cube is None else None
+
+    def read(self, r0: int, r1: int) -> np.ndarray:
+        if self.cube is not None:
+            return self.cube.strip(self.year, r0, r1, ["light"])[0].astype(np.float32)
+        out = np.full((r1 - r0, self.width), np.nan, dtype=np.float32)
+        h, w = min(r1, self.src.height), min(self.width, self.src.width)
+        if r0 < h:
+            arr = self.src.read(1, window=Window(0, r0, w, h - r0), out_dtype="float32")
+            if self.src.nodata is not None and not np.isnan(self.src.nodata):
+                arr[arr == self.src.nodata] = np.nan
+            out[: h - r0, :w] = arr
+        return out
+
+    def close(self):
+        if self.src is not None:
+            self.src.close()
+
+
+def country_changes(country, readers: dict, shape, tile_size, thresholds: dict, dst=None):
+    """Per-tile change counts for every consecutive year pair, streaming strip by strip."""
+    h, w = shape
+    years = sorted(readers)
+    pairs = list(zip(years[:-1], years[1:]))
+    row_bands = tile_row_bands(make_tiles(h, w, tile_size))
+    n_cls = len(CHANGE_CLASSES) + 1                        # + nodata bucket
+    tile_ids = np.array([idx for key in sorted(row_bands) for idx, _, _ in row_bands[key]])
+    counts = np.zeros((len(pairs), int(tile_ids.max()) + 1, n_cls), dtype=np.int64)
+
+    for r0, r1 in sorted(row_bands):
+        col_tile = np.zeros(w, dtype=np.int64)
+        for idx, c0, c1 in row_bands[(r0, r1)]:
+            col_tile[c0:c1] = idx
+        lab = np.broadcast_to(col_tile, (r1 - r0, w)).ravel()
+
+        prev = readers[years[0]].read(r0, r1)
+        for k, (y0, y1) in enumerate(pairs):
+            cur = readers[y1].read(r0, r1)
+            code = classify_change(prev, cur, **thresholds)
+            cls = np.where(code == NODATA_CODE, n_cls - 1, code).ravel()
+            counts[k] += np.bincount(lab * n_cls + cls, minlength=counts.shape[1] * n_cls).reshape(-1, n_cls)
+            if dst is not None:
+                dst.write(code, k + 1, window=Window(0, r0, w, r1 - r0))
+            prev = cur
+
+    rows = []
+    for k, (y0, y1) in enumerate(pairs):
+        c = counts[k, tile_ids]
+        rows.append(pd.DataFrame({
+            "country": country, "year_from": y0, "year_to": y1, "tile_id": tile_ids,
+            "n_compared": c[:, :-1].sum(axis=1),
+            **{f"n_{name}": c[:, i] for i, name in enumerate(CHANGE_CLASSES) if i > 0},
+        }))
+    return pd.concat(rows, ignore_index=True), pairs
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data_path", required=True, help="Root folder containing <Country>/<Country>_<Year>.tif")
+    ap.add_argument("--out_dir", default="figures/week6_outputs/change")
+    ap.add_argument("--cube_dir", default=None, help="Folder with <Country>_cube.tif (used when present)")
+    ap.add_argument("--countries", default="Morocco,Brazil,China", help="Comma-separated list")
+    ap.add_argument("--start_year", type=int, default=2014)
+    ap.add_argument("--end_year", type=int, default=2023)
+    ap.add_argument("--lit_threshold", type=float, default=LIT_THRESHOLD, help="Radiance above which a pixel is lit")
+    ap.add_argument("--rel_change", type=float, default=0.5, help="Relative change for brightened / dimmed")
+    ap.add_argument("--abs_change", type=float, default=0.5, help="Minimum absolute change for brightened / dimmed")
+    ap.add_argument("--write_raster", action="store_true", help="Also write change_<Country>.tif (uint8, deflate)")
+    args = ap.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    thresholds = {"lit_threshold": args.lit_threshold, "rel_change": args.rel_change, "abs_change": args.abs_change}
+    countries = [c.strip() for c in args.countries.split(",") if c.strip()]
+    catalog, _ = raster_catalog.refresh(args.data_path, countries=countries)
+    parts = []
+
+    for country in countries:
+        t0 = time.perf_counter()
+        cube = None
+        cube_fp = os.path.join(args.cube_dir, f"{country}_cube.tif") if args.cube_dir else None
+        if cube_fp and os.path.exists(cube_fp):
+            from week5_datacube import DataCube
+            cube = DataCube(cube_fp)
+            years = [y for y in cube.years if args.start_year <= y <= args.end_year]
+            shape, transform, crs = cube.shape, cube.transform, cube.ds.crs
+        else:
+            ent = raster_catalog.entries(catalog, country)
+            years = [y for y in sorted(ent) if args.start_year <= y <= args.end_year]
+            if not years:
+                print(f"[WARN] No rasters for {country} in {args.start_year}-{args.end_year}")
+                continue
+            ref = ent[years[0]]
+            shape, transform, crs = (ref["height"], ref["width"]), rasterio.Affine(*ref["transform"]), ref["crs"]
+            for y, s in raster_catalog.shape_mismatches(catalog, country, years, years[0]):
+                print(f"[WARN] {country} {y}: shape {s[0]}x{s[1]} differs from {years[0]}; compared on the overlap")
+        if len(years) < 2:
+            print(f"[WARN] {country}: fewer than two years, nothing to compare")
+            if cube is not None:
+                cube.close()
+            continue
+        if cube is not None:
+            readers = {y: YearStrips(shape[1], cube=cube, year=y) for y in years}
+        else:
+            readers = {y: YearStrips(shape[1], fp=os.path.join(args.data_path, country, f"{country}_{y}.tif"))
+                       for y in years}
+
+        tile_size = choose_tile_size(*shape, country)
+        dst = None
+        if args.write_raster:
+            dst = rasterio.open(
+                os.path.join(args.out_dir, f"change_{country}.tif"), "w", driver="GTiff",
+                height=shape[0], width=shape[1], count=len(years) - 1, dtype="uint8", nodata=NODATA_CODE,
+                transform=transform, crs=crs, compress="deflate", tiled=True, blockxsize=256, blockysize=256)
+        try:
+            df, pairs = country_changes(country, readers, shape, tile_size, thresholds, dst)
+            if dst is not None:
+                for k, (y0, y1) in enumerate(pairs):
+                    dst.set_band_description(k + 1, f"{y0}-{y1}")
+        finally:
+            if dst is not None:
+                dst.close()
+            for r in readers.values():
+                r.close()
+            if cube is not None:
+                cube.close()
+
+        parts.append(df)
+        tot = df.groupby(["year_from", "year_to"])[[f"n_{c}" for c in CHANGE_CLASSES[1:]]].sum()
+        print(f"{country}: {len(pairs)} year pairs, {df['tile_id'].nunique()} tiles ({time.perf_counter() - t0:.1f}s)")
+        print(tot.to_string())
+
+    if not parts:
+        print("[WARN] nothing to write")
+        return
+    out_fp = os.path.join(args.out_dir, "tiles_change_counts.csv")
+    pd.concat(parts, ignore_index=True).to_csv(out_fp, index=False)
+    print("Saved:", out_fp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# week6_cost_distance.py
+#
+# Cost-distance accessibility: accumulated travel cost from the nearest urban_core tile over
+# a friction surface built from light and population, instead of the straight-line
+# distance_to_urban_core of week6_add_geographic_infrastructure.py.
+#
+#   1. each year's raster is read DOWNSAMPLED by --factor (GDAL average resampling inside
+#      rasterio.read(out_shape=...), so full-resolution bands are never decoded into memory)
+#   2. friction per coarse cell:   f = 1 / (1 + w_light * log1p(light) + w_pop * log1p(pop))
+#      i.e. 1 on dark, empty land and cheaper along lit / populated corridors; nodata is impassable
+#   3. 8-connected grid graph, edge cost = step length (pixels) x mean friction of its two cells
+#   4. multi-source Dijkstra from every cell inside an urban_core tile at once
+#      (scipy.sparse.csgraph.dijkstra, min_only=True): O(E log V) for the whole country
+#   5. per-tile accessibility = mean accumulated cost over the tile's cells (one bincount)
+#
+# Costs are in "dark-land pixel" units, directly comparable to distance_to_urban_core.
+# The graph topology is built once per country; each year only re-weights the edges.
+#
+# Outputs (written to --out_dir):
+#   tiles_cost_distance.csv        country, year, tile_id, cost_distance_to_urban_core,
+#                                  log_cost_distance_to_urban
+#   cost_surface_<Country>.npz     years, cost (Y, H/factor, W/factor, float32), factor
+#
+# Run:
+#   python scripts/week6_cost_distance.py --data_path data/week_5_robustness_tif_images \
+#       --panel figures/week6_outputs/tiles_panel_all_countries_2014-2023.csv \
+#       --out_dir figures/week6_outputs/cost_distance [--cube_dir data/cubes]
+
+import os, argparse, time
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.enums import Resampling
+from scipy import sparse
+from scipy.sparse.csgraph import dijkstra
+
+from spatial_weights import grid_coords
+
+# forward half of the 8-neighbourhood; the graph is symmetric
+STEPS = [(0, 1), (1, 0), (1, 1), (1, -1)]
+
+
+def read_coarse(src, indexes, factor: int):
+    """Average-resampled (len(indexes), ceil(h/factor), ceil(w/factor)) float32 read, NaN for nodata."""
+    shape = (len(indexes), -(-src.height // factor), -(-src.width // factor))
+    arr = src.read(indexes, out_shape=shape, resampling=Resampling.average).astype("float32")
+    if src.nodata is not None and not np.isnan(src.nodata):
+        arr[arr == src.nodata] = np.nan
+    return arr
+
+
+def grid_graph(valid: np.ndarray):
+    """Edge list (u, v, step length in cells) of the 8-connected graph over valid cells."""
+    H, W = valid.shape
+    node = np.full((H, W), -1, dtype=np.int64)
+    node[valid] = np.arange(int(valid.sum()))
+    us, vs, lens = [], [], []
+    for dr, dc in STEPS:
+        a = node[max(0, -dr):H - max(0, dr), max(0, -dc):W - max(0, dc)]
+        b = node[max(0, dr):H - max(0, -dr), max(0, dc):W - max(0, -dc)]
+        ok = (a >= 0) & (b >= 0)
+        us.append(a[ok])
+        vs.append(b[ok])
+        lens.append(np.full(int(ok.sum()), np.hypot(dr, dc)))
+    return node, np.concatenate(us), np.concatenate(vs), np.concatenate(lens)
+
+
+def friction(light, pop, w_light: float = 1.0, w_pop: float = 0.5):
+    return 1.0 / (1.0 + w_light * np.log1p(np.clip(light, 0, None)) + w_pop * np.log1p(np.clip(pop, 0, None)))
+
+
+def accumulated_cost(f_nodes, u, v, step_len, sources, cell_px: float):
+    """Multi-source Dijkstra; returns the accumulated cost per node (inf if unreachable)."""
+    n = len(f_nodes)
+    w = step_len * cell_px * 0.5 * (f_nodes[u] + f_nodes[v])
+    G = sparse.csr_matrix((np.r_[w, w], (np.r_[u, v], np.r_[v, u])), shape=(n, n))
+    return dijkstra(G, directed=False, indices=sources, min_only=True)
+
+
+def cell_tiles(df, tile_size, shape, full_shape):
+    """Row position in df of the tile containing each coarse cell centre (-1 = no tile)."""
+    gr, gc, _ = grid_coords(df, tile_size)
+    lookup = np.full((int(gr.max()) + 1, int(gc.max()) + 1), -1, dtype=np.int64)
+    lookup[gr, gc] = np.arange(len(df))
+
+    H, W = shape
+    h, w = full_shape
+    rows = ((np.arange(H) + 0.5) * h / H).astype(np.int64) // tile_size
+    cols = ((np.arange(W) + 0.5) * w / W).astype(np.int64) // tile_size
+    rr, cc = np.meshgrid(np.minimum(rows, lookup.shape[0] - 1), np.minimum(cols, lookup.shape[1] - 1),
+                         indexing="ij")
+    out = lookup[rr, cc]
+    out[(rows[:, None] >= lookup.shape[0]) | (cols[None, :] >= lookup.shape[1])] = -1
+    return out
+
+
+def country_cost_distance(country, cdf, open_year, factor=16, w_light=1.0, w_pop=0.5):
+    """Yields (year, tile frame, coarse cost surface) for every year of one country."""
+    _, _, tile_size = grid_coords(cdf)
+    topo = None
+    for year, df in cdf.groupby("year", sort=True):
+        src, indexes = open_year(int(year))
+        if src is None:
+            print(f"[WARN] no raster for {country} {year}, skipping")
+            continue
+        with src:
+            light, pop = read_coarse(src, indexes, factor)
+            full_shape = (src.height, src.width)
+
+        valid = np.isfinite(light)
+        if topo is None or topo[0].shape != valid.shape or not np.array_equal(topo[0] >= 0, valid):
+            topo = grid_graph(valid)                       # rebuilt only if the valid mask changes
+        node, u, v, step_len = topo
+
+        cell_px = full_shape[0] / light.shape[0]           # pixels per coarse cell
+        f = friction(light, np.nan_to_num(pop), w_light, w_pop)[valid]
+        owner = cell_tiles(df, tile_size, light.shape, full_shape)
+
+        urban = (df["region_type"] == "urban_core").to_numpy()
+        src_cells = node[(owner >= 0) & valid & urban[np.maximum(owner, 0)]]
+        src_cells = src_cells[src_cells >= 0]
+
+        cost = np.full(light.shape, np.nan)
+        if len(src_cells):
+            d = accumulated_cost(f, u, v, step_len, src_cells, cell_px)
+            cost[valid] = np.where(np.isfinite(d), d, np.nan)
+
+        # mean accumulated cost per tile over its reachable cells
+        sel = (owner >= 0) & np.isfinite(cost)
+        n = np.bincount(owner[sel], minlength=len(df))
+        s = np.bincount(owner[sel], weights=cost[sel], minlength=len(df))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            tile_cost = np.where(n > 0, s / n, np.nan)
+
+        tiles = pd.DataFrame({
+            "country": country, "year": int(year), "tile_id": df["tile_id"].to_numpy(),
+            "cost_distance_to_urban_core": tile_cost,
+            "log_cost_distance_to_urban": np.log1p(tile_cost),
+        })
+        yield int(year), tiles, cost.astype(np.float32)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data_path", required=True, help="Root folder containing <Country>/<Country>_<Year>.tif")
+    ap.add_argument("--panel", required=True, help="Tile panel with r0/r1/c0/c1 and region_type")
+    ap.add_argument("--out_dir", default=None, help="Output folder (default: <panel dir>/cost_distance)")
+    ap.add_argument("--cube_dir", default=None, help="Folder with <Country>_cube.tif (used when present)")
+    ap.add_argument("--factor", type=int, default=16, help="Downsampling factor (pixels per coarse cell side)")
+    ap.add_argument("--w_light", type=float, default=1.0, help="Friction reduction per log1p(light)")
+    ap.add_argument("--w_pop", type=float, default=0.5, help="Friction reduction per log1p(pop)")
+    args = ap.parse_args()
+
+    out_dir = args.out_dir or os.path.join(os.path.dirname(os.path.abspath(args.panel)), "cost_distance")
+    os.makedirs(out_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    panel = pd.read_csv(args.panel, usecols=["country", "year", "tile_id", "r0", "r1", "c0", "c1", "region_type"])
+    parts = []
+    for country, cdf in panel.groupby("country", sort=True):
+        cube_fp = os.path.join(args.cube_dir, f"{country}_cube.tif") if args.cube_dir else None
+        if cube_fp and os.path.exists(cube_fp):
+            from week5_datacube import DataCube
+            with DataCube(cube_fp) as cube:
+                cube_years = set(cube.years)
+                band_of = {y: (cube.band_index(y, "light"), cube.band_index(y, "pop")) for y in cube.years}
+        else:
+            cube_fp = None
+
+        def open_year(year, country=country, cube_fp=cube_fp):
+            if cube_fp is not None and year in cube_years:
+                return rasterio.open(cube_fp), list(band_of[year])
+            fp = os.path.join(args.data_path, country, f"{country}_{year}.tif")
+            return (rasterio.open(fp), [1, 2]) if os.path.exists(fp) else (None, None)
+
+        years, surfaces = [], []
+        for year, tiles, cost in country_cost_distance(country, cdf, open_year, args.factor,
+                                                       args.w_light, args.w_pop):
+            parts.append(tiles)
+            years.append(year)
+            surfaces.append(cost)
+            print(f"  {country} {year}: median tile cost {np.nanmedian(tiles['cost_distance_to_urban_core']):.0f} px "
+                  f"({time.perf_counter() - t0:.1f}s)")
+
+        if surfaces and len({s.shape for s in surfaces}) == 1:
+            np.savez_compressed(os.path.join(out_dir, f"cost_surface_{country}.npz"),
+                                years=np.asarray(years, dtype=np.int16), cost=np.stack(surfaces),
+                                factor=args.factor)
+
+    if not parts:
+        print("[WARN] no rasters found, nothing written")
+        return
+    out = pd.concat(parts, ignore_index=True)
+    out.to_csv(os.path.join(out_dir, "tiles_cost_distance.csv"), index=False)
+    print(f"\nSaved {len(out):,} tile-years -> {out_dir} ({time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# week6_inequality.py
+#
+# Electrification inequality: Gini, Theil (within / between regime decomposition) and Lorenz
+# curves, at pixel level (streamed rasters) and tile level (panel), for three measures:
+#
+#   light             x = radiance,                 one unit per pixel / tile
+#   popw_light        x = radiance,                 weighted by population (what people see)
+#   light_per_capita  x = radiance / population,    weighted by population (pixels with pop > 0)
+#
+# Everything is computed from MERGEABLE fixed-bin histograms. Per (regime group, bin) we keep the
+# total weight W and the total weighted value S, and per group the exact sums (W, S, sum w*x*ln x):
+#
+#   Gini    grouped-data Gini over the bins (binned_gini of the tiling pass)
+#   Theil   T = sum(w x ln x) / S - ln(S / W)  exactly, and T = within + between with
+#           within = sum_g s_g T_g,  between = sum_g s_g ln(mu_g / mu),  s_g = S_g / S
+#   Lorenz  piecewise-linear through the cumulative (W, S) bin shares
+#
+# Histograms of strips, years or countries are combined by plain addition, so each country-year
+# costs one streamed pass over its raster (iter_strips / DataCube.strip) and pooled results
+# (country over all years, all countries per year) come from summing histograms. The raw
+# histograms are saved so further pools can be formed later without touching the rasters.
+#
+# Pixel groups are the region_type of the pixel's tile that year ("no_tile" for pixels of tiles
+# that are not in the panel).
+#
+# Outputs (written to --out_dir):
+#   inequality.csv       level, measure, country, year, weight_total, mean, gini, theil,
+#                        theil_within, theil_between, bottom40_share, top10_share, palma
+#   lorenz.csv           level, measure, country, year, p, lorenz
+#   inequality_hist.npz  "<level>|<measure>|<country>|<year>|W,S,G" arrays (mergeable histograms)
+#
+# Run:
+#   python scripts/week6_inequality.py --data_path data/week_5_robustness_tif_images \
+#       --panel figures/week6_outputs/tiles_panel_all_countries_2014-2023.csv \
+#       --out_dir figures/week6_outputs/inequality [--cube_dir data/cubes]
+
+import os, argparse, time
+import numpy as np
+import pandas as pd
+import rasterio
+
+from spatial_weights import grid_coords
+from week6_build_tiles_all_years import (
+    REGION_TYPES, LIGHT_BIN_EDGES, binned_gini, choose_tile_size, iter_strips, make_tiles, tile_row_bands,
+)
+
+GROUPS = REGION_TYPES + ["no_tile"]
+PER_CAPITA_BIN_EDGES = np.concatenate([[0.0], np.geomspace(1e-6, 1e4, 160)])
+MEASURES = {
+    "light": LIGHT_BIN_EDGES,
+    "popw_light": LIGHT_BIN_EDGES,
+    "light_per_capita": PER_CAPITA_BIN_EDGES,
+}
+LORENZ_P = np.linspace(0, 1, 21)
+
+
+def empty_hist(edges) -> dict:
+    nb = len(edges) - 1
+    return {"W": np.zeros((len(GROUPS), nb)), "S": np.zeros((len(GROUPS), nb)), "G": np.zeros(len(GROUPS))}
+
+
+def accumulate(h: dict, x, w, group, edges):
+    """Add values x with weights w and group codes into histogram h (in place)."""
+    nb = len(edges) - 1
+    b = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, nb - 1)
+    key = group * nb + b
+    wx = w * x
+    h["W"] += np.bincount(key, weights=w, minlength=len(GROUPS) * nb).reshape(len(GROUPS), nb)
+    h["S"] += np.bincount(key, weights=wx, minlength=len(GROUPS) * nb).reshape(len(GROUPS), nb)
+    pos = x > 0                                  # x ln x -> 0 as x -> 0
+    h["G"] += np.bincount(group[pos], weights=wx[pos] * np.log(x[pos]), minlength=len(GROUPS))
+    return h
+
+
+def merge_hists(hists):
+    out = None
+    for h in hists:
+        out = {k: v.copy() for k, v in h.items()} if out is None else {k: out[k] + h[k] for k in out}
+    return out
+
+
+def measure_values(light, pop, weight=None):
+    """
+    {measure: (x, w, mask)} for pixels or tiles: light and pop are per-pixel values (tile means
+    for tiles), weight the population of the unit (default pop, i.e. one pixel).
+    """
+    weight = pop if weight is None else weight
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pc = light / pop
+    return {
+        "light": (light, np.ones_like(light), np.ones(light.shape, dtype=bool)),
+        "popw_light": (light, weight, weight > 0),
+        "light_per_capita": (pc, weight, pop > 0),
+    }
+
+
+def theil_parts(h):
+    """(T, within, between) from the exact per-group sums."""
+    Wg, Sg, Gg = h["W"].sum(axis=1), h["S"].sum(axis=1), h["G"]
+    W, S, G = Wg.sum(), Sg.sum(), Gg.sum()
+    if S <= 0:
+        return np.nan, np.nan, np.nan
+    mu = S / W
+    T = G / S - np.log(mu)
+    ok = Sg > 0
+    mu_g = Sg[ok] / Wg[ok]
+    s_g = Sg[ok] / S
+    T_g = Gg[ok] / Sg[ok] - np.log(mu_g)
+    return T, float(s_g @ T_g), float(s_g @ np.log(mu_g / mu))
+
+
+def lorenz(h, p=LORENZ_P):
+    """Lorenz ordinates L(p) from the bin totals (values equal within a bin -> linear inside)."""
+    W, S = h["W"].sum(axis=0), h["S"].sum(axis=0)
+    if W.sum() <= 0 or S.sum() <= 0:
+        return np.full(len(p), np.nan)
+    P = np.r_[0.0, np.cumsum(W)] / W.sum()
+    L = np.r_[0.0, np.cumsum(S)] / S.sum()
+    keep = np.r_[True, np.diff(P) > 0]           # drop empty bins (flat segments in P)
+    return np.interp(p, P[keep], L[keep])
+
+
+def summarize(h) -> dict:
+    W, S = h["W"].sum(axis=0), h["S"].sum(axis=0)
+    T, within, between = theil_parts(h)
+    L40, L90 = lorenz(h, [0.4, 0.9])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {"weight_total": W.sum(), "mean": S.sum() / W.sum(), "gini": float(binned_gini(W, S)),
+                "theil": T, "theil_within": within, "theil_between": between,
+                "bottom40_share": L40, "top10_share": 1 - L90, "palma": (1 - L90) / L40}
+
+
+def pixel_hists(strips, col_groups):
+    """Stream (band_key, r0, r1, nl, pop) strips -> {measure: histogram}; col_groups[band_key] = group per column."""
+    hists = {m: empty_hist(edges) for m, edges in MEASURES.items()}
+    for key, _, _, nl, pop in strips:
+        valid = np.isfinite(nl) & np.isfinite(pop) & (nl >= 0) & (pop >= 0)
+        g = np.broadcast_to(col_groups[key][: nl.shape[1]], nl.shape)[valid]
+        x, p = nl[valid].astype(np.float64), pop[valid].astype(np.float64)
+        for m, (v, w, sel) in measure_values(x, p).items():
+            accumulate(hists[m], v[sel], w[sel], g[sel], MEASURES[m])
+    return hists
+
+
+def tile_hists(df):
+    """{measure: histogram} with tiles as units (tile population = mean_pop x n_valid_pixels)."""
+    light = df["mean_light"].clip(lower=0).to_numpy(dtype=float)
+    npix = df["n_valid_pixels"].to_numpy(dtype=float) if "n_valid_pixels" in df else np.ones(len(df))
+    pop = df["mean_pop"].clip(lower=0).to_numpy(dtype=float)
+    g = pd.Categorical(df["region_type"], categories=REGION_TYPES).codes.astype(np.int64)
+    g[g < 0] = GROUPS.index("no_tile")
+    keep = np.isfinite(light) & np.isfinite(pop)
+    hists = {}
+    for m, (v, w, sel) in measure_values(light, pop, pop * npix).items():
+        sel = sel & keep
+        hists[m] = accumulate(empty_hist(MEASURES[m]), v[sel], w[sel], g[sel], MEASURES[m])
+    return hists
+
+
+def country_year_strips(country, year, h, w, row_bands, data_path, cube=None):
+    if cube is not None and year in cube.years:
+        for (r0, r1) in sorted(row_bands):
+            rr0, rr1 = min(r0, h), min(r1, h)
+            if rr0 < rr1:
+                nl, pop = cube.strip(year, rr0, rr1, ["light", "pop"])
+                yield (r0, r1), rr0, rr1, nl, pop
+        return
+    fp = os.path.join(data_path, country, f"{country}_{year}.tif")
+    if not os.path.exists(fp):
+        print(f"[WARN] no raster for {country} {year}, pixel level skipped")
+        return
+    with rasterio.open(fp) as src:
+        h = min(h, src.height)
+    # Wider years are clipped to the reference width, as in the tiling pass
+    for key, rr0, rr1, nl, pop in iter_strips(row_bands, h, fp=fp):
+        yield key, rr0, rr1, nl[:, :w], pop[:, :w]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--panel", required=True, help="Tile panel with r0/r1/c0/c1, mean_light, mean_pop, region_type")
+    ap.add_argument("--data_path", default=None, help="Root with <Country>/<Country>_<Year>.tif (pixel level)")
+    ap.add_argument("--cube_dir", default=None, help="Folder with <Country>_cube.tif (used when present)")
+    ap.add_argument("--out_dir", default=None, help="Output folder (default: <panel dir>/inequality)")
+    args = ap.parse_args()
+
+    out_dir = args.out_dir or os.path.join(os.path.dirname(os.path.abspath(args.panel)), "inequality")
+    os.makedirs(out_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    panel = pd.read_csv(args.panel)
+    hists = {}                                   # (level, measure, country, year) -> histogram
+
+    for country, cdf in panel.groupby("country", sort=True):
+        cube = None
+        cube_fp = os.path.join(args.cube_dir, f"{country}_cube.tif") if args.cube_dir else None
+        if cube_fp and os.path.exists(cube_fp):
+            from week5_datacube import DataCube
+            cube = DataCube(cube_fp)
+
+        # Full tile grid of the tiling pass, so pixel level covers every pixel of the raster;
+        # the tile size comes from the reference raster when there is one, not from surviving tiles
+        _, _, tile_size = grid_coords(cdf)
+        h, w = int(cdf["r1"].max()), int(cdf["c1"].max())
+        if cube is not None:
+            h, w = cube.shape
+            tile_size = cube.tile_size
+        elif args.data_path:
+            ref = os.path.join(args.data_path, country, f"{country}_{int(cdf['year'].min())}.tif")
+            if os.path.exists(ref):
+                with rasterio.open(ref) as src:
+                    h, w = src.height, src.width
+                tile_size = choose_tile_size(h, w, country)
+        row_bands = tile_row_bands(make_tiles(h, w, tile_size))
+
+        try:
+            for year, df in cdf.groupby("year", sort=True):
+                year = int(year)
+                for m, hist in tile_hists(df).items():
+                    hists[("tile", m, country, year)] = hist
+
+                if not (args.data_path or cube is not None):
+                    continue
+                tile_group = np.full(len(make_tiles(h, w, tile_size)) + 1, GROUPS.index("no_tile"), dtype=np.int64)
+                codes = pd.Categorical(df["region_type"], categories=REGION_TYPES).codes
+                tile_group[df["tile_id"].to_numpy()] = np.where(codes >= 0, codes, GROUPS.index("no_tile"))
+                col_groups = {}
+                for key, band_tiles in row_bands.items():
+                    cg = np.full(w, GROUPS.index("no_tile"), dtype=np.int64)
+                    for idx, c0, c1 in band_tiles:
+                        cg[c0:c1] = tile_group[idx]
+                    col_groups[key] = cg
+                strips = country_year_strips(country, year, h, w, row_bands, args.data_path, cube)
+                for m, hist in pixel_hists(strips, col_groups).items():
+                    if hist["W"].sum() > 0:
+                        hists[("pixel", m, country, year)] = hist
+                print(f"  {country} {year} ({time.perf_counter() - t0:.1f}s)")
+        finally:
+            if cube is not None:
+                cube.close()
+
+    # Pools by histogram addition: each country over all years, all countries per year
+    pooled = {}
+    for (level, m, country, year), hist in hists.items():
+        pooled.setdefault((level, m, country, "all"), []).append(hist)
+        pooled.setdefault((level, m, "ALL", year), []).append(hist)
+    hists.update({k: merge_hists(v) for k, v in pooled.items()})
+
+    rows, lorenz_rows = [], []
+    for (level, m, country, year), hist in hists.items():
+        rows.append({"level": level, "measure": m, "country": country, "year": year, **summarize(hist)})
+        for p, l in zip(LORENZ_P, lorenz(hist)):
+            lorenz_rows.append({"level": level, "measure": m, "country": country, "year": year,
+                                "p": round(p, 2), "lorenz": l})
+
+    res = pd.DataFrame(rows)
+    res.to_csv(os.path.join(out_dir, "inequality.csv"), index=False)
+    pd.DataFrame(lorenz_rows).to_csv(os.path.join(out_dir, "lorenz.csv"), index=False)
+    np.savez_compressed(os.path.join(out_dir, "inequality_hist.npz"),
+                        **{f"{'|'.join(map(str, k))}|{part}": v for k, hist in hists.items() for part, v in hist.items()})
+
+    print(f"\nSaved -> {out_dir} ({time.perf_counter() - t0:.1f}s)")
+    show = res[res["year"] == "all"].set_index(["level", "measure", "country"])
+    print(show[["gini", "theil", "theil_within", "theil_between", "top10_share"]].round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# week6_pixel_regression.py
+#
+# Pixel-level log1p(light) ~ log1p(pop) regressions, stratified by pixel population bin and by
+# the regime (region_type) of the enclosing tile, WITHOUT holding the pixels in memory.
+#
+# Each country-year raster is streamed one row band of tiles at a time (iter_strips from
+# week6_build_tiles_all_years.py, or DataCube.strip with --cube_dir). Every valid pixel inside
+# a panel tile gets a stratum key (regime x pop bin) and one np.bincount per moment adds the
+# strip to the running per-stratum sums
+#
+#   x^0..x^4,   x^0..x^3 * y,   x^0..x^2 * y^2          (x = log1p(pop), y = log1p(light))
+#
+# These 12 moments give the exact OLS intercept/slope, R^2 AND the HC0 (White) sandwich:
+# sum(e^2 x^k), k = 0..2, expands into the same moments. Moments are additive, so strata,
+# regimes, years or countries can be pooled afterwards without touching the rasters again.
+# x and y are shifted by constants taken from the first strip to keep the raw moments well
+# conditioned (slopes and R^2 are shift-invariant; intercepts are shifted back).
+#
+# Population bins use fixed edges (--pop_edges, persons per pixel) rather than the notebook's
+# per-country quintiles, which would need a second pass over the pixels.
+#
+# Outputs (written to --out_dir):
+#   pixel_moments.csv       country, year, regime, pop_bin, n, m_x0..m_x4, m_x0y..m_x3y, m_x0y2..m_x2y2
+#                           (unshifted sums; add rows and call ols_from_moments to pool)
+#   pixel_regression.csv    country, year, regime, pop_bin ("all" = pooled), n, intercept, slope,
+#                           se_hc0_intercept, se_hc0_slope, r2
+#
+# Run:
+#   python scripts/week6_pixel_regression.py --data_path data/week_5_robustness_tif_images \
+#       --panel figures/week6_outputs/tiles_panel_all_countries_2014-2023.csv \
+#       --out_dir figures/week6_outputs/pixel_regression
+
+import os, argparse, time
+import numpy as np
+import pandas as pd
+import rasterio
+
+from week6_build_tiles_all_years import REGION_TYPES, iter_strips
+
+POP_EDGES = [0.0, 1.0, 10.0, 100.0, 1000.0]
+
+# (power of x, power of y) for every accumulated moment
+MOMENTS = [(k, 0) for k in range(5)] + [(k, 1) for k in range(4)] + [(k, 2) for k in range(3)]
+MOMENT_COLS = [f"m_x{k}" if j == 0 else (f"m_x{k}y" if j == 1 else f"m_x{k}y2") for k, j in MOMENTS]
+
+
+def pop_bin_labels(edges):
+    return [f"[{a:g},{b:g})" for a, b in zip(edges[:-1], edges[1:])] + [f">={edges[-1]:g}"]
+
+
+def strip_moments(x, y, key, n_keys):
+    """(12, n_keys) moment sums for one strip."""
+    xp = [np.ones_like(x), x, x * x, x * x * x, (x * x) * (x * x)]
+    out = np.empty((len(MOMENTS), n_keys))
+    for i, (k, j) in enumerate(MOMENTS):
+        w = xp[k] if j == 0 else (xp[k] * y if j == 1 else xp[k] * y * y)
+        out[i] = np.bincount(key, weights=w, minlength=n_keys)
+    return out
+
+
+def ols_from_moments(M, shift=(0.0, 0.0)) -> dict:
+    """
+    Exact OLS of y on (1, x) with HC0 standard errors from moment sums.
+    M: (12, ...) array in MOMENTS order of (x - shift_x, y - shift_y); works elementwise over
+    the trailing axes. The intercept and its standard error are reported at x = 0 unshifted.
+    """
+    n, sx, sxx, sx3, sx4, sy, sxy, sx2y, sx3y, syy, sxyy, sx2yy = M
+    with np.errstate(invalid="ignore", divide="ignore"):
+        det = n * sxx - sx * sx
+        b = (n * sxy - sx * sy) / det
+        a = (sy - b * sx) / n
+
+        # sum(e^2 x^k) for k = 0, 1, 2 with e = y - a - b x
+        def e2(k):
+            Sx = [n, sx, sxx, sx3, sx4]
+            Sxy = [sy, sxy, sx2y, sx3y]
+            Sxyy = [syy, sxyy, sx2yy]
+            return (Sxyy[k] - 2 * a * Sxy[k] - 2 * b * Sxy[k + 1]
+                    + a * a * Sx[k] + 2 * a * b * Sx[k + 1] + b * b * Sx[k + 2])
+
+        m0, m1, m2 = e2(0), e2(1), e2(2)
+        # (X'X)^-1 = [[sxx, -sx], [-sx, n]] / det
+        i00, i01, i11 = sxx / det, -sx / det, n / det
+        # sandwich (X'X)^-1 [[m0, m1], [m1, m2]] (X'X)^-1
+        v00 = i00 * (i00 * m0 + i01 * m1) + i01 * (i00 * m1 + i01 * m2)
+        v01 = i00 * (i01 * m0 + i11 * m1) + i01 * (i01 * m1 + i11 * m2)
+        v11 = i01 * (i01 * m0 + i11 * m1) + i11 * (i01 * m1 + i11 * m2)
+        tss = syy - sy * sy / n
+        r2 = 1 - m0 / tss
+
+        # back to unshifted x, y:  y = (a + sy - b sx) + b x
+        sx0, sy0 = shift
+        a0 = a + sy0 - b * sx0
+        v00 = v00 - 2 * sx0 * v01 + sx0 * sx0 * v11
+    return {"n": n, "intercept": a0, "slope": b, "se_hc0_intercept": np.sqrt(v00),
+            "se_hc0_slope": np.sqrt(v11), "r2": r2}
+
+
+def panel_row_bands(df):
+    """{(r0, r1): [(tile_id, c0, c1, regime code), ...]} for one country-year of the panel."""
+    codes = pd.Categorical(df["region_type"], categories=REGION_TYPES).codes
+    bands = {}
+    for tid, r0, r1, c0, c1, k in zip(df["tile_id"], df["r0"], df["r1"], df["c0"], df["c1"], codes):
+        bands.setdefault((int(r0), int(r1)), []).append((int(tid), int(c0), int(c1), int(k)))
+    return bands
+
+
+def accumulate_country_year(strips, row_bands, w, pop_edges):
+    """Stream strips -> (12, n_regimes, n_bins) moments, shift_x, shift_y."""
+    R, B = len(REGION_TYPES), len(pop_edges)
+    edges = np.asarray(pop_edges[1:], dtype=float)
+    M = np.zeros((len(MOMENTS), R * B))
+    shift = None
+
+    for key, rr0, rr1, nl, pop in strips:
+        # regime per column for this row band (-1 = outside any tile / unknown regime)
+        col_regime = np.full(w, -1, dtype=np.int64)
+        for _, c0, c1, k in row_bands[key]:
+            col_regime[min(c0, w):min(c1, w)] = k
+        valid = np.isfinite(nl) & np.isfinite(pop) & (nl >= 0) & (pop >= 0) & (col_regime[None, : nl.shape[1]] >= 0)
+        if not valid.any():
+            continue
+        p = pop[valid].astype(np.float64)
+        x = np.log1p(p)
+        y = np.log1p(nl[valid].astype(np.float64))
+        if shift is None:
+            shift = (float(x.mean()), float(y.mean()))
+        k = np.broadcast_to(col_regime[None, : nl.shape[1]], nl.shape)[valid]
+        b = np.searchsorted(edges, p, side="right")
+        M += strip_moments(x - shift[0], y - shift[1], k * B + b, R * B)
+
+    shift = shift or (0.0, 0.0)
+    return M.reshape(len(MOMENTS), R, B), shift
+
+
+def regression_rows(M, shift, country, year, bin_labels):
+    """Fits per (regime, bin), per regime pooled over bins, and pooled over everything."""
+    R, B = M.shape[1], M.shape[2]
+    groups = [(REGION_TYPES[r], bin_labels[b], M[:, r, b]) for r in range(R) for b in range(B)]
+    groups += [(REGION_TYPES[r], "all", M[:, r, :].sum(axis=1)) for r in range(R)]
+    groups += [("all", "all", M.sum(axis=(1, 2)))]
+
+    rows = []
+    for regime, pop_bin, m in groups:
+        if m[0] < 3:
+            continue
+        fit = ols_from_moments(m, shift)
+        rows.append({"country": country, "year": year, "regime": regime, "pop_bin": pop_bin, **fit})
+    return rows
+
+
+def unshift_moments(M, shift):
+    """Moments of (x, y) from moments of (x - sx, y - sy) (binomial expansion)."""
+    from math import comb
+    sx, sy = shift
+    idx = {kj: i for i, kj in enumerate(MOMENTS)}
+    out = np.zeros_like(M)
+    for i, (k, j) in enumerate(MOMENTS):
+        for a in range(k + 1):
+            for c in range(j + 1):
+                out[i] += comb(k, a) * comb(j, c) * sx ** (k - a) * sy ** (j - c) * M[idx[(a, c)]]
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data_path", required=True, help="Root folder containing <Country>/<Country>_<Year>.tif")
+    ap.add_argument("--panel", required=True, help="Tile panel with r0/r1/c0/c1 and region_type")
+    ap.add_argument("--out_dir", default=None, help="Output folder (default: <panel dir>/pixel_regression)")
+    ap.add_argument("--cube_dir", default=None, help="Folder with <Country>_cube.tif (used when present)")
+    ap.add_argument("--pop_edges", default=",".join(f"{e:g}" for e in POP_EDGES),
+                    help="Population bin edges (persons per pixel); the last bin is open-ended")
+    args = ap.parse_args()
+
+    pop_edges = [float(e) for e in args.pop_edges.split(",")]
+    bin_labels = pop_bin_labels(pop_edges)
+    out_dir = args.out_dir or os.path.join(os.path.dirname(os.path.abspath(args.panel)), "pixel_regression")
+    os.makedirs(out_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    panel = pd.read_csv(args.panel, usecols=["country", "year", "tile_id", "r0", "r1", "c0", "c1", "region_type"])
+    moment_rows, fit_rows = [], []
+
+    for (country, year), df in panel.groupby(["country", "year"], sort=True):
+        year = int(year)
+        row_bands = panel_row_bands(df)
+        cube_fp = os.path.join(args.cube_dir, f"{country}_cube.tif") if args.cube_dir else None
+        fp = os.path.join(args.data_path, country, f"{country}_{year}.tif")
+
+        if cube_fp and os.path.exists(cube_fp):
+            from week5_datacube import DataCube
+            with DataCube(cube_fp) as cube:
+                if year not in cube.years:
+                    print(f"[WARN] {year} not in {cube_fp}, skipping")
+                    continue
+                h, w = cube.shape
+                strips = ((key, min(r0, h), min(r1, h), *cube.strip(year, min(r0, h), min(r1, h), ["light", "pop"]))
+                          for key in sorted(row_bands) for r0, r1 in [key] if min(r0, h) < min(r1, h))
+                M, shift = accumulate_country_year(strips, row_bands, w, pop_edges)
+        elif os.path.exists(fp):
+            with rasterio.open(fp) as src:
+                h, w = src.height, src.width
+            M, shift = accumulate_country_year(iter_strips(row_bands, h, fp=fp), row_bands, w, pop_edges)
+        else:
+            print(f"[WARN] no raster for {country} {year}, skipping")
+            continue
+
+        fit_rows += regression_rows(M, shift, country, year, bin_labels)
+
+        # Store unshifted moments so files from different runs / years can simply be added
+        M = unshift_moments(M.reshape(len(MOMENTS), -1), shift).reshape(M.shape)
+        for r, regime in enumerate(REGION_TYPES):
+            for b, label in enumerate(bin_labels):
+                if M[0, r, b] > 0:
+                    moment_rows.append({"country": country, "year": year, "regime": regime, "pop_bin": label,
+                                        "n": int(M[0, r, b]), **dict(zip(MOMENT_COLS, M[:, r, b]))})
+        print(f"  {country} {year}: {int(M[0].sum()):,} pixels ({time.perf_counter() - t0:.1f}s)")
+
+    if not fit_rows:
+        print("[WARN] no rasters found, nothing written")
+        return
+    pd.DataFrame(moment_rows).to_csv(os.path.join(out_dir, "pixel_moments.csv"), index=False)
+    fits = pd.DataFrame(fit_rows)
+    fits.to_csv(os.path.join(out_dir, "pixel_regression.csv"), index=False)
+
+    print(f"\nSaved -> {out_dir} ({time.perf_counter() - t0:.1f}s)")
+    print(fits[fits["pop_bin"] == "all"].pivot_table(index=["country", "year"], columns="regime",
+                                                       values="slope").round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
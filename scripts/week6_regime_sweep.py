@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# week6_regime_sweep.py
+#
+# Robustness sweep over alternative regime threshold schemes.
+#
+# build_tile_table() labels each tile with quartile thresholds of (mean_light, mean_pop)
+# computed within its country-year. This script re-classifies the WHOLE panel under K
+# schemes at once and stores the result as one (rows x K) int8 matrix of REGION_TYPES codes:
+#
+#   quartile           25/75% thresholds per country-year   (reproduces region_type)
+#   tercile            1/3, 2/3 per country-year
+#   quintile           20/80% per country-year
+#   quartile_pooled    25/75% per year, pooled over all countries
+#   quartile_base      25/75% per country, fixed at the base year (first panel year by default)
+#
+# Thresholds are per-group linear quantiles (same as np.nanquantile) taken from ONE sort of
+# each (grouping, column): the panel is lexsorted by (group, value) and every group's
+# quantiles are read off at computed offsets, so the cost does not grow with the number of
+# groups or quantiles. Classification is classify_codes() on whole arrays.
+# Rows whose group has no valid values (e.g. a country missing its base year) get code -1.
+#
+# Output (written next to the panel unless --out is given):
+#   regime_sweep.npz   codes (rows x K, int8), schemes, regions, country, year, tile_id
+#
+# Rows are in panel order; load_regime_sweep() + scheme_column() turn one column back into
+# a region_type categorical for the regression scripts.
+#
+# Run:
+#   python scripts/week6_regime_sweep.py --panel figures/week6_outputs/tiles_panel_all_countries_2014-2023.csv
+
+import os, argparse
+import numpy as np
+import pandas as pd
+
+from week6_build_tiles_all_years import REGION_TYPES, classify_codes
+
+SWEEP_NAME = "regime_sweep.npz"
+
+# name -> (lower quantile, upper quantile, grouping); grouping is one of
+# "country_year", "year" (pooled over countries) or "base_year" (per country, base year only)
+SCHEMES = {
+    "quartile": (0.25, 0.75, "country_year"),
+    "tercile": (1 / 3, 2 / 3, "country_year"),
+    "quintile": (0.20, 0.80, "country_year"),
+    "quartile_pooled": (0.25, 0.75, "year"),
+    "quartile_base": (0.25, 0.75, "base_year"),
+}
+
+
+def _lerp(a, b, t):
+    # Same two-sided interpolation numpy's quantile uses (bit-identical thresholds)
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+
+
+def group_quantiles(values, groups, n_groups: int, qs) -> np.ndarray:
+    """
+    (n_groups, len(qs)) linear quantiles of `values` within each integer group, ignoring NaN.
+    One lexsort for all groups and quantiles; groups without valid values give NaN.
+    """
+    v = np.asarray(values, dtype=float)
+    g = np.asarray(groups, dtype=np.int64)
+    valid = ~np.isnan(v)
+
+    order = np.lexsort((v, g))          # by group, then value (NaN last within each group)
+    v_sorted = v[order]
+    size = np.bincount(g, minlength=n_groups)
+    n = np.bincount(g[valid], minlength=n_groups)
+    start = np.concatenate([[0], np.cumsum(size)[:-1]])
+
+    out = np.full((n_groups, len(qs)), np.nan)
+    has = n > 0
+    for j, q in enumerate(qs):
+        pos = q * (n[has] - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, n[has] - 1)
+        a = v_sorted[start[has] + lo]
+        b = v_sorted[start[has] + hi]
+        out[has, j] = _lerp(a, b, pos - lo)
+    return out
+
+
+def scheme_groups(country_idx, year, grouping: str, base_year: int):
+    """Group index per row, number of groups, and a mask of rows that define the thresholds."""
+    ones = np.ones(len(year), dtype=bool)
+    if grouping == "country_year":
+        g, uniq = pd.factorize(pd.MultiIndex.from_arrays([country_idx, year]), sort=True)
+        return g, len(uniq), ones
+    if grouping == "year":
+        g, uniq = pd.factorize(year, sort=True)
+        return g, len(uniq), ones
+    if grouping == "base_year":
+        g, uniq = pd.factorize(country_idx, sort=True)
+        return g, len(uniq), year == base_year
+    raise ValueError(f"Unknown grouping: {grouping}")
+
+
+def sweep_regimes(panel: pd.DataFrame, schemes=None, base_year: int = None):
+    """
+    Classify every panel row under each scheme.
+    Returns (codes (rows x K) int8, scheme names, thresholds long DataFrame).
+    """
+    schemes = schemes or list(SCHEMES)
+    nl = panel["mean_light"].to_numpy(dtype=float)
+    pop = panel["mean_pop"].to_numpy(dtype=float)
+    ci, _ = pd.factorize(panel["country"], sort=True)
+    year = panel["year"].to_numpy(dtype=np.int64)
+    base_year = int(year.min()) if base_year is None else base_year
+
+    codes = np.full((len(panel), len(schemes)), -1, dtype=np.int8)
+    rows = []
+    for k, name in enumerate(schemes):
+        q_lo, q_hi, grouping = SCHEMES[name]
+        g, n_groups, ref = scheme_groups(ci, year, grouping, base_year)
+
+        # Non-reference rows are NaN'd out so they sort last and never enter the quantiles
+        nl_q = group_quantiles(np.where(ref, nl, np.nan), g, n_groups, (q_lo, q_hi))
+        pop_q = group_quantiles(np.where(ref, pop, np.nan), g, n_groups, (q_lo, q_hi))
+
+        nl_lo, nl_hi = nl_q[g, 0], nl_q[g, 1]
+        pop_lo, pop_hi = pop_q[g, 0], pop_q[g, 1]
+        col = classify_codes(nl, pop, nl_lo, nl_hi, pop_lo, pop_hi)
+        defined = ~np.isnan(nl_q[g]).any(axis=1) & ~np.isnan(pop_q[g]).any(axis=1)
+        codes[:, k] = np.where(defined, col, -1)
+
+        first = np.unique(g, return_index=True)[1]
+        rows.append(pd.DataFrame({
+            "scheme": name,
+            "country": panel["country"].to_numpy()[first] if grouping != "year" else "ALL",
+            "year": year[first] if grouping != "base_year" else base_year,
+            "nl_lo": nl_q[g[first], 0], "nl_hi": nl_q[g[first], 1],
+            "pop_lo": pop_q[g[first], 0], "pop_hi": pop_q[g[first], 1],
+        }))
+
+    return codes, list(schemes), pd.concat(rows, ignore_index=True)
+
+
+def save_regime_sweep(path: str, panel: pd.DataFrame, codes: np.ndarray, schemes):
+    np.savez_compressed(
+        path,
+        codes=codes,
+        schemes=np.asarray(schemes, dtype=str),
+        regions=np.asarray(REGION_TYPES, dtype=str),
+        country=panel["country"].to_numpy(dtype=str),
+        year=panel["year"].to_numpy(dtype=np.int16),
+        tile_id=panel["tile_id"].to_numpy(dtype=np.int32),
+    )
+
+
+def load_regime_sweep(path: str) -> dict:
+    with np.load(path) as z:
+        return {key: z[key] for key in z.files}
+
+
+def scheme_column(sweep: dict, scheme: str) -> pd.Categorical:
+    # -1 (unclassified) comes back as NaN
+    k = list(sweep["schemes"]).index(scheme)
+    return pd.Categorical.from_codes(sweep["codes"][:, k], categories=list(sweep["regions"]), ordered=True)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--panel", required=True, help="tiles_panel_all_countries_<start>-<end>.csv")
+    ap.add_argument("--out", default=None, help=f"Output .npz (default: <panel dir>/{SWEEP_NAME})")
+    ap.add_argument("--schemes", default=",".join(SCHEMES), help="Comma-separated subset of SCHEMES")
+    ap.add_argument("--base_year", type=int, default=None, help="Base year for quartile_base (default: first year)")
+    args = ap.parse_args()
+
+    schemes = [s.strip() for s in args.schemes.split(",") if s.strip()]
+    unknown = [s for s in schemes if s not in SCHEMES]
+    if unknown:
+        raise ValueError(f"Unknown schemes: {unknown}. Choose from {list(SCHEMES)}")
+
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(args.panel)), SWEEP_NAME)
+
+    panel = pd.read_csv(args.panel, usecols=["country", "year", "tile_id", "mean_light", "mean_pop", "region_type"])
+    codes, schemes, thresholds = sweep_regimes(panel, schemes, base_year=args.base_year)
+    save_regime_sweep(out, panel, codes, schemes)
+    thresholds.to_csv(os.path.splitext(out)[0] + "_thresholds.csv", index=False)
+
+    print(f"Saved regime sweep: {out}  ({codes.shape[0]:,} rows x {codes.shape[1]} schemes)")
+
+    # Agreement with the panel's own region_type + regime shares per scheme
+    base = pd.Categorical(panel["region_type"], categories=REGION_TYPES).codes
+    shares = {}
+    for k, name in enumerate(schemes):
+        col = codes[:, k]
+        ok = col >= 0
+        shares[name] = np.bincount(col[ok], minlength=len(REGION_TYPES)) / max(ok.sum(), 1)
+        print(f"  {name:<16} agreement with region_type: {np.mean(col == base):.3f}  unclassified: {(~ok).sum()}")
+    print("\nRegime shares by scheme:")
+    print(pd.DataFrame(shares, index=REGION_TYPES).round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# week6_structure_cube.py
+#
+# Build the region-type "structure cube" for ALL countries and years in one grouped pass
+# over the tile panel (tiles_panel_all_countries_<start>-<end>.csv):
+#
+#   counts[country, year, region]            number of tiles of each region type
+#   shares[country, year, region]            counts normalised within each country-year
+#   transitions[country, year, from, to]     tiles moving from region `from` in `year`
+#                                            to region `to` in the following year
+#
+# Region types are integer-coded in the fixed REGION_TYPES order and every aggregate is a
+# single np.bincount over a flat (country, year, region[, region]) key, so adding countries
+# or years does not add Python loops. Transitions rely on tile_id being stable across years
+# (see week6_build_tiles_all_years.py).
+#
+# Output (written next to the panel unless --out is given):
+#   structure_cube.npz   countries, years, regions, counts, shares, transitions, panel_stamp
+#                        (size and mtime of the panel, so readers can detect a stale cube)
+#
+# The plotting scripts (week6_visualize_structure.py) read this file directly via
+# load_structure_cube().
+
+import os, argparse
+import numpy as np
+import pandas as pd
+
+from week6_build_tiles_all_years import REGION_TYPES
+
+CUBE_NAME = "structure_cube.npz"
+
+
+def region_codes(region_type) -> np.ndarray:
+    # -1 for anything outside REGION_TYPES (NaN, typos, ...)
+    return pd.Categorical(region_type, categories=REGION_TYPES).codes.astype(np.int8)
+
+
+def build_structure_cube(panel: pd.DataFrame) -> dict:
+    df = panel[["country", "year", "tile_id", "region_type"]].dropna(subset=["country", "year", "tile_id"])
+    k = region_codes(df["region_type"])
+    keep = k >= 0
+    df, k = df[keep], k[keep].astype(np.int64)
+
+    ci, countries = pd.factorize(df["country"], sort=True)
+    year = df["year"].to_numpy(dtype=np.int64)
+    years = np.arange(year.min(), year.max() + 1)
+    yi = year - years[0]
+    tile = df["tile_id"].to_numpy(dtype=np.int64)
+
+    C, Y, K = len(countries), len(years), len(REGION_TYPES)
+
+    # region shares: one bincount over (country, year, region)
+    counts = np.bincount((ci * Y + yi) * K + k, minlength=C * Y * K).reshape(C, Y, K)
+    totals = counts.sum(axis=2, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shares = np.where(totals > 0, counts / totals, np.nan)
+
+    # transitions: scatter codes into a dense (country, year, tile) grid, compare year t with t+1
+    transitions = np.zeros((C, max(Y - 1, 0), K, K), dtype=np.int64)
+    if Y > 1:
+        grid = np.full((C, Y, tile.max() + 1), -1, dtype=np.int8)
+        grid[ci, yi, tile] = k
+        src, dst = grid[:, :-1, :], grid[:, 1:, :]
+        ok = (src >= 0) & (dst >= 0)
+        cc, yy, _ = np.nonzero(ok)
+        key = ((cc * (Y - 1) + yy) * K + src[ok].astype(np.int64)) * K + dst[ok]
+        transitions = np.bincount(key, minlength=C * (Y - 1) * K * K).reshape(C, Y - 1, K, K)
+
+    return {
+        "countries": np.asarray(countries, dtype=str),
+        "years": years.astype(np.int16),
+        "regions": np.asarray(REGION_TYPES, dtype=str),
+        "counts": counts.astype(np.int32),
+        "shares": shares.astype(np.float32),
+        "transitions": transitions.astype(np.int32),
+    }
+
+
+def transition_matrix(transitions: np.ndarray) -> np.ndarray:
+    # Row-normalise transition counts into Markov probabilities (rows with no tiles -> NaN)
+    rows = transitions.sum(axis=-1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(rows > 0, transitions / rows, np.nan)
+
+
+def panel_stamp(panel_path: str) -> np.ndarray:
+    # (size, mtime_ns) of the panel a cube was built from; a regenerated panel changes it
+    st = os.stat(panel_path)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def save_structure_cube(cube: dict, path: str, panel_path: str = None):
+    if panel_path is not None:
+        cube = {**cube, "panel_stamp": panel_stamp(panel_path)}
+    np.savez_compressed(path, **cube)
+
+
+def cube_is_current(path: str, panel_path: str) -> bool:
+    """True when `path` exists and was built from the panel as it is now."""
+    if not os.path.exists(path):
+        return False
+    with np.load(path) as z:
+        return "panel_stamp" in z.files and np.array_equal(z["panel_stamp"], panel_stamp(panel_path))
+
+
+def load_structure_cube(path: str) -> dict:
+    with np.load(path) as z:
+        return {key: z[key] for key in z.files}
+
+
+def cube_to_long(cube: dict) -> pd.DataFrame:
+    # Long table in the same shape the old per-file value_counts loop produced
+    C, Y, K = cube["shares"].shape
+    idx = pd.MultiIndex.from_product(
+        [cube["countries"], cube["years"], cube["regions"]], names=["Country", "Year", "Region"]
+    )
+    out = pd.DataFrame({"Count": cube["counts"].ravel(), "Share": cube["shares"].ravel()}, index=idx)
+    return out.reset_index()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--panel", required=True, help="tiles_panel_all_countries_<start>-<end>.csv")
+    ap.add_argument("--out", default=None, help=f"Output .npz (default: <panel dir>/{CUBE_NAME})")
+    args = ap.parse_args()
+
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(args.panel)), CUBE_NAME)
+
+    panel = pd.read_csv(
+        args.panel,
+        usecols=["country", "year", "tile_id", "region_type"],
+        dtype={"country": "category", "region_type": "category"},
+    )
+    cube = build_structure_cube(panel)
+    save_structure_cube(cube, out, panel_path=args.panel)
+
+    print(f"Saved structure cube: {out}")
+    print(f"  countries={list(cube['countries'])}")
+    print(f"  years={int(cube['years'][0])}-{int(cube['years'][-1])}, regions={len(cube['regions'])}")
+    print(f"  tile-year transitions recorded: {int(cube['transitions'].sum()):,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# week6_tile_patches.py
+#
+# Batched tile-patch loader: (tile_id, year, band) image patches straight from disk, for texture
+# statistics and learned embeddings, instead of slicing full in-memory rasters as in the Week 5
+# notebooks.
+#
+#   * patches are assembled from READ UNITS: the file's native blocks, grown to at least one tile
+#     in each direction (so striped TIFFs are read as tile-high strips, tiled TIFFs block by block)
+#   * decoded units live in a thread-safe LRU bounded by bytes (--cache_mb); concurrent misses on
+#     one unit share a single decode; tiles are visited in row-major grid order so every unit is
+#     decoded about once per year
+#   * batches are built by a thread pool (--workers) with prefetch_iter(): GDAL releases the GIL
+#     while decoding, so reading is parallel and the Python side is a few slice copies per patch
+#   * every worker thread opens its own dataset handles (rasterio handles are not thread-safe)
+#
+# Each batch is (year, tile_ids (n,), patches (n, bands, tile, tile)) with patches a C-contiguous
+# float32 array, NaN for nodata and for the part of an edge tile outside the raster.
+# Sources are the yearly TIFFs (bands light, pop, pop_norm) or a week5_datacube cube (--cube_dir).
+#
+# As a consumer, the CLI computes simple per-tile texture statistics over all country-years.
+#
+# Outputs (written to --out_dir):
+#   tiles_patch_texture.csv   country, year, tile_id, <band>_patch_std, <band>_patch_grad
+#                             (std and mean absolute neighbour difference inside the patch)
+#
+# Run:
+#   python scripts/week6_tile_patches.py --data_path data/week_5_robustness_tif_images \
+#       --out_dir figures/week6_outputs/patches [--cube_dir data/cubes]
+
+import os, argparse, threading, time, warnings
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.windows import Window
+
+import raster_catalog
+from week5_datacube import BAND_NAMES, DataCube
+from week6_build_tiles_all_years import choose_tile_size, make_tiles, prefetch_iter
+
+
+class BlockCache:
+    """
+    Thread-safe LRU of decoded read units, bounded by bytes (the most recent unit is always kept).
+    Concurrent misses on the same key decode it once: later callers wait on the pending load.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._units = OrderedDict()
+        self._pending = {}                        # key -> Future of an in-flight load
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, load):
+        with self._lock:
+            arr = self._units.get(key)
+            if arr is not None:
+                self._units.move_to_end(key)
+                self.hits += 1
+                return arr
+            fut = self._pending.get(key)
+            owner = fut is None
+            if owner:
+                fut = self._pending[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not owner:
+            return fut.result()
+
+        try:
+            arr = load()                          # decode outside the lock
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            del self._pending[key]
+            self._units[key] = arr
+            self.nbytes += arr.nbytes
+            while self.nbytes > self.max_bytes and len(self._units) > 1:
+                self.nbytes -= self._units.popitem(last=False)[1].nbytes
+        fut.set_result(arr)
+        return arr
+
+
+class PatchLoader:
+    """
+    Iterates (year, tile_ids, patches) batches over `tiles` [(tile_id, r0, r1, c0, c1)] for every
+    year in `sources` {year: (path, band indexes, (height, width))}.
+    """
+
+    def __init__(self, sources: dict, tiles, tile_size: int, band_names, batch_size: int = 64,
+                 workers: int = 4, cache_mb: float = 512):
+        self.sources = dict(sorted(sources.items()))
+        self.tiles = sorted(tiles, key=lambda t: (t[1], t[3]))       # row-major: units reused
+        self.tile_size = tile_size
+        self.band_names = list(band_names)
+        self.batch_size = batch_size
+        self.workers = workers
+
+        path = next(iter(self.sources.values()))[0]
+        with rasterio.open(path) as src:
+            bh, bw = src.block_shapes[0]
+        self.unit = (bh * -(-tile_size // bh), bw * -(-tile_size // bw))
+        w_max = max(shape[1] for _, _, shape in self.sources.values())       # units are clipped to the raster
+        unit_bytes = len(self.band_names) * self.unit[0] * min(self.unit[1], w_max) * 4
+        if unit_bytes > cache_mb * 2 ** 20:
+            print(f"[WARN] one read unit ({unit_bytes / 2 ** 20:.0f} MB) exceeds --cache_mb; only the last unit is kept")
+        self.cache = BlockCache(int(cache_mb * 2 ** 20))
+
+        self._local = threading.local()
+        self._handles = []
+        self._handles_lock = threading.Lock()
+
+    def _dataset(self, path):
+        handles = getattr(self._local, "handles", None)
+        if handles is None:
+            handles = self._local.handles = {}
+        if path not in handles:
+            handles[path] = rasterio.open(path)
+            with self._handles_lock:
+                self._handles.append(handles[path])
+        return handles[path]
+
+    def _read_unit(self, year, ur, uc):
+        path, indexes, (h, w) = self.sources[year]
+        uh, uw = self.unit
+        r0, c0 = ur * uh, uc * uw
+        src = self._dataset(path)
+        arr = src.read(indexes, window=Window(c0, r0, min(uw, w - c0), min(uh, h - r0)), out_dtype="float32")
+        if src.nodata is not None and not np.isnan(src.nodata):
+            arr[arr == src.nodata] = np.nan
+        return arr
+
+    def patch_into(self, out, year, r0, r1, c0, c1):
+        """Copy the (bands, r1-r0, c1-c0) window into out[:, :r1-r0, :c1-c0]; the rest stays as is."""
+        _, _, (h, w) = self.sources[year]
+        r1, c1 = min(r1, h), min(c1, w)
+        uh, uw = self.unit
+        for ur in range(r0 // uh, (r1 - 1) // uh + 1):
+            for uc in range(c0 // uw, (c1 - 1) // uw + 1):
+                unit = self.cache.get((year, ur, uc), lambda: self._read_unit(year, ur, uc))
+                a0, a1 = max(r0, ur * uh), min(r1, (ur + 1) * uh)
+                b0, b1 = max(c0, uc * uw), min(c1, (uc + 1) * uw)
+                out[:, a0 - r0:a1 - r0, b0 - c0:b1 - c0] = unit[:, a0 - ur * uh:a1 - ur * uh, b0 - uc * uw:b1 - uc * uw]
+
+    def _load_batch(self, item):
+        year, chunk = item
+        ts = self.tile_size
+        patches = np.full((len(chunk), len(self.band_names), ts, ts), np.nan, dtype=np.float32)
+        for k, (_, r0, r1, c0, c1) in enumerate(chunk):
+            self.patch_into(patches[k], year, r0, r1, c0, c1)
+        return np.array([t[0] for t in chunk], dtype=np.int64), patches
+
+    def __iter__(self):
+        items = [(year, self.tiles[i:i + self.batch_size])
+                 for year in self.sources for i in range(0, len(self.tiles), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as pool:
+            for (year, _), (ids, patches) in prefetch_iter(self._load_batch, items, self.workers, pool):
+                yield year, ids, patches
+
+    def close(self):
+        with self._handles_lock:
+            for ds in self._handles:
+                ds.close()
+            self._handles = []
+
+
+def country_patch_loader(country: str, data_path: str, years, cube_dir: str = None, **kwargs) -> PatchLoader:
+    """PatchLoader over the tiling pass's grid (tile_id = enumerate index of make_tiles)."""
+    cube_fp = os.path.join(cube_dir, f"{country}_cube.tif") if cube_dir else None
+    if cube_fp and os.path.exists(cube_fp):
+        with DataCube(cube_fp) as cube:
+            shape, bands = cube.shape, cube.bands
+            sources = {y: (cube_fp, [cube.band_index(y, b) for b in bands], shape) for y in years if y in cube.years}
+    else:
+        ent = raster_catalog.entries(raster_catalog.refresh(data_path, countries=[country])[0], country)
+        years = [y for y in years if y in ent]
+        if not years:
+            raise FileNotFoundError(f"No rasters for {country} under {data_path}")
+        shape = (ent[years[0]]["height"], ent[years[0]]["width"])
+        bands = BAND_NAMES[:min(e["count"] for y, e in ent.items() if y in years)]
+        sources = {y: (os.path.join(data_path, country, f"{country}_{y}.tif"), list(range(1, len(bands) + 1)),
+                       (ent[y]["height"], ent[y]["width"])) for y in years}
+
+    tile_size = choose_tile_size(*shape, country)
+    tiles = [(i, *t) for i, t in enumerate(make_tiles(*shape, tile_size), start=1)]
+    return PatchLoader(sources, tiles, tile_size, bands, **kwargs)
+
+
+def patch_texture(patches, band_names):
+    """Per-patch std and mean absolute neighbour difference for every band: {column: (n,)}."""
+    out = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)        # all-NaN patches -> NaN
+        for b, name in enumerate(band_names):
+            x = patches[:, b]
+            grad = np.concatenate([np.abs(np.diff(x, axis=1)).reshape(len(x), -1),
+                                   np.abs(np.diff(x, axis=2)).reshape(len(x), -1)], axis=1)
+            out[f"{name}_patch_std"] = np.nanstd(x.reshape(len(x), -1), axis=1)
+            out[f"{name}_patch_grad"] = np.nanmean(grad, axis=1)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data_path", required=True, help="Root folder containing <Country>/<Country>_<Year>.tif")
+    ap.add_argument("--out_dir", default="figures/week6_outputs/patches")
+    ap.add_argument("--cube_dir", default=None, help="Folder with <Country>_cube.tif (used when present)")
+    ap.add_argument("--countries", default="Morocco,Brazil,China", help="Comma-separated list")
+    ap.add_argument("--start_year", type=int, default=2014)
+    ap.add_argument("--end_year", type=int, default=2023)
+    ap.add_argument("--batch_size", type=int, default=64, help="Tiles per batch")
+    ap.add_argument("--workers", type=int, default=4, help="Reader threads (batches in flight)")
+    ap.add_argument("--cache_mb", type=float, default=512, help="Decoded read-unit LRU budget")
+    args = ap.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    years = list(range(args.start_year, args.end_year + 1))
+    parts = []
+    for country in [c.strip() for c in args.countries.split(",") if c.strip()]:
+        try:
+            loader = country_patch_loader(country, args.data_path, years, args.cube_dir, batch_size=args.batch_size,
+                                          workers=args.workers, cache_mb=args.cache_mb)
+        except FileNotFoundError as e:
+            print(f"[WARN] {e}")
+            continue
+
+        t0, n_bytes = time.perf_counter(), 0
+        try:
+            for year, ids, patches in loader:
+                n_bytes += patches.nbytes
+                parts.append(pd.DataFrame({"country": country, "year": year, "tile_id": ids,
+                                           **patch_texture(patches, loader.band_names)}))
+        finally:
+            loader.close()
+        dt = time.perf_counter() - t0
+        c = loader.cache
+        print(f"{country}: {len(loader.tiles)} tiles x {len(loader.sources)} years, bands={loader.band_names}, "
+              f"unit={loader.unit} | {n_bytes / 2 ** 20 / dt:.0f} MB/s of patches, "
+              f"unit cache hit rate {c.hits / max(c.hits + c.misses, 1):.0%} ({dt:.1f}s)")
+
+    if not parts:
+        print("[WARN] nothing to write")
+        return
+    out_fp = os.path.join(args.out_dir, "tiles_patch_texture.csv")
+    pd.concat(parts, ignore_index=True).to_csv(out_fp, index=False)
+    print("Saved:", out_fp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# week6_tile_service.py
+#
+# Local HTTP/JSON service for tile histories: "what happened at this location 2014-2023?"
+#
+# The panel (e.g. tiles_panel_..._WITH_GEO_INFRASTRUCTURE.csv) is loaded once into compact
+# arrays per country:
+#
+#   values[tile_id, year, feature]   float32, NaN where the tile is absent that year
+#   regime[tile_id, year]            int8 region_type code (-1 = absent)
+#   grid[tile_row, tile_col]         tile_id of each cell of the tile grid (0 = no tile)
+#
+# A point is located in O(1): lon/lat -> pixel (row, col) through the inverse raster transform
+# (read header-only from the raster catalog or a data cube), -> grid cell (row // tile, col //
+# tile) -> tile_id. Query coordinates are WGS84 lon/lat; for rasters in any other CRS they are
+# reprojected (rasterio.warp.transform) before the inverse transform. A bounding box is one slice of `grid`. Encoded tile histories are kept in an
+# LRU cache, so repeated lookups are a dict hit plus a socket write.
+#
+# Endpoints (all JSON):
+#   GET  /health
+#   GET  /meta                                   countries, years, features, tile sizes
+#   GET  /tile?lat=..&lon=..                     history of the tile containing the point
+#   GET  /tile?country=..&tile_id=..             history of one tile
+#   POST /points    {"points": [[lat, lon], ...]}   batch lookup (vectorized), null where no tile
+#   GET  /bbox?min_lat=..&min_lon=..&max_lat=..&max_lon=..[&year=..][&limit=..]
+#                                                tiles inside the box for one year (default: last)
+#
+# Run:
+#   python scripts/week6_tile_service.py --data_path data/week_5_robustness_tif_images \
+#       --panel figures/week6_outputs_geogprahic/tiles_panel_all_countries_2014-2023_WITH_GEO_INFRASTRUCTURE.csv
+#   curl "http://127.0.0.1:8765/tile?lat=33.57&lon=-7.59"
+#   (--benchmark N times N random in-process point lookups and exits)
+
+import os, json, argparse, time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+from rasterio.crs import CRS
+from rasterio.transform import Affine
+from rasterio.warp import transform as warp_transform
+
+import raster_catalog
+from spatial_weights import grid_coords
+from week6_build_tiles_all_years import REGION_TYPES
+
+KEY_COLS = ["country", "year", "tile_id", "r0", "r1", "c0", "c1", "tile_size", "region_type"]
+WGS84 = CRS.from_epsg(4326)
+
+
+class TileIndex:
+    """In-memory tile panel with O(1) point -> tile lookup; see module header for the layout."""
+
+    def __init__(self, panel: pd.DataFrame, transforms: dict, cache_size: int = 65536):
+        # transforms: {country: (Affine, CRS or None)}, see load_transforms()
+        self.years = sorted(int(y) for y in panel["year"].unique())
+        self.features = [c for c in panel.columns
+                         if c not in KEY_COLS and pd.api.types.is_numeric_dtype(panel[c])]
+        self.countries = []
+        year_idx = {y: i for i, y in enumerate(self.years)}
+
+        for country, cdf in panel.groupby("country", sort=True):
+            gr, gc, tile_size = grid_coords(cdf)
+            ids = cdf["tile_id"].to_numpy(dtype=np.int64)
+            yi = cdf["year"].map(year_idx).to_numpy()
+            n_ids = int(ids.max()) + 1
+
+            values = np.full((n_ids, len(self.years), len(self.features)), np.nan, dtype=np.float32)
+            values[ids, yi] = cdf[self.features].to_numpy(dtype=np.float32)
+            regime = np.full((n_ids, len(self.years)), -1, dtype=np.int8)
+            regime[ids, yi] = pd.Categorical(cdf["region_type"], categories=REGION_TYPES).codes
+            grid = np.zeros((int(gr.max()) + 1, int(gc.max()) + 1), dtype=np.int32)
+            grid[gr, gc] = ids
+            bounds = np.zeros((n_ids, 4), dtype=np.int32)
+            bounds[ids] = cdf[["r0", "r1", "c0", "c1"]].to_numpy()
+
+            transform, crs = transforms.get(country, (None, None))
+            if transform is None:
+                print(f"[WARN] no raster transform for {country}; only tile_id lookups will work")
+            elif crs is None:
+                print(f"[WARN] no CRS recorded for {country}; lat/lon are taken as raster coordinates")
+            self.countries.append({
+                "country": country, "tile_size": tile_size, "transform": transform,
+                "inverse": ~transform if transform is not None else None,
+                "crs": crs if crs is not None and crs != WGS84 else None,      # None = no reprojection
+                "values": values, "regime": regime, "grid": grid, "bounds": bounds,
+            })
+        self._by_name = {c["country"]: i for i, c in enumerate(self.countries)}
+        self.encoded = lru_cache(maxsize=cache_size)(self._encode)
+
+    @staticmethod
+    def _to_raster_crs(c, lon, lat):
+        """WGS84 lon/lat -> (x, y) in the country's raster CRS."""
+        if c["crs"] is None:
+            return lon, lat
+        lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+        x, y = warp_transform(WGS84, c["crs"], lon.ravel(), lat.ravel())
+        return np.reshape(x, lon.shape), np.reshape(y, lat.shape)
+
+    @staticmethod
+    def _to_lonlat(c, x, y):
+        """Raster-CRS (x, y) -> WGS84 (lon, lat)."""
+        if c["crs"] is None:
+            return x, y
+        lon, lat = warp_transform(c["crs"], WGS84, np.ravel(x), np.ravel(y))
+        return np.reshape(lon, np.shape(x)), np.reshape(lat, np.shape(y))
+
+    def locate(self, lat, lon):
+        """Vectorized lookup: (country index, tile_id) arrays; tile_id 0 where no tile contains the point."""
+        lat, lon = np.atleast_1d(np.asarray(lat, dtype=float)), np.atleast_1d(np.asarray(lon, dtype=float))
+        ci = np.full(lat.shape, -1, dtype=np.int64)
+        tid = np.zeros(lat.shape, dtype=np.int64)
+        for i, c in enumerate(self.countries):
+            if c["inverse"] is None:
+                continue
+            col, row = c["inverse"] * self._to_raster_crs(c, lon, lat)
+            with np.errstate(invalid="ignore"):
+                gr = np.floor(np.asarray(row) / c["tile_size"])
+                gc = np.floor(np.asarray(col) / c["tile_size"])
+            H, W = c["grid"].shape
+            inside = (tid == 0) & (gr >= 0) & (gr < H) & (gc >= 0) & (gc < W)
+            hit = np.zeros(lat.shape, dtype=np.int64)
+            hit[inside] = c["grid"][gr[inside].astype(np.int64), gc[inside].astype(np.int64)]
+            found = hit > 0
+            ci[found], tid[found] = i, hit[found]
+        return ci, tid
+
+    def history(self, ci: int, tile_id: int):
+        c = self.countries[ci]
+        if not 0 < tile_id < len(c["values"]) or (c["regime"][tile_id] < 0).all():
+            return None
+        r0, r1, c0, c1 = (int(v) for v in c["bounds"][tile_id])
+        rec = {"country": c["country"], "tile_id": int(tile_id), "r0": r0, "r1": r1, "c0": c0, "c1": c1}
+        if c["transform"] is not None:
+            lon, lat = self._to_lonlat(c, *(c["transform"] * ((c0 + c1) / 2, (r0 + r1) / 2)))
+            rec["center_lat"], rec["center_lon"] = round(float(lat), 6), round(float(lon), 6)
+        rec["history"] = [self._row(c, tile_id, yi) for yi in range(len(self.years)) if c["regime"][tile_id, yi] >= 0]
+        return rec
+
+    def _row(self, c, tile_id, yi):
+        row = {"year": self.years[yi], "region_type": REGION_TYPES[c["regime"][tile_id, yi]]}
+        for f, v in zip(self.features, c["values"][tile_id, yi].tolist()):
+            row[f] = None if v != v else v
+        return row
+
+    def _encode(self, ci: int, tile_id: int) -> bytes:
+        return json.dumps(self.history(ci, tile_id)).encode()
+
+    def country_index(self, name: str) -> int:
+        return self._by_name.get(name, -1)
+
+    def bbox(self, min_lat, min_lon, max_lat, max_lon, year=None, limit: int = 10000):
+        """Tiles whose grid cell overlaps the box, with their values in `year` (default: last year)."""
+        yi = self.years.index(int(year)) if year is not None else len(self.years) - 1
+        out = []
+        for c in self.countries:
+            if c["inverse"] is None:
+                continue
+            cols, rows = c["inverse"] * self._to_raster_crs(c, np.array([min_lon, max_lon, min_lon, max_lon]),
+                                                            np.array([min_lat, min_lat, max_lat, max_lat]))
+            H, W = c["grid"].shape
+            g0, g1 = max(int(np.floor(rows.min() / c["tile_size"])), 0), min(int(np.floor(rows.max() / c["tile_size"])) + 1, H)
+            h0, h1 = max(int(np.floor(cols.min() / c["tile_size"])), 0), min(int(np.floor(cols.max() / c["tile_size"])) + 1, W)
+            if g0 >= g1 or h0 >= h1:
+                continue
+            ids = c["grid"][g0:g1, h0:h1].ravel()
+            ids = ids[ids > 0]
+            ids = ids[c["regime"][ids, yi] >= 0]
+            for t in ids[: max(limit - len(out), 0)].tolist():
+                out.append({"country": c["country"], "tile_id": t, **self._row(c, t, yi)})
+        return out
+
+    def meta(self):
+        return {"years": self.years, "features": self.features, "region_types": REGION_TYPES,
+                "countries": {c["country"]: {"tile_size": c["tile_size"], "n_tiles": int((c["grid"] > 0).sum()),
+                                             "georeferenced": c["transform"] is not None}
+                              for c in self.countries}}
+
+
+def load_transforms(countries, data_path=None, cube_dir=None):
+    """{country: (Affine, CRS or None)} from data cubes when present, else from the header-only raster catalog."""
+    transforms = {}
+    catalog = raster_catalog.refresh(data_path, countries=countries)[0] if data_path and os.path.isdir(data_path) else None
+    for country in countries:
+        cube_fp = os.path.join(cube_dir, f"{country}_cube.tif") if cube_dir else None
+        if cube_fp and os.path.exists(cube_fp):
+            from week5_datacube import DataCube
+            with DataCube(cube_fp) as cube:
+                transforms[country] = (cube.transform, cube.ds.crs)
+        elif catalog is not None:
+            ent = raster_catalog.entries(catalog, country)
+            if ent:
+                ref = ent[min(ent)]
+                transforms[country] = (Affine(*ref["transform"]), CRS.from_user_input(ref["crs"]) if ref["crs"] else None)
+    return transforms
+
+
+def make_handler(index: TileIndex, verbose: bool = False):
+    meta = json.dumps(index.meta()).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"          # keep-alive: no TCP handshake per request
+        wbufsize = 1 << 16                     # buffered: headers + body leave in one write per response
+        disable_nagle_algorithm = True         # no 40 ms delayed-ACK stalls on keep-alive connections
+
+        def _send(self, body: bytes, status: int = 200):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status, msg):
+            self._send(json.dumps({"error": msg}).encode(), status)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            try:
+                if url.path == "/health":
+                    return self._send(b'{"status": "ok"}')
+                if url.path == "/meta":
+                    return self._send(meta)
+                if url.path == "/tile":
+                    if "tile_id" in q:
+                        ci, tid = index.country_index(q.get("country", "")), int(q["tile_id"])
+                    else:
+                        ci, tid = (int(a[0]) for a in index.locate(float(q["lat"]), float(q["lon"])))
+                    if ci < 0 or tid <= 0:
+                        return self._error(404, "no tile at this location")
+                    body = index.encoded(ci, tid)
+                    return self._send(body) if body != b"null" else self._error(404, "unknown tile")
+                if url.path == "/bbox":
+                    rows = index.bbox(float(q["min_lat"]), float(q["min_lon"]), float(q["max_lat"]),
+                                      float(q["max_lon"]), q.get("year"), int(q.get("limit", 10000)))
+                    return self._send(json.dumps({"n": len(rows), "tiles": rows}).encode())
+                return self._error(404, f"unknown endpoint {url.path}")
+            except (KeyError, ValueError) as e:
+                return self._error(400, f"bad query: {e}")
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/points":
+                return self._error(404, "unknown endpoint")
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                pts = np.asarray(body["points"], dtype=float).reshape(-1, 2)
+            except (KeyError, ValueError) as e:
+                return self._error(400, f"bad body: {e}")
+            ci, tid = index.locate(pts[:, 0], pts[:, 1])
+            parts = [index.encoded(int(c), int(t)) if t > 0 else b"null" for c, t in zip(ci, tid)]
+            self._send(b'{"results": [' + b", ".join(parts) + b"]}")
+
+        def log_message(self, *args):
+            if verbose:
+                super().log_message(*args)
+
+    return Handler
+
+
+def benchmark(index: TileIndex, n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    pts = []
+    for c in index.countries:
+        if c["transform"] is None:
+            continue
+        ids = np.flatnonzero((c["regime"] >= 0).any(axis=1))
+        b = c["bounds"][rng.choice(ids, n)]
+        lon, lat = TileIndex._to_lonlat(c, *(c["transform"] * ((b[:, 2] + b[:, 3]) / 2, (b[:, 0] + b[:, 1]) / 2)))
+        pts.append(np.c_[lat, lon])
+    if not pts:
+        print("[WARN] no georeferenced country to benchmark")
+        return
+    pts = np.concatenate(pts)[rng.permutation(n * len(pts))[:n]]
+
+    t0 = time.perf_counter()
+    for lat, lon in pts:
+        ci, tid = index.locate(lat, lon)
+        index.encoded(int(ci[0]), int(tid[0]))
+    dt = time.perf_counter() - t0
+    t1 = time.perf_counter()
+    index.locate(pts[:, 0], pts[:, 1])
+    dt_batch = time.perf_counter() - t1
+    print(f"{n:,} single lookups: {dt / n * 1e6:.1f} us/lookup ({n / dt:,.0f}/s) | "
+          f"batch locate: {dt_batch / n * 1e6:.2f} us/point")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--panel", required=True, help="Tile panel CSV (with or without geographic infrastructure columns)")
+    ap.add_argument("--data_path", default=None, help="Root with <Country>/<Country>_<Year>.tif (raster transforms)")
+    ap.add_argument("--cube_dir", default=None, help="Folder with <Country>_cube.tif (transforms; used when present)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--cache_size", type=int, default=65536, help="Encoded tile histories kept in the LRU cache")
+    ap.add_argument("--benchmark", type=int, default=0, help="Time N in-process lookups and exit")
+    ap.add_argument("--verbose", action="store_true", help="Log every request")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    panel = pd.read_csv(args.panel)
+    countries = sorted(panel["country"].unique())
+    index = TileIndex(panel, load_transforms(countries, args.data_path, args.cube_dir), args.cache_size)
+    del panel
+    print(f"Indexed {sum(int((c['grid'] > 0).sum()) for c in index.countries):,} tiles x {len(index.years)} years "
+          f"x {len(index.features)} features in {time.perf_counter() - t0:.1f}s")
+
+    if args.benchmark:
+        benchmark(index, args.benchmark)
+        return
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(index, args.verbose))
+    print(f"Serving on http://{args.host}:{args.port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# week6_urban_clusters.py
+#
+# Urban agglomerations as connected components of urban tiles on the tile grid.
+#
+# distance_to_urban_core / local_urban_density (week6_add_geographic_infrastructure.py) look
+# at urban_core tiles one at a time. Here every country-year's regime grid is labelled into
+# connected clusters (scipy.ndimage.label: one linear-time pass), so a metropolitan area is
+# one object with a size, light total and population total:
+#
+#   --regimes urban_core                cluster = connected urban_core tiles (default)
+#   --regimes urban_core,dense_dim      also bridge through dense_dim tiles
+#
+# Clusters are tracked across years by tile overlap: labels of year t and t+1 are compared on
+# the shared grid and all (cluster_t, cluster_t+1) overlap counts come from one bincount. Each
+# new cluster inherits the id of the predecessor it overlaps most; when a cluster splits, the
+# child with the largest overlap keeps the id and the others get new ids with parent_id set.
+#
+# Per-tile features come from the same label grid:
+#   cluster_id, cluster_n_tiles                     cluster the tile belongs to (-1 / 0 if none)
+#   distance_to_large_cluster                       pixels to the nearest tile of a cluster with
+#                                                   >= --large_min_tiles tiles (Euclidean distance
+#                                                   transform on the grid x tile size)
+#
+# Outputs (written to --out_dir):
+#   urban_clusters.csv          country, year, cluster_id, parent_id, n_tiles, light_total,
+#                               pop_total, centroid_r, centroid_c
+#   tiles_cluster_features.csv  country, year, tile_id, cluster_id, cluster_n_tiles,
+#                               distance_to_large_cluster, log_distance_to_large_cluster
+#
+# Run:
+#   python scripts/week6_urban_clusters.py \
+#       --panel figures/week6_outputs/tiles_panel_all_countries_2014-2023.csv \
+#       --out_dir figures/week6_outputs/urban_clusters
+
+import os, argparse
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+
+from spatial_weights import grid_coords
+
+STRUCTURES = {
+    "queen": np.ones((3, 3), dtype=int),
+    "rook": ndimage.generate_binary_structure(2, 1).astype(int),
+}
+
+
+def label_grid(gr, gc, member, shape, connectivity="queen"):
+    """Label connected member tiles; returns (label image, n_clusters). 0 = background."""
+    grid = np.zeros(shape, dtype=bool)
+    grid[gr[member], gc[member]] = True
+    return ndimage.label(grid, structure=STRUCTURES[connectivity])
+
+
+def cluster_table(labels, n, gr, gc, light, pop, tile_size):
+    """Size, light/pop totals and pixel centroid per cluster label 1..n, via bincount."""
+    lab = labels[gr, gc]
+    size = np.bincount(lab, minlength=n + 1)[1:]
+    light_total = np.bincount(lab, weights=light, minlength=n + 1)[1:]
+    pop_total = np.bincount(lab, weights=pop, minlength=n + 1)[1:]
+    cr = np.bincount(lab, weights=(gr + 0.5) * tile_size, minlength=n + 1)[1:]
+    cc = np.bincount(lab, weights=(gc + 0.5) * tile_size, minlength=n + 1)[1:]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.DataFrame({"label": np.arange(1, n + 1), "n_tiles": size,
+                             "light_total": light_total, "pop_total": pop_total,
+                             "centroid_r": cr / size, "centroid_c": cc / size})
+
+
+def match_clusters(prev_labels, n_prev, prev_ids, labels, n, next_id):
+    """
+    Persistent ids for the clusters in `labels` given last year's labels/ids.
+    Returns (ids for labels 1..n, parent ids, next free id).
+    """
+    ids = np.full(n, -1, dtype=np.int64)
+    parents = np.full(n, -1, dtype=np.int64)
+    if prev_labels is not None and n_prev > 0 and n > 0:
+        both = (prev_labels > 0) & (labels > 0)
+        key = prev_labels[both].astype(np.int64) * (n + 1) + labels[both]
+        overlap = np.bincount(key, minlength=(n_prev + 1) * (n + 1)).reshape(n_prev + 1, n + 1)[1:, 1:]
+
+        best_prev = overlap.argmax(axis=0)                     # predecessor per current cluster
+        has_prev = overlap.max(axis=0) > 0
+        parents[has_prev] = prev_ids[best_prev[has_prev]]
+
+        # each predecessor id goes to its largest-overlap child; other children start new ids
+        taken = set()
+        for j in np.argsort(-overlap.max(axis=0), kind="stable"):
+            pid = int(prev_ids[best_prev[j]])
+            if has_prev[j] and pid not in taken:
+                ids[j], parents[j] = pid, -1
+                taken.add(pid)
+
+    fresh = ids < 0
+    ids[fresh] = np.arange(next_id, next_id + fresh.sum())
+    return ids, parents, next_id + int(fresh.sum())
+
+
+def country_clusters(cdf, regimes, connectivity="queen", large_min_tiles=5):
+    gr_all, gc_all, tile_size = grid_coords(cdf)
+    shape = (int(gr_all.max()) + 1, int(gc_all.max()) + 1)
+
+    cluster_parts, tile_parts = [], []
+    prev_labels, n_prev, prev_ids, next_id = None, 0, None, 1
+    for year, df in cdf.groupby("year", sort=True):
+        gr, gc, _ = grid_coords(df, tile_size)
+        member = df["region_type"].isin(regimes).to_numpy()
+        labels, n = label_grid(gr, gc, member, shape, connectivity)
+
+        npix = df["n_valid_pixels"].to_numpy(dtype=float) if "n_valid_pixels" in df else np.ones(len(df))
+        light = np.where(member, df["mean_light"].to_numpy(dtype=float) * npix, 0.0)
+        pop = np.where(member, df["mean_pop"].to_numpy(dtype=float) * npix, 0.0)
+        table = cluster_table(labels, n, gr, gc, np.nan_to_num(light), np.nan_to_num(pop), tile_size)
+
+        ids, parents, next_id = match_clusters(prev_labels, n_prev, prev_ids, labels, n, next_id)
+        table.insert(0, "cluster_id", ids)
+        table.insert(1, "parent_id", parents)
+        table.insert(0, "year", int(year))
+        table.insert(0, "country", df["country"].iat[0])
+        cluster_parts.append(table.drop(columns="label"))
+
+        # Per-tile features from the same label image
+        lab = labels[gr, gc]
+        size = np.r_[0, table["n_tiles"].to_numpy()]
+        large = np.isin(labels, 1 + np.flatnonzero(table["n_tiles"].to_numpy() >= large_min_tiles))
+        if large.any():
+            dist = ndimage.distance_transform_edt(~large) * tile_size
+            d = dist[gr, gc]
+        else:
+            d = np.full(len(df), np.nan)
+        tile_parts.append(pd.DataFrame({
+            "country": df["country"].to_numpy(),
+            "year": df["year"].to_numpy(),
+            "tile_id": df["tile_id"].to_numpy(),
+            "cluster_id": np.where(lab > 0, np.r_[-1, ids][lab], -1),
+            "cluster_n_tiles": size[lab],
+            "distance_to_large_cluster": d,
+            "log_distance_to_large_cluster": np.log1p(d),
+        }))
+
+        prev_labels, n_prev, prev_ids = labels, n, ids
+
+    return pd.concat(cluster_parts, ignore_index=True), pd.concat(tile_parts, ignore_index=True)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--panel", required=True, help="tiles_panel_all_countries_<start>-<end>.csv")
+    ap.add_argument("--out_dir", default=None, help="Output folder (default: <panel dir>/urban_clusters)")
+    ap.add_argument("--regimes", default="urban_core", help="Comma-separated regimes forming clusters")
+    ap.add_argument("--connectivity", choices=list(STRUCTURES), default="queen")
+    ap.add_argument("--large_min_tiles", type=int, default=5, help="Minimum tiles for a 'large' cluster")
+    args = ap.parse_args()
+
+    regimes = [r.strip() for r in args.regimes.split(",") if r.strip()]
+    out_dir = args.out_dir or os.path.join(os.path.dirname(os.path.abspath(args.panel)), "urban_clusters")
+    os.makedirs(out_dir, exist_ok=True)
+
+    panel = pd.read_csv(args.panel)
+    clusters, tiles = [], []
+    for country, cdf in panel.groupby("country", sort=True):
+        c, t = country_clusters(cdf, regimes, args.connectivity, args.large_min_tiles)
+        clusters.append(c)
+        tiles.append(t)
+        per_year = c.groupby("year").agg(n=("cluster_id", "size"), largest=("n_tiles", "max"))
+        print(f"{country}: {c['cluster_id'].nunique()} tracked clusters | "
+              f"clusters/year {per_year['n'].min()}-{per_year['n'].max()} | "
+              f"largest {per_year['largest'].max()} tiles")
+
+    pd.concat(clusters, ignore_index=True).to_csv(os.path.join(out_dir, "urban_clusters.csv"), index=False)
+    pd.concat(tiles, ignore_index=True).to_csv(os.path.join(out_dir, "tiles_cluster_features.csv"), index=False)
+    print("Saved:", out_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import os
 
+from scatter_density import draw_density_scatter, draw_ols_line
+
 # ==========================================
 # 1. SETUP
 # ==========================================
@@ -13,61 +15,84 @@ BASE_PATH = r"C:\Users\amimi\OneDrive - Duke University\SCHOOL\SPRING 2026\STATS
 COUNTRIES = ["Brazil", "China", "Morocco"]
 TARGET_YEAR = 2023  # The plan specifies 2023 as the main result
 
-# ==========================================
-# 2. GENERATE SCATTER PLOTS (Step 4 of Plan)
-# ==========================================
-print(f"🚀 Generating Baseline Scatter Plots for {TARGET_YEAR}...\n")
-
-for country in COUNTRIES:
-    filename = f"tiles_{country}_{TARGET_YEAR}.csv"
-    file_path = os.path.join(BASE_PATH, filename)
-    
-    if not os.path.exists(file_path):
-        print(f"⚠️ Skipping {country}: File not found for {TARGET_YEAR}")
-        continue
-
-    # Load & Transform
-    df = pd.read_csv(file_path)
-    
+# "points" = seaborn scatter + OLS line, "density" = per-region 2-D histogram raster with a
+# closed-form OLS line (no bootstrap; constant render time for any number of tiles)
+SCATTER_MODE = "points"
+REGION_ORDER = ['urban_core', 'dense_dim', 'bright_sparse', 'mixed', 'empty_or_rural']
+
+
+# Also used by week7_render_figures.py, which renders these charts in a process pool.
+def plot_baseline_scatter(df, country, year, output_name, dpi=300, mode=None):
+    mode = mode or SCATTER_MODE
     # Handle pop column name difference
     pop_col = 'sum_pop' if 'sum_pop' in df.columns else 'mean_pop'
-    
+
     df['log_pop'] = np.log1p(df[pop_col])
     df['log_light'] = np.log1p(df['mean_light'])
-    
+
     # Create the Plot
-    plt.figure(figsize=(10, 7))
-    
-    # We use a scatter plot with transparency (alpha) so we can see density
-    sns.scatterplot(
-        data=df, 
-        x='log_pop', 
-        y='log_light', 
-        hue='region_type',  # Color by Region (Urban/Rural)
-        alpha=0.3,          # Make dots transparent
-        palette='viridis',  # Color scheme
-        s=15                # Dot size
-    )
-    
-    # Add a global regression line (The "Baseline Fit")
-    sns.regplot(
-        data=df, 
-        x='log_pop', 
-        y='log_light', 
-        scatter=False, 
-        color='red', 
-        line_kws={"linestyle": "--", "label": "Global Trend"}
-    )
-
-    plt.title(f"Baseline Relationship: Population vs. Light\n{country} ({TARGET_YEAR})")
+    fig = plt.figure(figsize=(10, 7))
+
+    if mode == "density":
+        # Same viridis colours as the point version, one raster for all tiles
+        palette = dict(zip(REGION_ORDER, sns.color_palette('viridis', len(REGION_ORDER))))
+        ax = plt.gca()
+        handles = draw_density_scatter(ax, df['log_pop'], df['log_light'], df['region_type'].astype(str),
+                                       REGION_ORDER, palette)
+        line = draw_ols_line(ax, df['log_pop'], df['log_light'],
+                             color='red', linestyle='--', label="Global Trend")
+        legend_handles = handles + ([line] if line is not None else [])
+    else:
+        legend_handles = None  # let matplotlib collect the seaborn artists
+
+        # We use a scatter plot with transparency (alpha) so we can see density
+        sns.scatterplot(
+            data=df,
+            x='log_pop',
+            y='log_light',
+            hue='region_type',  # Color by Region (Urban/Rural)
+            alpha=0.3,          # Make dots transparent
+            palette='viridis',  # Color scheme
+            s=15                # Dot size
+        )
+
+        # Add a global regression line (The "Baseline Fit"), closed-form OLS: no bootstrap CI
+        draw_ols_line(plt.gca(), df['log_pop'], df['log_light'],
+                      color='red', linestyle='--', label="Global Trend")
+
+    plt.title(f"Baseline Relationship: Population vs. Light\n{country} ({year})")
     plt.xlabel("Log(Population)")
     plt.ylabel("Log(Nighttime Lights)")
-    plt.legend(title="Region Type", bbox_to_anchor=(1.05, 1), loc='upper left')
+    plt.legend(handles=legend_handles, title="Region Type", bbox_to_anchor=(1.05, 1), loc='upper left')
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
-    
-    # Save the file for your presentation
-    output_name = f"scatter_{country}_{TARGET_YEAR}.png"
-    plt.savefig(output_name, dpi=300)
-    print(f"✅ Saved chart: {output_name}")
-    plt.show()
\ No newline at end of file
+
+    plt.savefig(output_name, dpi=dpi)
+    plt.close(fig)
+
+
+def main():
+    # ==========================================
+    # 2. GENERATE SCATTER PLOTS (Step 4 of Plan)
+    # ==========================================
+    print(f"🚀 Generating Baseline Scatter Plots for {TARGET_YEAR}...\n")
+
+    for country in COUNTRIES:
+        filename = f"tiles_{country}_{TARGET_YEAR}.csv"
+        file_path = os.path.join(BASE_PATH, filename)
+
+        if not os.path.exists(file_path):
+            print(f"⚠️ Skipping {country}: File not found for {TARGET_YEAR}")
+            continue
+
+        # Load & Transform
+        df = pd.read_csv(file_path)
+
+        # Save the file for your presentation
+        output_name = f"scatter_{country}_{TARGET_YEAR}.png"
+        plot_baseline_scatter(df, country, TARGET_YEAR, output_name)
+        print(f"✅ Saved chart: {output_name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,71 +3,107 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import os
 
+from week6_structure_cube import (
+    CUBE_NAME, build_structure_cube, save_structure_cube, load_structure_cube,
+    cube_is_current, cube_to_long, transition_matrix,
+)
+
 # ==========================================
 # 1. SETUP
 # ==========================================
 BASE_PATH = r"C:\Users\amimi\OneDrive - Duke University\SCHOOL\SPRING 2026\STATS201\Week 6 Files\STATS201-Course-project\figures\week6_outputs"
+PANEL_PATH = os.path.join(BASE_PATH, "tiles_panel_all_countries_2014-2023.csv")
+CUBE_PATH = os.path.join(BASE_PATH, CUBE_NAME)
 COUNTRIES = ["Brazil", "China", "Morocco"]
 YEARS = range(2014, 2024)
 
-print("🚀 Analyzing Structural Evolution (Region Shares)...")
+# Sort columns for consistency (Urban at bottom, Rural at top usually looks best)
+DESIRED_ORDER = ['urban_core', 'mixed', 'dense_dim', 'bright_sparse', 'empty_or_rural']
 
-all_data = []
 
 # ==========================================
-# 2. AGGREGATE DATA
-# ==========================================
-for country in COUNTRIES:
-    for year in YEARS:
-        filename = f"tiles_{country}_{year}.csv"
-        file_path = os.path.join(BASE_PATH, filename)
-        
-        if not os.path.exists(file_path):
-            continue
-            
-        df = pd.read_csv(file_path)
-        
-        # Count tiles per region type
-        if 'region_type' in df.columns:
-            counts = df['region_type'].value_counts(normalize=True).reset_index()
-            counts.columns = ['Region', 'Share']
-            counts['Country'] = country
-            counts['Year'] = year
-            all_data.append(counts)
-
-# Combine into one DataFrame
-share_df = pd.concat(all_data, ignore_index=True)
-
+# 2. PLOTTING HELPERS
 # ==========================================
-# 3. VISUALIZE (Stacked Area Chart)
-# ==========================================
-# We create a separate chart for each country
-for country in COUNTRIES:
+# Also used by week7_render_figures.py, which renders these charts in a process pool.
+def plot_structure_shares(share_df, country, output_name, dpi=300):
+    """Stacked area chart of region shares over time for one country."""
     country_data = share_df[share_df['Country'] == country]
-    
+
     # Pivot for plotting: Rows=Year, Cols=Region, Values=Share
     pivot_df = country_data.pivot(index='Year', columns='Region', values='Share').fillna(0)
-    
-    # Sort columns for consistency (Urban at bottom, Rural at top usually looks best)
-    # Adjust this order based on your specific region names
-    desired_order = ['urban_core', 'mixed', 'dense_dim', 'bright_sparse', 'empty_or_rural']
+
     # Filter to keep only columns that actually exist in the data
-    existing_order = [r for r in desired_order if r in pivot_df.columns]
+    existing_order = [r for r in DESIRED_ORDER if r in pivot_df.columns]
     pivot_df = pivot_df[existing_order]
 
-    plt.figure(figsize=(10, 6))
-    
+    fig = plt.figure(figsize=(10, 6))
+
     # Stackplot
     plt.stackplot(pivot_df.index, pivot_df.T, labels=pivot_df.columns, alpha=0.8, cmap='viridis')
-    
-    plt.title(f"Structural Evolution: Region Shares Over Time\n{country} (2014-2023)")
+
+    plt.title(f"Structural Evolution: Region Shares Over Time\n{country} ({pivot_df.index.min()}-{pivot_df.index.max()})")
     plt.xlabel("Year")
     plt.ylabel("Share of Total Land Area (Tiles)")
     plt.margins(0, 0) # Removes white space on sides
     plt.legend(loc='upper left', bbox_to_anchor=(1, 1), title="Region Type")
     plt.tight_layout()
-    
-    output_name = f"structure_evolution_{country}.png"
-    plt.savefig(output_name, dpi=300)
-    print(f"✅ Saved chart: {output_name}")
-    plt.show()
\ No newline at end of file
+
+    plt.savefig(output_name, dpi=dpi)
+    plt.close(fig)
+
+
+def plot_transitions(transitions, regions, country, years, output_name, dpi=300):
+    """Heatmap of the tile-level Markov matrix pooled over all consecutive year pairs."""
+    P = transition_matrix(transitions.sum(axis=0))
+
+    fig = plt.figure(figsize=(8, 6.5))
+    sns.heatmap(P, annot=True, fmt=".2f", cmap="Blues", vmin=0, vmax=1,
+                xticklabels=regions, yticklabels=regions, cbar_kws={"label": "P(to | from)"})
+    plt.title(f"Region-Type Transitions (Year t → t+1)\n{country} ({int(years[0])}-{int(years[-1])})")
+    plt.xlabel("Region type in year t+1")
+    plt.ylabel("Region type in year t")
+    plt.tight_layout()
+
+    plt.savefig(output_name, dpi=dpi)
+    plt.close(fig)
+
+
+def main():
+    print("🚀 Analyzing Structural Evolution (Region Shares)...")
+
+    # ==========================================
+    # 3. AGGREGATE DATA
+    # ==========================================
+    # Shares and transitions come from the structure cube (one grouped pass over the panel).
+    # (Re)build it if week6_structure_cube.py has not been run yet or the panel changed since.
+    if not cube_is_current(CUBE_PATH, PANEL_PATH):
+        panel = pd.read_csv(PANEL_PATH, usecols=["country", "year", "tile_id", "region_type"])
+        save_structure_cube(build_structure_cube(panel), CUBE_PATH, panel_path=PANEL_PATH)
+        print(f"✅ Built structure cube: {CUBE_PATH}")
+
+    cube = load_structure_cube(CUBE_PATH)
+
+    share_df = cube_to_long(cube)
+    share_df = share_df[share_df['Year'].isin(YEARS) & (share_df['Count'] > 0)]
+
+    # ==========================================
+    # 4. VISUALIZE (Stacked Area Chart + Transition Matrix)
+    # ==========================================
+    # We create a separate chart for each country
+    regions = list(cube['regions'])
+    for country in COUNTRIES:
+        if country not in cube['countries']:
+            continue
+
+        output_name = f"structure_evolution_{country}.png"
+        plot_structure_shares(share_df, country, output_name)
+        print(f"✅ Saved chart: {output_name}")
+
+        ci = list(cube['countries']).index(country)
+        output_name = f"structure_transitions_{country}.png"
+        plot_transitions(cube['transitions'][ci], regions, country, cube['years'], output_name)
+        print(f"✅ Saved chart: {output_name}")
+
+
+if __name__ == "__main__":
+    main()
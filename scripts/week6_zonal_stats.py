@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# week6_zonal_stats.py
+#
+# Zonal statistics for administrative units (admin-1 / admin-2 polygons) on the same fast path
+# as the tile statistics of week6_build_tiles_all_years.py.
+#
+#   1. the polygons of each country are rasterized ONCE onto the country's raster grid into an
+#      integer label raster (label k = k-th polygon, 0 = outside every zone). It is cached as
+#      .npy next to a JSON key (polygon file size/mtime, grid shape/transform/CRS, options) and
+#      memory-mapped afterwards, so later runs and years never touch the geometries again.
+#   2. every year is streamed in strips (iter_strips / DataCube.strip); per-zone sums come from
+#      strip_sums() -- the same bincount reduction the tiling pass uses -- and are merged across
+#      strips before finalize_stats(). Any --tile_stats statistic works for zones as well.
+#   3. with --panel, each valid pixel also carries the region_type of its tile that year, and one
+#      extra bincount gives the regime mix of every zone (pixel shares per regime).
+#
+# --zones tiles uses the tile grid as the label raster (label = tile_id), which reproduces the
+# tiling pass's tile statistics (before its min_valid filter) through this engine. Tile labels are
+# computed arithmetically per strip (TileLabels), never stored at full resolution.
+#
+# Polygons: GeoJSON is read directly (rasterio.features / rasterio.warp only); other formats
+# (Shapefile, GeoPackage, ...) need geopandas. Polygons are reprojected to the raster CRS.
+# Where polygons overlap, the later feature wins.
+#
+# Outputs (written to --out_dir):
+#   zonal_stats_<zones>.csv   country, year, zone_label, zone_id, zone_name, n_valid_pixels,
+#                             mean_light, mean_pop, <tile_stats>, share_<regime>... (with --panel)
+#   labels/                   cached label rasters (<Country>_<zones>.npy + .json)
+#
+# Run:
+#   python scripts/week6_zonal_stats.py --data_path data/week_5_robustness_tif_images \
+#       --zones "data/admin/{country}_ADM1.geojson" --id_field shapeID --name_field shapeName \
+#       --panel figures/week6_outputs/tiles_panel_all_countries_2014-2023.csv \
+#       --out_dir figures/week6_outputs/zonal
+
+import os, json, argparse, time
+import numpy as np
+import pandas as pd
+from rasterio import features
+from rasterio.crs import CRS
+from rasterio.transform import Affine
+from rasterio.warp import transform_geom
+
+import raster_catalog
+from week6_build_tiles_all_years import (
+    REGION_TYPES, TILE_STATS, LIT_THRESHOLD, DEFAULT_TILE_STATS,
+    choose_tile_size, make_tiles, iter_strips, strip_sums, merge_sums, finalize_stats,
+)
+
+LABEL_DTYPE = np.int32
+
+
+def read_zones(fp: str, id_field: str = None, name_field: str = None):
+    """([(geometry, zone_id, zone_name)], source CRS). GeoJSON natively, other formats via geopandas."""
+    if fp.lower().endswith((".geojson", ".json")):
+        with open(fp) as fh:
+            fc = json.load(fh)
+        src_crs = (fc.get("crs") or {}).get("properties", {}).get("name", "EPSG:4326")
+        feats = [(f["geometry"], f.get("properties") or {}) for f in fc["features"] if f.get("geometry")]
+    else:
+        try:
+            import geopandas as gpd
+        except ImportError:
+            raise ImportError(f"Reading {fp} needs geopandas (pip install geopandas); GeoJSON works without it.")
+        gdf = gpd.read_file(fp)
+        src_crs = gdf.crs.to_string() if gdf.crs else "EPSG:4326"
+        props = gdf.drop(columns="geometry").to_dict("records")
+        feats = [(g.__geo_interface__, p) for g, p in zip(gdf.geometry, props) if g is not None]
+
+    zones = []
+    for i, (geom, props) in enumerate(feats, start=1):
+        zid = props[id_field] if id_field else i
+        name = props.get(name_field) if name_field else None
+        zones.append((geom, zid if isinstance(zid, (int, str)) else str(zid), name))
+    return zones, src_crs
+
+
+def rasterize_zones(zones, src_crs, shape, transform, crs, all_touched: bool = False) -> np.ndarray:
+    """Label raster on the (shape, transform, crs) grid: label k = zones[k-1], 0 = no zone."""
+    reproject = crs is not None and CRS.from_user_input(src_crs) != CRS.from_user_input(crs)
+    shapes = [(transform_geom(src_crs, crs, geom) if reproject else geom, k)
+              for k, (geom, _, _) in enumerate(zones, start=1)]
+    return features.rasterize(shapes, out_shape=shape, transform=transform, fill=0,
+                              all_touched=all_touched, dtype=LABEL_DTYPE)
+
+
+class TileLabels:
+    """
+    The tile grid as a label raster (label = tile_id, the enumerate index of make_tiles), computed
+    per row slice as (r // T) * ncols + c // T + 1 -- nothing is built or cached at full resolution.
+    """
+
+    def __init__(self, shape, tile_size: int):
+        self.shape, self.tile_size = tuple(shape), tile_size
+        self.ncols = -(-self.shape[1] // tile_size)
+        self._col = (np.arange(self.shape[1]) // tile_size + 1).astype(LABEL_DTYPE)
+
+    def __getitem__(self, rows: slice) -> np.ndarray:
+        r = np.arange(self.shape[0], dtype=LABEL_DTYPE)[rows] // self.tile_size
+        return r[:, None] * LABEL_DTYPE(self.ncols) + self._col[None, :]
+
+
+def cached_labels(cache_dir: str, name: str, key: dict, build):
+    """
+    (memory-mapped label raster, zone table) from cache_dir/<name>.npy when its stored key equals
+    `key`; otherwise build() -> (labels, zone table) is run and cached.
+    """
+    fp = os.path.join(cache_dir, f"{name}.npy")
+    meta_fp = os.path.join(cache_dir, f"{name}.json")
+    if os.path.exists(fp) and os.path.exists(meta_fp):
+        with open(meta_fp) as fh:
+            meta = json.load(fh)
+        if meta["key"] == key:
+            return np.load(fp, mmap_mode="r"), meta["zones"]
+
+    labels, zones = build()
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(fp, labels)
+    with open(meta_fp, "w") as fh:
+        json.dump({"key": key, "zones": zones}, fh)
+    return np.load(fp, mmap_mode="r"), zones
+
+
+def zonal_reduce(strips, labels, n_labels: int, stats, lit_threshold: float = LIT_THRESHOLD,
+                 tile_labels=None, tile_regime=None):
+    """
+    Merged strip_sums() over strips (r0, r1, nl, pop) of one year, and -- when tile_labels and
+    tile_regime (regime code per tile_id, len(REGION_TYPES) = no regime) are given -- valid-pixel
+    counts per (label, regime) as an (n_labels, len(REGION_TYPES) + 1) array.
+    """
+    n_reg = len(REGION_TYPES) + 1
+    acc, mix = None, None
+    if tile_regime is not None:
+        mix = np.zeros((n_labels, n_reg), dtype=np.int64)
+
+    for r0, r1, nl, pop in strips:
+        lab = np.asarray(labels[r0:r1])
+        acc = merge_sums(acc, strip_sums(nl, pop, lab, n_labels, stats, lit_threshold))
+        if mix is not None:
+            valid = np.isfinite(nl) & np.isfinite(pop) & (nl >= 0) & (pop >= 0)
+            reg = tile_regime[np.asarray(tile_labels[r0:r1])[valid]]
+            mix += np.bincount(lab[valid].astype(np.int64) * n_reg + reg,
+                               minlength=n_labels * n_reg).reshape(n_labels, n_reg)
+    return acc, mix
+
+
+def year_strips(fp: str, h: int, strip_rows: int, cube=None, year: int = None):
+    """Strips (r0, r1, nl, pop) of one year, from the cube when given, else windowed reads of fp."""
+    bands = {(r0, min(r0 + strip_rows, h)): None for r0 in range(0, h, strip_rows)}
+    if cube is not None:
+        for r0, r1 in sorted(bands):
+            nl, pop = cube.strip(year, r0, r1, ["light", "pop"])
+            yield r0, r1, nl, pop
+    else:
+        for _, r0, r1, nl, pop in iter_strips(bands, h, fp=fp):
+            yield r0, r1, nl, pop
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data_path", required=True, help="Root folder containing <Country>/<Country>_<Year>.tif")
+    ap.add_argument("--zones", required=True,
+                    help="Polygon file per country, '{country}' is substituted (e.g. data/admin/{country}_ADM1.geojson), "
+                         "or 'tiles' for the tile grid")
+    ap.add_argument("--id_field", default=None, help="Polygon attribute used as zone_id (default: feature number)")
+    ap.add_argument("--name_field", default=None, help="Polygon attribute used as zone_name")
+    ap.add_argument("--all_touched", action="store_true", help="Burn every pixel a polygon touches")
+    ap.add_argument("--panel", default=None, help="Tile panel with region_type; adds per-zone regime mixes")
+    ap.add_argument("--out_dir", default="figures/week6_outputs/zonal")
+    ap.add_argument("--cache_dir", default=None, help="Label raster cache (default: <out_dir>/labels)")
+    ap.add_argument("--cube_dir", default=None, help="Folder with <Country>_cube.tif (used when present)")
+    ap.add_argument("--countries", default="Morocco,Brazil,China", help="Comma-separated list")
+    ap.add_argument("--start_year", type=int, default=2014)
+    ap.add_argument("--end_year", type=int, default=2023)
+    ap.add_argument("--tile_stats", default="",
+                    help=f"Extra statistics per zone, comma-separated from {TILE_STATS}")
+    ap.add_argument("--lit_threshold", type=float, default=LIT_THRESHOLD)
+    ap.add_argument("--strip_rows", type=int, default=256, help="Raster rows per streamed strip")
+    args = ap.parse_args()
+
+    countries = [c.strip() for c in args.countries.split(",") if c.strip()]
+    stats = list(dict.fromkeys(DEFAULT_TILE_STATS + [s.strip() for s in args.tile_stats.split(",") if s.strip()]))
+    unknown = [s for s in stats if s not in TILE_STATS]
+    if unknown:
+        raise ValueError(f"Unknown tile stats {unknown}. Choose from {TILE_STATS}")
+    tiles_mode = args.zones == "tiles"
+    zones_name = "tiles" if tiles_mode else os.path.splitext(os.path.basename(args.zones))[0].replace("{country}", "")
+    zones_name = zones_name.strip("_") or "zones"
+    cache_dir = args.cache_dir or os.path.join(args.out_dir, "labels")
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    panel = None
+    if args.panel:
+        panel = pd.read_csv(args.panel, usecols=["country", "year", "tile_id", "region_type"])
+        panel["regime_code"] = pd.Categorical(panel["region_type"], categories=REGION_TYPES).codes
+
+    t0 = time.perf_counter()
+    catalog, _ = raster_catalog.refresh(args.data_path, countries=countries)
+    parts = []
+    for country in countries:
+        ent = raster_catalog.entries(catalog, country)
+        years = [y for y in sorted(ent) if args.start_year <= y <= args.end_year]
+        if not years:
+            print(f"[WARN] No rasters for {country} in {args.start_year}-{args.end_year}")
+            continue
+
+        # Same reference grid as the tiling pass
+        ref = ent[years[0]]
+        shape = (ref["height"], ref["width"])
+        tile_size = choose_tile_size(*shape, country)
+        tiles = make_tiles(*shape, tile_size)
+        grid_key = {"shape": list(shape), "transform": ref["transform"], "crs": ref["crs"]}
+
+        tile_labels = TileLabels(shape, tile_size) if tiles_mode or panel is not None else None
+        if tiles_mode:
+            labels, zone_table = tile_labels, [[i, None] for i in range(1, len(tiles) + 1)]
+        else:
+            zones_fp = args.zones.format(country=country)
+            if not os.path.exists(zones_fp):
+                print(f"[WARN] Missing zones file: {zones_fp}")
+                continue
+            st = os.stat(zones_fp)
+            key = {**grid_key, "source": os.path.abspath(zones_fp), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                   "id_field": args.id_field, "name_field": args.name_field, "all_touched": args.all_touched}
+
+            def build(zones_fp=zones_fp):
+                zones, src_crs = read_zones(zones_fp, args.id_field, args.name_field)
+                labels = rasterize_zones(zones, src_crs, shape, Affine(*ref["transform"]), ref["crs"],
+                                         args.all_touched)
+                return labels, [[zid, name] for _, zid, name in zones]
+
+            labels, zone_table = cached_labels(cache_dir, f"{country}_{zones_name}", key, build)
+        n_labels = len(zone_table) + 1
+
+        cube = None
+        cube_fp = os.path.join(args.cube_dir, f"{country}_cube.tif") if args.cube_dir else None
+        if cube_fp and os.path.exists(cube_fp):
+            from week5_datacube import DataCube
+            cube = DataCube(cube_fp)
+
+        try:
+            for year in years:
+                in_cube = cube is not None and year in cube.years
+                if not in_cube and (ent[year]["height"], ent[year]["width"]) != shape:
+                    print(f"[WARN] {country} {year}: shape differs from the label grid, skipping")
+                    continue
+                fp = os.path.join(args.data_path, country, f"{country}_{year}.tif")
+                strips = year_strips(fp, shape[0], args.strip_rows, cube if in_cube else None, year)
+
+                tile_regime = None
+                if panel is not None:
+                    tile_regime = np.full(len(tiles) + 1, len(REGION_TYPES), dtype=np.int64)
+                    p = panel[(panel["country"] == country) & (panel["year"] == year)]
+                    tile_regime[p["tile_id"].to_numpy()] = p["regime_code"].to_numpy()
+
+                sums, mix = zonal_reduce(strips, labels, n_labels, stats, args.lit_threshold,
+                                         tile_labels, tile_regime)
+                red = finalize_stats(sums, stats)
+
+                out = pd.DataFrame({
+                    "country": country, "year": year,
+                    "zone_label": np.arange(1, n_labels),
+                    "zone_id": [z[0] for z in zone_table],
+                    "zone_name": [z[1] for z in zone_table],
+                    "n_valid_pixels": red["n"][1:],
+                })
+                for s in stats:
+                    out[s] = red[s][1:]
+                if mix is not None:
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        share = mix[1:] / mix[1:].sum(axis=1, keepdims=True)
+                    for r, regime in enumerate(REGION_TYPES):
+                        out[f"share_{regime}"] = share[:, r]
+                parts.append(out)
+                print(f"  {country} {year}: {n_labels - 1} zones, {int(red['n'][1:].sum()):,} pixels "
+                      f"({time.perf_counter() - t0:.1f}s)")
+        finally:
+            if cube is not None:
+                cube.close()
+
+    if not parts:
+        print("[WARN] nothing to write")
+        return
+    out_fp = os.path.join(args.out_dir, f"zonal_stats_{zones_name}.csv")
+    pd.concat(parts, ignore_index=True).to_csv(out_fp, index=False)
+    print(f"\nSaved: {out_fp} ({time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
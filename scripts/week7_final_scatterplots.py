@@ -4,56 +4,69 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import os
 
+from scatter_density import draw_density_scatter, draw_ols_line
+
 # =====================================================
 # 1. HARD-CODED EXPORT DIRECTORY (as requested)
 # =====================================================
 OUTPUT_PATH = r"C:\Users\amimi\OneDrive - Duke University\SCHOOL\SPRING 2026\STATS201\Week 6 Files\STATS201-Course-project\figures\week7_outputs"
 INPUT_PATH  = r"C:\Users\amimi\OneDrive - Duke University\SCHOOL\SPRING 2026\STATS201\Week 6 Files\STATS201-Course-project\figures\week6_outputs"
 
-os.makedirs(OUTPUT_PATH, exist_ok=True)
-
 COUNTRIES = ["Brazil", "China", "Morocco"]
 TARGET_YEAR = 2023
 
+# "points" = one marker per tile (publication look), "density" = per-regime 2-D histogram
+# raster + closed-form OLS line (render time independent of the number of tiles)
+SCATTER_MODE = "points"
+DENSITY_BINS = 200
+
 REGIME_ORDER = ["empty_or_rural", "mixed", "bright_sparse", "dense_dim", "urban_core"]
 
+# More saturated, high-contrast colors
 REGIME_PALETTE = {
-    "empty_or_rural": "#7f7f7f",  # gray
-    "mixed":          "#bcbd22",  # olive
-    "bright_sparse":  "#ff7f0e",  # orange
-    "dense_dim":      "#1f77b4",  # blue
-    "urban_core":     "#d62728",  # red
+    "empty_or_rural": "#4d4d4d",   # darker gray
+    "mixed":          "#8c6bb1",   # purple
+    "bright_sparse":  "#ff8c00",   # strong orange
+    "dense_dim":      "#0072b2",   # vivid blue
+    "urban_core":     "#d40000",   # intense red
 }
 
-print(f"🚀 Generating 2023 Scatter Plots...\n")
-
-for country in COUNTRIES:
-
-    file_path = os.path.join(INPUT_PATH, f"tiles_{country}_{TARGET_YEAR}.csv")
-
-    if not os.path.exists(file_path):
-        print(f"⚠️ Missing file for {country}")
-        continue
+# Cleaner legend labels
+LABEL_MAP = {
+    "empty_or_rural": "Empty / Rural",
+    "mixed": "Mixed",
+    "bright_sparse": "Bright Sparse",
+    "dense_dim": "Dense-Intermediate",
+    "urban_core": "Urban Core",
+}
 
-    df = pd.read_csv(file_path)
 
+def prepare_tiles(df):
     pop_col = "sum_pop" if "sum_pop" in df.columns else "mean_pop"
     df["log_pop"] = np.log1p(df[pop_col])
     df["log_light"] = np.log1p(df["mean_light"])
     df["region_type"] = df["region_type"].astype(str)
 
-    df = df[df["region_type"].isin(REGIME_ORDER)].copy()
+    return df[df["region_type"].isin(REGIME_ORDER)].copy()
 
-    plt.figure(figsize=(11.5, 8))
 
-    # More saturated, high-contrast colors
-    REGIME_PALETTE = {
-        "empty_or_rural": "#4d4d4d",   # darker gray
-        "mixed":          "#8c6bb1",   # purple
-        "bright_sparse":  "#ff8c00",   # strong orange
-        "dense_dim":      "#0072b2",   # vivid blue
-        "urban_core":     "#d40000",   # intense red
-    }
+# Also used by week7_render_figures.py, which renders these charts in a process pool.
+def plot_scatter(df, country, year, output_file, dpi=300, mode=None):
+    mode = mode or SCATTER_MODE
+    fig = plt.figure(figsize=(11.5, 8))
+
+    if mode == "density":
+        ax = plt.gca()
+        handles = draw_density_scatter(
+            ax, df["log_pop"], df["log_light"], df["region_type"],
+            REGIME_ORDER, REGIME_PALETTE, labels=LABEL_MAP, bins=DENSITY_BINS
+        )
+        draw_ols_line(ax, df["log_pop"], df["log_light"],
+                      color="black", linestyle="--", linewidth=2.5)
+        _finish_scatter(country, year, handles, [h.get_label() for h in handles])
+        plt.savefig(output_file, dpi=dpi, bbox_inches="tight")
+        plt.close(fig)
+        return
 
     sns.scatterplot(
         data=df,
@@ -68,38 +81,30 @@ for country in COUNTRIES:
         linewidth=0.2
     )
 
-    sns.regplot(
-        data=df,
-        x="log_pop",
-        y="log_light",
-        scatter=False,
-        color="black",
-        line_kws={"linestyle": "--", "linewidth": 2.5}
-    )
+    # Closed-form OLS line (regplot's bootstrap CI was the slow step)
+    draw_ols_line(plt.gca(), df["log_pop"], df["log_light"],
+                  color="black", linestyle="--", linewidth=2.5)
+
+    handles, labels = plt.gca().get_legend_handles_labels()
+    if labels and labels[0] == "region_type":
+        handles = handles[1:]
+        labels = labels[1:]
+    labels = [LABEL_MAP.get(l, l) for l in labels]
 
+    _finish_scatter(country, year, handles, labels)
+    plt.savefig(output_file, dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+
+
+def _finish_scatter(country, year, handles, labels):
     plt.title(
-        f"Population vs. Nighttime Lights\n{country} ({TARGET_YEAR})",
+        f"Population vs. Nighttime Lights\n{country} ({year})",
         fontsize=15,
         pad=12
     )
     plt.xlabel("Log(1 + Population)", fontsize=13)
     plt.ylabel("Log(1 + Nighttime Lights)", fontsize=13)
 
-    # Cleaner legend labels
-    label_map = {
-        "empty_or_rural": "Empty / Rural",
-        "mixed": "Mixed",
-        "bright_sparse": "Bright Sparse",
-        "dense_dim": "Dense-Intermediate",
-        "urban_core": "Urban Core",
-    }
-
-    handles, labels = plt.gca().get_legend_handles_labels()
-    if labels and labels[0] == "region_type":
-        handles = handles[1:]
-        labels = labels[1:]
-    labels = [label_map.get(l, l) for l in labels]
-
     plt.legend(
         handles,
         labels,
@@ -115,14 +120,32 @@ for country in COUNTRIES:
     plt.grid(False)  # cleaner publication style
     plt.tight_layout()
 
-    output_file = os.path.join(
-        OUTPUT_PATH,
-        f"scatter_{country}_{TARGET_YEAR}.png"
-    )
 
-    plt.savefig(output_file, dpi=300, bbox_inches="tight")
-    plt.close()
+def main():
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+
+    print(f"🚀 Generating {TARGET_YEAR} Scatter Plots...\n")
+
+    for country in COUNTRIES:
+
+        file_path = os.path.join(INPUT_PATH, f"tiles_{country}_{TARGET_YEAR}.csv")
+
+        if not os.path.exists(file_path):
+            print(f"⚠️ Missing file for {country}")
+            continue
+
+        df = prepare_tiles(pd.read_csv(file_path))
+
+        output_file = os.path.join(
+            OUTPUT_PATH,
+            f"scatter_{country}_{TARGET_YEAR}.png"
+        )
+        plot_scatter(df, country, TARGET_YEAR, output_file)
+
+        print(f"✅ Saved to: {output_file}")
+
+    print(f"\n✔ All {TARGET_YEAR} scatterplots exported to week7_outputs.")
 
-    print(f"✅ Saved to: {output_file}")
 
-print("\n✔ All 2023 scatterplots exported to week7_outputs.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file
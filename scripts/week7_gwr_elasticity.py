@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# week7_gwr_elasticity.py
+#
+# Geographically weighted regression of log_light ~ log_pop on the tile grid: one local
+# intercept and elasticity per tile, i.e. an elasticity SURFACE per country-year instead of
+# one slope per regime.
+#
+# With a fixed kernel K on the regular tile lattice, every local cross-product is a
+# convolution of a gridded layer with K:
+#
+#   S0 = K*m   Sx = K*x   Sxx = K*x^2   Sy = K*y   Sxy = K*xy   Syy = K*y^2    (m = tile present)
+#
+# so the local 2x2 systems X'W_iX b = X'W_iy for ALL tiles come from six FFT convolutions
+# instead of n weighted regressions. The same sums give the hat-matrix diagonal
+# h_ii = K(0) x_i' (X'W_iX)^-1 x_i, hence AICc (default) or the leave-one-out CV score for any
+# bandwidth in O(grid log grid); the bandwidth is picked from a geometric grid of candidates.
+# Local standard errors use three more convolutions with K^2.
+#
+# Outputs (written to --out_dir):
+#   gwr_tiles.csv                      country, year, tile_id, bandwidth, intercept, elasticity,
+#                                      elasticity_se, local_r2, hat
+#   gwr_elasticity_<Country>.npz       years, elasticity (Y, grid rows, grid cols; NaN off-grid),
+#                                      bandwidth, tile_size
+#   gwr_elasticity_<Country>_<Year>.tif   same surface as a GeoTIFF (only with --images_root;
+#                                      one pixel per tile, georeferenced from the source raster)
+#
+# Run:
+#   python scripts/week7_gwr_elasticity.py \
+#       --panel figures/week6_outputs/tiles_panel_all_countries_2014-2023.csv \
+#       --out_dir figures/week7_outputs/gwr
+
+import os, argparse, time
+import numpy as np
+import pandas as pd
+from scipy.signal import fftconvolve
+
+from spatial_weights import grid_coords
+
+KERNELS = ["gaussian", "bisquare"]
+
+
+def kernel(bandwidth: float, kind: str = "gaussian") -> np.ndarray:
+    """Square kernel image in tile units, centred, K(0) = 1."""
+    reach = int(np.ceil(3 * bandwidth)) if kind == "gaussian" else int(np.ceil(bandwidth))
+    d = np.arange(-reach, reach + 1)
+    d2 = (d[:, None] ** 2 + d[None, :] ** 2) / bandwidth ** 2
+    if kind == "gaussian":
+        return np.exp(-0.5 * d2)
+    if kind == "bisquare":
+        return np.where(d2 < 1, (1 - d2) ** 2, 0.0)
+    raise ValueError(f"kernel must be one of {KERNELS}")
+
+
+def grid_layers(gr, gc, x, y):
+    """Dense (H, W) layers m, x, y with zeros where there is no tile."""
+    H, W = int(gr.max()) + 1, int(gc.max()) + 1
+    m, X, Y = np.zeros((H, W)), np.zeros((H, W)), np.zeros((H, W))
+    m[gr, gc], X[gr, gc], Y[gr, gc] = 1.0, x, y
+    return m, X, Y
+
+
+def _conv(layer, K):
+    return fftconvolve(layer, K, mode="same")
+
+
+def local_fit(m, x, y, K, with_se: bool = False) -> dict:
+    """Local weighted OLS of y on (1, x) at every grid cell from convolved cross-products."""
+    S0, Sx, Sxx = _conv(m, K), _conv(x, K), _conv(x * x, K)
+    Sy, Sxy, Syy = _conv(y, K), _conv(x * y, K), _conv(y * y, K)
+    S0 = np.where(m > 0, S0, np.nan)          # off-grid cells are never reported
+
+    det = S0 * Sxx - Sx * Sx
+    ok = (m > 0) & (det > 1e-9 * np.maximum(S0 * Sxx, 1e-300))
+    det = np.where(ok, det, np.nan)
+    slope = (S0 * Sxy - Sx * Sy) / det
+    intercept = (Sy - slope * Sx) / S0
+
+    # hat diagonal: K(0) * [1 x] M^-1 [1 x]'  with M = [[S0, Sx], [Sx, Sxx]]
+    hat = K[K.shape[0] // 2, K.shape[1] // 2] * (Sxx - 2 * x * Sx + x * x * S0) / det
+
+    rss_w = (Syy - 2 * intercept * Sy - 2 * slope * Sxy + intercept ** 2 * S0
+             + 2 * intercept * slope * Sx + slope ** 2 * Sxx)
+    tss_w = Syy - Sy ** 2 / S0
+    out = {"intercept": intercept, "slope": slope, "hat": hat, "ok": ok,
+           "local_r2": 1 - rss_w / np.where(tss_w > 0, tss_w, np.nan)}
+
+    if with_se:
+        # Var(b_i) = s2 * [M^-1 (X'W_i^2 X) M^-1]_11 with the squared-kernel sums
+        K2 = K * K
+        Q0, Qx, Qxx = _conv(m, K2), _conv(x, K2), _conv(x * x, K2)
+        a, b = -Sx / det, S0 / det                      # second row of M^-1
+        out["q11"] = a * a * Q0 + 2 * a * b * Qx + b * b * Qxx
+    return out
+
+
+def score_bandwidth(m, x, y, bandwidth, kind="gaussian"):
+    """(CV, AICc, fit) for one bandwidth; residuals are evaluated at the observed tiles only."""
+    fit = local_fit(m, x, y, kernel(bandwidth, kind))
+    sel = fit["ok"]
+    n = int(sel.sum())
+    e = (y - fit["intercept"] - fit["slope"] * x)[sel]
+    h = fit["hat"][sel]
+    cv = np.sum((e / (1 - h)) ** 2) / n
+    tr_s = h.sum()
+    sigma = np.sqrt(e @ e / n)
+    aicc = np.inf
+    if n - 2 - tr_s > 0:
+        aicc = 2 * n * np.log(sigma) + n * np.log(2 * np.pi) + n * (n + tr_s) / (n - 2 - tr_s)
+    return cv, aicc, fit
+
+
+def select_bandwidth(m, x, y, candidates, kind="gaussian", criterion="aicc"):
+    scores = []
+    for bw in candidates:
+        cv, aicc, _ = score_bandwidth(m, x, y, bw, kind)
+        scores.append(cv if criterion == "cv" else aicc)
+    scores = np.asarray(scores)
+    scores[~np.isfinite(scores)] = np.inf
+    return float(candidates[int(np.argmin(scores))]), scores
+
+
+def gwr_country_year(df, tile_size, candidates, kind="gaussian", criterion="aicc", bandwidth=None):
+    gr, gc, _ = grid_coords(df, tile_size)
+    x = np.log1p(df["mean_pop"].clip(lower=0).to_numpy(dtype=float))
+    y = np.log1p(df["mean_light"].clip(lower=0).to_numpy(dtype=float))
+    keep = np.isfinite(x) & np.isfinite(y)
+    gr, gc, x, y = gr[keep], gc[keep], x[keep], y[keep]
+
+    # centre x and y so the convolved moments stay well conditioned
+    xm, ym = x.mean(), y.mean()
+    m, X, Y = grid_layers(gr, gc, x - xm, y - ym)
+
+    if bandwidth is None:
+        bandwidth, _ = select_bandwidth(m, X, Y, candidates, kind, criterion)
+    fit = local_fit(m, X, Y, kernel(bandwidth, kind), with_se=True)
+
+    sel = fit["ok"]
+    e = (Y - fit["intercept"] - fit["slope"] * X)[sel]
+    dof = max(sel.sum() - fit["hat"][sel].sum(), 1.0)
+    s2 = e @ e / dof
+    se = np.sqrt(s2 * fit["q11"])
+
+    slope = fit["slope"]
+    tiles = pd.DataFrame({
+        "country": df["country"].to_numpy()[keep],
+        "year": df["year"].to_numpy()[keep],
+        "tile_id": df["tile_id"].to_numpy()[keep],
+        "bandwidth": bandwidth,
+        "intercept": (fit["intercept"] + ym - slope * xm)[gr, gc],
+        "elasticity": slope[gr, gc],
+        "elasticity_se": se[gr, gc],
+        "local_r2": fit["local_r2"][gr, gc],
+        "hat": fit["hat"][gr, gc],
+    })
+    surface = np.where(m > 0, slope, np.nan).astype(np.float32)
+    return tiles, surface, bandwidth
+
+
+def write_surface_tif(surface, src_fp, tile_size, out_fp):
+    import rasterio
+    from rasterio.transform import Affine
+
+    with rasterio.open(src_fp) as src:
+        transform, crs = src.transform * Affine.scale(tile_size), src.crs
+    profile = dict(driver="GTiff", height=surface.shape[0], width=surface.shape[1], count=1,
+                   dtype="float32", nodata=np.nan, transform=transform, crs=crs, compress="deflate")
+    with rasterio.open(out_fp, "w", **profile) as dst:
+        dst.write(surface, 1)
+        dst.set_band_description(1, "gwr_elasticity_log_pop")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--panel", required=True, help="tiles_panel_all_countries_<start>-<end>.csv")
+    ap.add_argument("--out_dir", default=None, help="Output folder (default: <panel dir>/gwr)")
+    ap.add_argument("--kernel", choices=KERNELS, default="gaussian")
+    ap.add_argument("--criterion", choices=["aicc", "cv"], default="aicc",
+                    help="Bandwidth criterion (AICc as in standard GWR software; CV = leave-one-out)")
+    ap.add_argument("--bandwidth", type=float, default=None, help="Fixed bandwidth in tile widths (skip selection)")
+    ap.add_argument("--bw_min", type=float, default=1.0)
+    ap.add_argument("--bw_max", type=float, default=30.0)
+    ap.add_argument("--bw_steps", type=int, default=25)
+    ap.add_argument("--images_root", default=None,
+                    help="Root with <Country>/<Country>_<Year>.tif; when given, surfaces are also written as GeoTIFFs")
+    args = ap.parse_args()
+
+    out_dir = args.out_dir or os.path.join(os.path.dirname(os.path.abspath(args.panel)), "gwr")
+    os.makedirs(out_dir, exist_ok=True)
+    candidates = np.geomspace(args.bw_min, args.bw_max, args.bw_steps)
+
+    t0 = time.perf_counter()
+    panel = pd.read_csv(args.panel, usecols=["country", "year", "tile_id", "r0", "r1", "c0", "c1",
+                                             "mean_light", "mean_pop"])
+    parts = []
+    for country, cdf in panel.groupby("country", sort=True):
+        _, _, tile_size = grid_coords(cdf)
+        H = int(cdf["r0"].max()) // tile_size + 1
+        W = int(cdf["c0"].max()) // tile_size + 1
+        years = sorted(cdf["year"].unique())
+        stack = np.full((len(years), H, W), np.nan, dtype=np.float32)
+        bws = []
+
+        for yi, (year, df) in enumerate(cdf.groupby("year", sort=True)):
+            tiles, surface, bw = gwr_country_year(df, tile_size, candidates, args.kernel, args.criterion,
+                                                  bandwidth=args.bandwidth)
+            stack[yi, : surface.shape[0], : surface.shape[1]] = surface
+            bws.append(bw)
+            parts.append(tiles)
+
+            if args.images_root:
+                src_fp = os.path.join(args.images_root, country, f"{country}_{year}.tif")
+                if os.path.exists(src_fp):
+                    write_surface_tif(stack[yi], src_fp, tile_size,
+                                      os.path.join(out_dir, f"gwr_elasticity_{country}_{year}.tif"))
+                else:
+                    print(f"[WARN] no raster for {country} {year}, GeoTIFF skipped")
+
+        np.savez_compressed(os.path.join(out_dir, f"gwr_elasticity_{country}.npz"),
+                            years=np.asarray(years, dtype=np.int16), elasticity=stack,
+                            bandwidth=np.asarray(bws), tile_size=tile_size)
+        print(f"{country}: bandwidth (tile widths) per year = {np.round(bws, 2).tolist()}")
+
+    tiles = pd.concat(parts, ignore_index=True)
+    tiles.to_csv(os.path.join(out_dir, "gwr_tiles.csv"), index=False)
+
+    print(f"\nGWR for {tiles.groupby(['country', 'year']).ngroups} country-years in {time.perf_counter() - t0:.1f}s")
+    print(tiles.groupby("country")["elasticity"].describe(percentiles=[0.1, 0.5, 0.9]).round(3).to_string())
+    print("Saved:", out_dir)
+
+
+if __name__ == "__main__":
+    main()
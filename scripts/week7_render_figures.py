@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# week7_render_figures.py
+#
+# Re-render the week6/week7 report figures concurrently.
+#
+# The script collects one figure spec per output image, e.g.
+#
+#   {"kind": "scatter", "country": "Brazil", "year": 2023, "rows": (1200, 1806), "out": ".../scatter_Brazil_2023.png"}
+#
+# and renders them in a process pool with the headless Agg backend (no plt.show()).
+# The tile panel is loaded ONCE: its numeric columns are written to a memory-mapped .npy
+# matrix in a scratch folder, sorted by (country, year), so each spec only carries a row
+# range and every worker slices the same pages instead of re-reading CSVs. Infrastructure
+# specs carry only the GeoTIFF path; the raster is decoded inside the worker that draws the map,
+# so decoding runs in parallel with the other figures.
+#
+# Figure kinds (see RENDERERS):
+#   scatter          week7_final_scatterplots.plot_scatter
+#   baseline_scatter week6_visualize_baseline_regression.plot_baseline_scatter
+#   structure        week6_visualize_structure.plot_structure_shares
+#   transitions      week6_visualize_structure.plot_transitions
+#   infrastructure   week6_add_geographic_infrastructure.create_infrastructure_maps
+#
+# Run:
+#   python scripts/week7_render_figures.py \
+#       --panel figures/week6_outputs_geogprahic/tiles_panel_all_countries_2014-2023_WITH_GEO_INFRASTRUCTURE.csv \
+#       --out_dir figures/report_refresh --years 2023 --images_root <tif root>
+
+import os
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import argparse, tempfile, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+import pandas as pd
+
+from week6_build_tiles_all_years import REGION_TYPES, read_bands
+from week6_structure_cube import build_structure_cube, save_structure_cube, load_structure_cube, cube_to_long
+
+ALL_KINDS = ["scatter", "baseline_scatter", "structure", "transitions", "infrastructure"]
+
+RENDERERS = {}
+
+# Per-process cache of opened memmaps (filled lazily in each worker)
+_SHARED = {}
+
+
+def renderer(kind):
+    def register(fn):
+        RENDERERS[kind] = fn
+        return fn
+    return register
+
+
+# ============================================================================
+# Shared inputs (parent process)
+# ============================================================================
+
+def share_array(arr: np.ndarray, scratch_dir: str, name: str) -> str:
+    path = os.path.join(scratch_dir, f"{name}.npy")
+    mm = np.lib.format.open_memmap(path, mode="w+", dtype=arr.dtype, shape=arr.shape)
+    mm[...] = arr
+    mm.flush()
+    del mm
+    return path
+
+
+def share_panel(panel: pd.DataFrame, scratch_dir: str):
+    """
+    Write the panel's numeric columns and integer region codes to memmaps.
+    Returns (columns, {(country, year): (start, stop)}) for building specs.
+    """
+    panel = panel.sort_values(["country", "year", "tile_id"], kind="stable").reset_index(drop=True)
+    numeric = panel.select_dtypes(include="number")
+    columns = list(numeric.columns)
+
+    share_array(numeric.to_numpy(dtype=np.float64), scratch_dir, "panel_num")
+    codes = pd.Categorical(panel["region_type"], categories=REGION_TYPES).codes.astype(np.int8)
+    share_array(codes, scratch_dir, "panel_region")
+
+    # Contiguous row ranges per country-year (panel is sorted)
+    key = panel["country"].astype(str) + "|" + panel["year"].astype(int).astype(str)
+    starts = np.flatnonzero(np.r_[True, key.values[1:] != key.values[:-1]])
+    stops = np.r_[starts[1:], len(panel)]
+    slices = {}
+    for s, e in zip(starts, stops):
+        slices[(panel.at[s, "country"], int(panel.at[s, "year"]))] = (int(s), int(e))
+
+    return columns, slices
+
+
+# ============================================================================
+# Worker side
+# ============================================================================
+
+def _init_worker(scratch_dir: str, columns):
+    matplotlib.use("Agg")
+    _SHARED.clear()
+    _SHARED["scratch"] = scratch_dir
+    _SHARED["columns"] = columns
+
+
+def _shared(name: str) -> np.ndarray:
+    if name not in _SHARED:
+        _SHARED[name] = np.load(os.path.join(_SHARED["scratch"], f"{name}.npy"), mmap_mode="r")
+    return _SHARED[name]
+
+
+def _panel_frame(rows) -> pd.DataFrame:
+    s, e = rows
+    df = pd.DataFrame(np.array(_shared("panel_num")[s:e]), columns=_SHARED["columns"])
+    codes = np.asarray(_shared("panel_region")[s:e])
+    df["region_type"] = pd.Categorical.from_codes(codes, categories=REGION_TYPES)
+    return df
+
+
+@renderer("scatter")
+def _render_scatter(spec):
+    from week7_final_scatterplots import prepare_tiles, plot_scatter
+    df = prepare_tiles(_panel_frame(spec["rows"]))
+    plot_scatter(df, spec["country"], spec["year"], spec["out"], dpi=spec["dpi"], mode=spec.get("mode"))
+
+
+@renderer("baseline_scatter")
+def _render_baseline_scatter(spec):
+    from week6_visualize_baseline_regression import plot_baseline_scatter
+    df = _panel_frame(spec["rows"])
+    df["region_type"] = df["region_type"].astype(str)
+    plot_baseline_scatter(df, spec["country"], spec["year"], spec["out"], dpi=spec["dpi"],
+                          mode=spec.get("mode"))
+
+
+@renderer("structure")
+def _render_structure(spec):
+    from week6_visualize_structure import plot_structure_shares
+    cube = load_structure_cube(spec["cube"])
+    share_df = cube_to_long(cube)
+    share_df = share_df[share_df["Count"] > 0]
+    plot_structure_shares(share_df, spec["country"], spec["out"], dpi=spec["dpi"])
+
+
+@renderer("transitions")
+def _render_transitions(spec):
+    from week6_visualize_structure import plot_transitions
+    cube = load_structure_cube(spec["cube"])
+    ci = list(cube["countries"]).index(spec["country"])
+    plot_transitions(cube["transitions"][ci], list(cube["regions"]), spec["country"],
+                     cube["years"], spec["out"], dpi=spec["dpi"])
+
+
+@renderer("infrastructure")
+def _render_infrastructure(spec):
+    from week6_add_geographic_infrastructure import create_infrastructure_maps
+    df = _panel_frame(spec["rows"])
+    nl, _ = read_bands(spec["raster"])
+    create_infrastructure_maps(spec["country"], spec["year"], df, None, Path(spec["out"]),
+                               nl=nl, dpi=spec["dpi"])
+
+
+def render_spec(spec):
+    t0 = time.perf_counter()
+    RENDERERS[spec["kind"]](spec)
+    return spec["out"], time.perf_counter() - t0
+
+
+# ============================================================================
+# Spec collection + driver
+# ============================================================================
+
+def collect_specs(panel, kinds, years, out_dir, scratch_dir, images_root=None, dpi=300, scatter_mode=None):
+    columns, slices = share_panel(panel, scratch_dir)
+    countries = sorted(panel["country"].unique())
+    specs = []
+
+    if "structure" in kinds or "transitions" in kinds:
+        cube_path = os.path.join(scratch_dir, "structure_cube.npz")
+        save_structure_cube(build_structure_cube(panel), cube_path)
+        for country in countries:
+            if "structure" in kinds:
+                specs.append({"kind": "structure", "country": country, "cube": cube_path, "dpi": dpi,
+                              "out": os.path.join(out_dir, f"structure_evolution_{country}.png")})
+            if "transitions" in kinds:
+                specs.append({"kind": "transitions", "country": country, "cube": cube_path, "dpi": dpi,
+                              "out": os.path.join(out_dir, f"structure_transitions_{country}.png")})
+
+    for (country, year), rows in sorted(slices.items()):
+        if years and year not in years:
+            continue
+        base = {"country": country, "year": year, "rows": rows, "dpi": dpi, "mode": scatter_mode}
+        if "scatter" in kinds:
+            specs.append({**base, "kind": "scatter",
+                          "out": os.path.join(out_dir, f"scatter_{country}_{year}.png")})
+        if "baseline_scatter" in kinds:
+            specs.append({**base, "kind": "baseline_scatter",
+                          "out": os.path.join(out_dir, f"baseline_scatter_{country}_{year}.png")})
+        if "infrastructure" in kinds:
+            if "distance_to_urban_core" not in columns:
+                continue
+            tif = os.path.join(images_root or "", country, f"{country}_{year}.tif")
+            if not images_root or not os.path.exists(tif):
+                print(f"[WARN] no raster for {country} {year}, skipping infrastructure map")
+                continue
+            specs.append({**base, "kind": "infrastructure", "raster": tif, "dpi": min(dpi, 200),
+                          "out": os.path.join(out_dir, f"figure_infrastructure_{country}_{year}.png")})
+
+    return specs, columns
+
+
+def render_all(specs, scratch_dir, columns, workers=None):
+    workers = workers or os.cpu_count() or 1
+    done = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(scratch_dir, columns)) as pool:
+        futures = {pool.submit(render_spec, spec): spec for spec in specs}
+        for fut in as_completed(futures):
+            spec = futures[fut]
+            try:
+                out, secs = fut.result()
+                done.append(out)
+                print(f"  [{spec['kind']}] {os.path.basename(out)} ({secs:.1f}s)")
+            except Exception as e:
+                print(f"  [FAIL] {spec['kind']} {spec.get('country')} {spec.get('year', '')}: {e}")
+    return done
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--panel", required=True, help="Tile panel CSV (with geo infrastructure columns for maps)")
+    ap.add_argument("--out_dir", required=True)
+    ap.add_argument("--kinds", default=",".join(ALL_KINDS), help="Comma-separated figure kinds")
+    ap.add_argument("--years", default="", help="Comma-separated years for per-year figures (default: all)")
+    ap.add_argument("--images_root", default=None, help="Root with <Country>/<Country>_<Year>.tif (infrastructure maps)")
+    ap.add_argument("--workers", type=int, default=None, help="Process pool size (default: all cores)")
+    ap.add_argument("--dpi", type=int, default=300)
+    ap.add_argument("--scatter_mode", choices=["points", "density"], default=None,
+                    help="Tile scatter style (default: each plotting script's SCATTER_MODE)")
+    args = ap.parse_args()
+
+    kinds = [k.strip() for k in args.kinds.split(",") if k.strip()]
+    unknown = [k for k in kinds if k not in RENDERERS]
+    if unknown:
+        raise ValueError(f"Unknown figure kinds: {unknown}. Choose from {ALL_KINDS}")
+    years = {int(y) for y in args.years.split(",") if y.strip()}
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    panel = pd.read_csv(args.panel)
+
+    with tempfile.TemporaryDirectory(prefix="render_farm_") as scratch:
+        specs, columns = collect_specs(panel, kinds, years, args.out_dir, scratch,
+                                       images_root=args.images_root, dpi=args.dpi,
+                                       scatter_mode=args.scatter_mode)
+        print(f"Rendering {len(specs)} figures with {args.workers or os.cpu_count()} workers...")
+        done = render_all(specs, scratch, columns, workers=args.workers)
+
+    print(f"\nRendered {len(done)}/{len(specs)} figures in {time.perf_counter() - t0:.1f}s -> {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# week7_spatial_autocorrelation.py
+#
+# Spatial autocorrelation of tile light and of the baseline-model residuals for every
+# country-year in the tile panel:
+#
+#   log_light                     raw outcome
+#   resid_baseline                residuals of log_light ~ log_pop * C(region_type) (OLS)
+#
+# Global Moran's I (permutation p-value) and local LISA statistics use the sparse tile-grid
+# weights from spatial_weights.py, built once per country and cached under --cache_dir.
+#
+# Outputs (written to --out_dir):
+#   moran_global.csv    country, year, variable, weights, n, I, EI, I_sim_mean, z_sim, p_sim
+#   lisa_tiles.csv      country, year, tile_id, variable, Is, p_sim, quadrant, cluster
+#                       (cluster = HH/LH/LL/HL where p_sim < --alpha, else "ns")
+#
+# Run:
+#   python scripts/week7_spatial_autocorrelation.py \
+#       --panel figures/week6_outputs/tiles_panel_all_countries_2014-2023.csv \
+#       --out_dir figures/week7_outputs/spatial_autocorrelation --weights queen
+
+import os, argparse, time, warnings
+import numpy as np
+import pandas as pd
+import statsmodels.formula.api as smf
+
+from spatial_weights import QUADRANTS, country_weights, subset_weights, morans_i, lisa
+
+FORMULA = "log_light ~ log_pop * C(region_type)"
+VARIABLES = ["log_light", "resid_baseline"]
+
+
+def baseline_residuals(df: pd.DataFrame) -> pd.Series:
+    # Residuals aligned to df.index (NaN where the model dropped a row or could not be fit)
+    try:
+        with warnings.catch_warnings():
+            # regimes with (almost) no tiles make the design rank-deficient; residuals are still defined
+            warnings.simplefilter("ignore")
+            return smf.ols(FORMULA, data=df).fit().resid.reindex(df.index)
+    except Exception as e:
+        print(f"[WARN] baseline model failed for {df['country'].iat[0]} {df['year'].iat[0]}: {e}")
+        return pd.Series(np.nan, index=df.index)
+
+
+def country_year_autocorrelation(df, Wb, all_ids, weights, permutations, alpha, seed):
+    moran_rows, lisa_parts = [], []
+    df = df.copy()
+    df["resid_baseline"] = baseline_residuals(df)
+
+    for var in VARIABLES:
+        sub = df[np.isfinite(df[var])]
+        if len(sub) < 3:
+            continue
+        W = subset_weights(Wb, all_ids, sub["tile_id"].to_numpy(dtype=np.int64))
+
+        g = morans_i(sub[var].to_numpy(), W, permutations=permutations, seed=seed)
+        moran_rows.append({"country": sub["country"].iat[0], "year": int(sub["year"].iat[0]),
+                           "variable": var, "weights": weights, **g})
+
+        loc = lisa(sub[var].to_numpy(), W, permutations=permutations, seed=seed)
+        loc.insert(0, "variable", var)
+        loc.insert(0, "tile_id", sub["tile_id"].to_numpy())
+        loc.insert(0, "year", int(sub["year"].iat[0]))
+        loc.insert(0, "country", sub["country"].iat[0])
+        loc["cluster"] = np.where(loc["p_sim"] < alpha, loc["quadrant"].map(QUADRANTS), "ns")
+        lisa_parts.append(loc)
+
+    return moran_rows, lisa_parts
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--panel", required=True, help="tiles_panel_all_countries_<start>-<end>.csv")
+    ap.add_argument("--out_dir", default=None, help="Output folder (default: <panel dir>/spatial_autocorrelation)")
+    ap.add_argument("--cache_dir", default=None, help="Weights cache (default: <out_dir>/weights)")
+    ap.add_argument("--weights", choices=["queen", "rook", "band"], default="queen")
+    ap.add_argument("--band", type=float, default=1.5, help="Distance band in tile widths (--weights band)")
+    ap.add_argument("--permutations", type=int, default=999)
+    ap.add_argument("--alpha", type=float, default=0.05, help="LISA significance level for cluster labels")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    out_dir = args.out_dir or os.path.join(os.path.dirname(os.path.abspath(args.panel)), "spatial_autocorrelation")
+    cache_dir = args.cache_dir or os.path.join(out_dir, "weights")
+    os.makedirs(out_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    panel = pd.read_csv(args.panel)
+    panel["log_light"] = np.log1p(panel["mean_light"].clip(lower=0))
+    panel["log_pop"] = np.log1p(panel["mean_pop"].clip(lower=0))
+
+    moran_rows, lisa_parts = [], []
+    for country, cdf in panel.groupby("country", sort=True):
+        Wb, all_ids = country_weights(cdf, kind=args.weights, band=args.band, cache_dir=cache_dir, country=country)
+        for year, df in cdf.groupby("year", sort=True):
+            df = df.sort_values("tile_id")
+            m, l = country_year_autocorrelation(df, Wb, all_ids, args.weights, args.permutations,
+                                                args.alpha, args.seed)
+            moran_rows += m
+            lisa_parts += l
+        print(f"{country}: {cdf['year'].nunique()} years, {len(all_ids)} grid tiles, "
+              f"{int(Wb.nnz / max(len(all_ids), 1) + 0.5)} neighbours per tile on average")
+
+    moran = pd.DataFrame(moran_rows)
+    moran.to_csv(os.path.join(out_dir, "moran_global.csv"), index=False)
+    if lisa_parts:
+        pd.concat(lisa_parts, ignore_index=True).to_csv(os.path.join(out_dir, "lisa_tiles.csv"), index=False)
+
+    print(f"\nMoran's I ({args.weights}, {args.permutations} permutations) in {time.perf_counter() - t0:.1f}s:")
+    print(moran.pivot_table(index=["country", "year"], columns="variable", values="I").round(3).to_string())
+    print("Saved:", out_dir)
+
+
+if __name__ == "__main__":
+    main()
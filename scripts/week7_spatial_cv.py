@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# week7_spatial_cv.py
+#
+# Cross-validation of the tile models: out-of-sample R² instead of the in-sample R² used to
+# compare the baseline and infrastructure models in week7_finalmodel_analysis.ipynb.
+# Neighbouring tiles (and the same tile in other years) share most of their signal, so random
+# row splits leak; the schemes here hold out whole areas or whole years:
+#
+#   spatial_block   tiles grouped into blocks of --block_tiles x --block_tiles grid cells (from r0/c0)
+#                   within each country; blocks are shuffled (--seed) and dealt to --folds folds,
+#                   balanced by row count; a block keeps all its years together. --buffer_tiles drops
+#                   training tiles within that many grid cells of the test blocks (same country)
+#   loyo            leave-one-year-out: the held-out year's tiles (same stable tile_id grid)
+#                   are predicted from the other years
+#   random          plain K-fold over rows, for comparison (the optimistic reference)
+#
+# Models come from a registry (MODELS, extended with register_model()): a patsy formula plus an
+# estimator -- "ols" (least squares, the notebooks' formulas), "linreg" (sklearn LinearRegression)
+# or "rf" (sklearn RandomForestRegressor). Fits are per country (--pooled adds an all-country fit).
+#
+# Speed: every formula's design matrix is built ONCE on the full panel (so C(region_type) columns
+# are identical in every fold) on the rows complete for all selected models, saved as .npy and
+# memory-mapped by the worker processes; folds are index arrays into it. Each (country, model,
+# scheme, fold) is one task on a process pool (--workers). The linear models' full CV takes a few
+# seconds; the random forest is bound by tree fitting (about a second per fit and core).
+#
+# Outputs (written to --out_dir):
+#   cv_folds.csv     country, model, scheme, fold, n_train, n_test, r2, rmse, mae
+#   cv_summary.csv   country, model, scheme, n_folds, r2_oof (pooled out-of-fold predictions),
+#                    r2_fold_mean, r2_fold_sd, rmse_oof, r2_in_sample, optimism (in-sample - oof)
+#
+# Run:
+#   python scripts/week7_spatial_cv.py \
+#       --panel figures/week6_outputs_geogprahic/tiles_panel_all_countries_2014-2023_WITH_GEO_INFRASTRUCTURE.csv \
+#       --out_dir figures/week7_outputs/cv
+
+import os, argparse, hashlib, time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from spatial_weights import grid_coords
+
+BASELINE_FORMULA = "log_light ~ log_pop * C(region_type)"
+INFRA_FORMULA = ("log_light ~ log_pop * C(region_type) + log_distance_to_urban"
+                 " + log_local_urban_density + centrality_score")
+SCHEMES = ["spatial_block", "loyo", "random"]
+
+MODELS = {}
+
+
+def register_model(name: str, formula: str, estimator: str = "ols", **params):
+    """Add a model to the registry; estimator is 'ols', 'linreg' or 'rf' (params go to sklearn)."""
+    if estimator not in ("ols", "linreg", "rf"):
+        raise ValueError(f"Unknown estimator {estimator!r} for model {name}")
+    MODELS[name] = {"formula": formula, "estimator": estimator, "params": params}
+
+
+register_model("ols_pop_only", "log_light ~ log_pop")
+register_model("ols_baseline", BASELINE_FORMULA)
+register_model("ols_infrastructure", INFRA_FORMULA)
+register_model("linreg_infrastructure", INFRA_FORMULA, "linreg")
+register_model("rf_infrastructure", INFRA_FORMULA, "rf", n_estimators=100, min_samples_leaf=5, max_samples=0.5)
+
+
+# ============================================================================
+# Design matrices (built once) and folds (index arrays)
+# ============================================================================
+
+def formula_key(formula: str) -> str:
+    return hashlib.sha1(formula.encode()).hexdigest()[:12]
+
+
+def build_designs(panel: pd.DataFrame, formulas, cache_dir: str):
+    """
+    One (X, y) per formula on the rows complete for ALL formulas, saved as
+    <cache_dir>/design_<key>.npy (column 0 = y). Returns (kept panel rows, {formula: path}).
+    """
+    import patsy
+
+    mats = {}
+    for f in formulas:
+        y, X = patsy.dmatrices(f, panel, return_type="dataframe", NA_action="drop")
+        mats[f] = (y, X)
+    common = panel.index
+    for y, _ in mats.values():
+        common = common.intersection(y.index)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    paths = {}
+    for f, (y, X) in mats.items():
+        arr = np.column_stack([y.loc[common].to_numpy(float), X.loc[common].to_numpy(float)])
+        paths[f] = os.path.join(cache_dir, f"design_{formula_key(f)}.npy")
+        np.save(paths[f], np.ascontiguousarray(arr))
+    return panel.loc[common].reset_index(drop=True), paths
+
+
+def grid_cells(df: pd.DataFrame):
+    """(grid row, grid col) of every tile from r0/c0 and its country's tile size (see grid_coords)."""
+    gr, gc = np.empty(len(df), dtype=np.int64), np.empty(len(df), dtype=np.int64)
+    for rows in df.groupby("country").indices.values():
+        gr[rows], gc[rows], _ = grid_coords(df.iloc[rows])
+    return gr, gc
+
+
+def spatial_block_folds(df: pd.DataFrame, k: int, block_tiles: int, seed: int, buffer_tiles: int = 0):
+    """[(train_idx, test_idx)] with per-country blocks of block_tiles x block_tiles grid cells dealt to k folds."""
+    gr, gc = grid_cells(df)
+    country = df["country"].to_numpy()
+    block = pd.MultiIndex.from_arrays([country, gr // block_tiles, gc // block_tiles]).factorize()[0]
+    sizes = np.bincount(block)
+    order = np.random.default_rng(seed).permutation(len(sizes))
+    fold_of_block, load = np.empty(len(sizes), dtype=np.int64), np.zeros(k)
+    for b in order[np.argsort(-sizes[order], kind="stable")]:      # largest first, random ties
+        fold_of_block[b] = np.argmin(load)
+        load[fold_of_block[b]] += sizes[b]
+    fold = fold_of_block[block]
+
+    out = []
+    for f in range(k):
+        test = fold == f
+        train = ~test
+        if buffer_tiles > 0:
+            from scipy.ndimage import binary_dilation
+            # grid cells are only comparable within a country: one buffer grid per country
+            for c in np.unique(country[test]):
+                rows = np.flatnonzero(country == c)
+                g_r, g_c = gr[rows], gc[rows]
+                grid = np.zeros((g_r.max() + 1, g_c.max() + 1), dtype=bool)
+                grid[g_r[test[rows]], g_c[test[rows]]] = True
+                near = binary_dilation(grid, np.ones((2 * buffer_tiles + 1,) * 2, dtype=bool))
+                train[rows] &= ~near[g_r, g_c]
+        out.append((np.flatnonzero(train), np.flatnonzero(test)))
+    return out
+
+
+def loyo_folds(df: pd.DataFrame):
+    """[(train_idx, test_idx)] per year; tile_id is stable, so every fold predicts known tiles' new year."""
+    years = df["year"].to_numpy()
+    return [(np.flatnonzero(years != y), np.flatnonzero(years == y)) for y in sorted(np.unique(years))]
+
+
+def random_folds(n: int, k: int, seed: int):
+    fold = np.random.default_rng(seed).permutation(n) % k
+    return [(np.flatnonzero(fold != f), np.flatnonzero(fold == f)) for f in range(k)]
+
+
+# ============================================================================
+# Worker
+# ============================================================================
+
+_DESIGNS = {}
+
+
+def _init_worker(paths):
+    # Memory-mapped: every worker shares the page cache, nothing is pickled per task
+    for f, p in paths.items():
+        _DESIGNS[f] = np.load(p, mmap_mode="r")
+
+
+def fit_predict(model: dict, X_train, y_train, X_test, seed: int = 0):
+    est = model["estimator"]
+    if est == "ols":
+        beta = np.linalg.lstsq(X_train, y_train, rcond=None)[0]       # min-norm if a regime is absent
+        return X_test @ beta
+    if est == "linreg":
+        from sklearn.linear_model import LinearRegression
+        reg = LinearRegression(fit_intercept=False, **model["params"])   # patsy already adds the intercept
+    else:
+        from sklearn.ensemble import RandomForestRegressor
+        # one core per task; parallelism comes from the process pool
+        reg = RandomForestRegressor(random_state=seed, n_jobs=1, **model["params"])
+    return reg.fit(X_train, y_train).predict(X_test)
+
+
+def run_task(task):
+    """
+    Rows are global indexes into the design matrix; returns (key, n_train, test y, predictions),
+    with y from column 0 of this model's own design.
+    """
+    arr = _DESIGNS[task["model"]["formula"]]
+    train, test = task["train"], task["test"]
+    pred = fit_predict(task["model"], arr[train, 1:], arr[train, 0], arr[test, 1:], task["seed"])
+    return task["key"], len(train), np.asarray(arr[test, 0]), pred
+
+
+def r2_score(y, pred):
+    ss = ((y - y.mean()) ** 2).sum()
+    return 1.0 - ((y - pred) ** 2).sum() / ss if ss > 0 else np.nan
+
+
+# ============================================================================
+# Driver
+# ============================================================================
+
+def make_tasks(df, models, schemes, args):
+    groups = [(c, np.flatnonzero(df["country"].to_numpy() == c)) for c in sorted(df["country"].unique())]
+    if args.pooled:
+        groups.append(("ALL", np.arange(len(df))))
+
+    tasks = []
+    for group, rows in groups:
+        sub = df.iloc[rows]
+        for name in models:
+            # in-sample fit = the notebooks' metric, as the reference
+            tasks.append({"key": (group, name, "in_sample", -1), "model": MODELS[name], "seed": args.seed,
+                          "train": rows, "test": rows})
+        for scheme in schemes:
+            if scheme == "spatial_block":
+                folds = spatial_block_folds(sub, args.folds, args.block_tiles, args.seed, args.buffer_tiles)
+            elif scheme == "loyo":
+                folds = loyo_folds(sub)
+            else:
+                folds = random_folds(len(sub), args.folds, args.seed)
+            for name in models:
+                for f, (tr, te) in enumerate(folds):
+                    if len(tr) and len(te):
+                        tasks.append({"key": (group, name, scheme, f), "model": MODELS[name], "seed": args.seed,
+                                      "train": rows[tr], "test": rows[te]})
+    return tasks
+
+
+def summarize(results):
+    fold_rows, oof = [], {}
+    for (group, name, scheme, f), n_train, y, pred in results:
+        fold_rows.append({"country": group, "model": name, "scheme": scheme, "fold": f,
+                          "n_train": n_train, "n_test": len(y), "r2": r2_score(y, pred),
+                          "rmse": float(np.sqrt(np.mean((y - pred) ** 2))), "mae": float(np.mean(np.abs(y - pred)))})
+        oof.setdefault((group, name, scheme), []).append((y, pred))
+    folds = pd.DataFrame(fold_rows).sort_values(["country", "model", "scheme", "fold"], ignore_index=True)
+
+    in_sample = folds[folds["scheme"] == "in_sample"].set_index(["country", "model"])["r2"]
+    rows = []
+    for (group, name, scheme), parts in oof.items():
+        if scheme == "in_sample":
+            continue
+        y = np.concatenate([t for t, _ in parts])
+        pred = np.concatenate([p for _, p in parts])
+        r2f = folds[(folds["country"] == group) & (folds["model"] == name) & (folds["scheme"] == scheme)]["r2"]
+        r2_oof = r2_score(y, pred)
+        rows.append({"country": group, "model": name, "scheme": scheme, "n_folds": len(parts),
+                     "r2_oof": r2_oof, "r2_fold_mean": r2f.mean(), "r2_fold_sd": r2f.std(),
+                     "rmse_oof": float(np.sqrt(np.mean((y - pred) ** 2))),
+                     "r2_in_sample": in_sample.get((group, name), np.nan),
+                     "optimism": in_sample.get((group, name), np.nan) - r2_oof})
+    summary = pd.DataFrame(rows).sort_values(["country", "scheme", "model"], ignore_index=True)
+    return folds[folds["scheme"] != "in_sample"], summary
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--panel", default=os.path.join(
+        "figures", "week6_outputs_geogprahic", "tiles_panel_all_countries_2014-2023_WITH_GEO_INFRASTRUCTURE.csv"))
+    ap.add_argument("--out_dir", default=os.path.join("figures", "week7_outputs", "cv"))
+    ap.add_argument("--models", default=",".join(MODELS), help=f"Comma-separated from: {','.join(MODELS)}")
+    ap.add_argument("--schemes", default=",".join(SCHEMES), help=f"Comma-separated from: {','.join(SCHEMES)}")
+    ap.add_argument("--folds", type=int, default=5, help="Folds for spatial_block and random")
+    ap.add_argument("--block_tiles", type=int, default=4, help="Spatial block edge, in tiles")
+    ap.add_argument("--buffer_tiles", type=int, default=0, help="Drop training tiles this close to the test blocks")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--pooled", action="store_true", help="Also cross-validate one all-country fit (country 'ALL')")
+    ap.add_argument("--workers", type=int, default=None, help="Process pool size (default: all cores)")
+    args = ap.parse_args()
+
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    schemes = [s.strip() for s in args.schemes.split(",") if s.strip()]
+    unknown = [m for m in models if m not in MODELS] + [s for s in schemes if s not in SCHEMES]
+    if unknown:
+        raise ValueError(f"Unknown models/schemes {unknown}. Models: {list(MODELS)}; schemes: {SCHEMES}")
+
+    t0 = time.perf_counter()
+    os.makedirs(args.out_dir, exist_ok=True)
+    panel = pd.read_csv(args.panel)
+    df, paths = build_designs(panel, sorted({MODELS[m]["formula"] for m in models}),
+                              os.path.join(args.out_dir, "cache"))
+    if len(df) < len(panel):
+        print(f"[WARN] {len(panel) - len(df)} rows with missing model variables dropped")
+    tasks = make_tasks(df, models, schemes, args)
+    t1 = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=args.workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=(paths,)) as pool:
+        results = list(pool.map(run_task, tasks, chunksize=max(1, len(tasks) // (4 * (args.workers or os.cpu_count())))))
+    t2 = time.perf_counter()
+
+    folds, summary = summarize(results)
+    folds.to_csv(os.path.join(args.out_dir, "cv_folds.csv"), index=False)
+    summary.to_csv(os.path.join(args.out_dir, "cv_summary.csv"), index=False)
+
+    print(f"{len(df):,} rows, {len(paths)} design matrices ({t1 - t0:.1f}s); "
+          f"{len(tasks)} fits on the pool ({t2 - t1:.1f}s)")
+    print("\nOut-of-fold R² (pooled predictions):")
+    print(summary.pivot_table(index=["country", "model"], columns="scheme", values="r2_oof")
+                 .join(summary.groupby(["country", "model"])["r2_in_sample"].first())
+                 .round(4).to_string())
+    print("\nSaved:", os.path.join(args.out_dir, "cv_summary.csv"))
+
+
+if __name__ == "__main__":
+    main()
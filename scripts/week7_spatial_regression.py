@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# week7_spatial_regression.py
+#
+# Spatial lag (SAR) and spatial error (SEM) versions of the baseline tile model
+#
+#   log_light ~ log_pop * C(region_type)
+#
+# for every country-year, next to plain OLS, using queen (or rook / distance-band) weights on
+# the tile grid (spatial_weights.py) and the concentrated-likelihood estimators in
+# spatial_regression.py. Weights are built once per country and cached; log-determinants use
+# eigenvalues computed once per country-year (sparse LU above DENSE_MAX tiles).
+#
+# Regimes with fewer than --min_regime_tiles tiles in a country-year are dropped before fitting
+# (e.g. the handful of dense_dim tiles in China), since their dummy + interaction would fit
+# those tiles exactly and make the design rank-deficient.
+#
+# Outputs (written to --out_dir):
+#   spatial_models.csv    country, year, model, n, rho (lag / error parameter), rho_se, sigma2, loglik, aic
+#   spatial_impacts.csv   country, year, model, regime, elasticity (+se), direct, indirect, total (+se)
+#
+# Run:
+#   python scripts/week7_spatial_regression.py \
+#       --panel figures/week6_outputs/tiles_panel_all_countries_2014-2023.csv \
+#       --out_dir figures/week7_outputs/spatial_regression
+
+import os, argparse, time
+import numpy as np
+import pandas as pd
+from patsy import dmatrices
+
+from spatial_weights import country_weights, subset_weights
+from spatial_regression import LogDet, fit_ols, fit_sar, fit_sem, regime_slopes, regime_impacts
+
+FORMULA = "log_light ~ log_pop * C(region_type)"
+MODEL_COLS = ["country", "year", "model", "n", "rho", "rho_se", "sigma2", "loglik", "aic"]
+
+
+def fit_country_year(df, Wb, all_ids, models, min_regime_tiles=10, n_draws=1000, seed=0):
+    counts = df["region_type"].value_counts()
+    small = counts[counts < min_regime_tiles].index
+    if len(small):
+        df = df[~df["region_type"].isin(small)]
+
+    y, X = dmatrices(FORMULA, df, return_type="dataframe")
+    df = df.loc[y.index]
+    W = subset_weights(Wb, all_ids, df["tile_id"].to_numpy(dtype=np.int64))
+    regimes = sorted(df["region_type"].unique())
+    L = regime_slopes(X.columns, regimes)
+
+    y, X = y.to_numpy().ravel(), X.to_numpy()
+    logdet = LogDet(W) if {"SAR", "SEM"} & set(models) else None
+    fitters = {"OLS": lambda: fit_ols(y, X), "SAR": lambda: fit_sar(y, X, W, logdet),
+               "SEM": lambda: fit_sem(y, X, W, logdet)}
+
+    key = {"country": df["country"].iat[0], "year": int(df["year"].iat[0])}
+    model_rows, impact_parts = [], []
+    for name in models:
+        fit = fitters[name]()
+        model_rows.append({**key, **{c: fit[c] for c in MODEL_COLS[2:]}})
+        imp = regime_impacts(fit, L, regimes, n_draws=n_draws, seed=seed)
+        imp.insert(0, "model", name)
+        imp.insert(0, "year", key["year"])
+        imp.insert(0, "country", key["country"])
+        impact_parts.append(imp)
+    return model_rows, impact_parts, list(small)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--panel", required=True, help="tiles_panel_all_countries_<start>-<end>.csv")
+    ap.add_argument("--out_dir", default=None, help="Output folder (default: <panel dir>/spatial_regression)")
+    ap.add_argument("--cache_dir", default=None, help="Weights cache (default: <out_dir>/weights)")
+    ap.add_argument("--weights", choices=["queen", "rook", "band"], default="queen")
+    ap.add_argument("--band", type=float, default=1.5, help="Distance band in tile widths (--weights band)")
+    ap.add_argument("--models", default="OLS,SAR,SEM")
+    ap.add_argument("--years", default="", help="Comma-separated years (default: all)")
+    ap.add_argument("--min_regime_tiles", type=int, default=10)
+    ap.add_argument("--draws", type=int, default=1000, help="Simulation draws for impact standard errors")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    models = [m.strip().upper() for m in args.models.split(",") if m.strip()]
+    years = {int(y) for y in args.years.split(",") if y.strip()}
+    out_dir = args.out_dir or os.path.join(os.path.dirname(os.path.abspath(args.panel)), "spatial_regression")
+    cache_dir = args.cache_dir or os.path.join(out_dir, "weights")
+    os.makedirs(out_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    panel = pd.read_csv(args.panel)
+    panel["log_light"] = np.log1p(panel["mean_light"].clip(lower=0))
+    panel["log_pop"] = np.log1p(panel["mean_pop"].clip(lower=0))
+    panel["region_type"] = panel["region_type"].astype(str)
+
+    model_rows, impact_parts = [], []
+    for country, cdf in panel.groupby("country", sort=True):
+        Wb, all_ids = country_weights(cdf, kind=args.weights, band=args.band, cache_dir=cache_dir, country=country)
+        for year, df in cdf.groupby("year", sort=True):
+            if years and year not in years:
+                continue
+            m, imp, dropped = fit_country_year(df.sort_values("tile_id"), Wb, all_ids, models,
+                                               min_regime_tiles=args.min_regime_tiles,
+                                               n_draws=args.draws, seed=args.seed)
+            if dropped:
+                print(f"[WARN] {country} {year}: dropped regimes with < {args.min_regime_tiles} tiles: {dropped}")
+            model_rows += m
+            impact_parts += imp
+        print(f"{country}: done ({time.perf_counter() - t0:.1f}s)")
+
+    fits = pd.DataFrame(model_rows, columns=MODEL_COLS)
+    impacts = pd.concat(impact_parts, ignore_index=True)
+    fits.to_csv(os.path.join(out_dir, "spatial_models.csv"), index=False)
+    impacts.to_csv(os.path.join(out_dir, "spatial_impacts.csv"), index=False)
+
+    print("\nAIC by model:")
+    print(fits.pivot_table(index=["country", "year"], columns="model", values="aic").round(1).to_string())
+    print("Saved:", out_dir)
+
+
+if __name__ == "__main__":
+    main()